@@ -2,42 +2,33 @@
 Emotion Translator Agent for HeartSpeak.
 A LangChain agent that orchestrates the full emotion analysis pipeline.
 """
-import cv2
-import numpy as np
-import base64
-import mediapipe as mp
-from typing import Optional, Dict, Any, List, Tuple
+import asyncio
+import time
+from typing import Optional, Dict, Any, List, Set, Tuple, AsyncIterator, Awaitable, Callable
 from app.chains.emotion_chain import get_emotion_chain
 from app.chains.text_generation_chain import get_text_generation_chain
 from app.memory import get_emotion_memory
+from app.services.frame_preprocessor import get_frame_preprocessor, PreprocessQueueFullError
+from app.services.frame_change_detector import get_frame_change_detector
+from app.services.landmark_classifier import get_landmark_classifier
+from app.services.image_frame import ImageFrame
+from app.services.frame_pacer import get_frame_pacer
+from app.services.session_registry import get_session_registry
+from app.config import settings
 
 
 class EmotionTranslatorAgent:
     """
     Agent that orchestrates the complete emotion translation pipeline:
-    1. MediaPipe preprocessing for face detection
+    1. MediaPipe preprocessing for face detection (in the worker pool)
     2. LangChain emotion analysis chain
     3. LangChain text generation chain
     4. Memory management for context
     """
     
     def __init__(self):
-        # Initialize MediaPipe
-        self.mp_face_mesh = mp.solutions.face_mesh
-        self.mp_face_detection = mp.solutions.face_detection
-        
-        self.face_mesh = self.mp_face_mesh.FaceMesh(
-            static_image_mode=True,
-            max_num_faces=1,
-            refine_landmarks=True,
-            min_detection_confidence=0.5,
-            min_tracking_confidence=0.5
-        )
-        
-        self.face_detection = self.mp_face_detection.FaceDetection(
-            model_selection=1,
-            min_detection_confidence=0.5
-        )
+        # MediaPipe runs in worker processes, one graph per worker
+        self.preprocessor = get_frame_preprocessor()
         
         # Get chains
         self.emotion_chain = get_emotion_chain()
@@ -45,107 +36,212 @@ class EmotionTranslatorAgent:
         
         # Memory
         self.memory = get_emotion_memory()
-    
-    def decode_image(self, image_base64: str) -> np.ndarray:
-        """Decode base64 image to numpy array."""
-        # Remove data URI prefix if present
-        if "," in image_base64:
-            image_base64 = image_base64.split(",")[1]
         
-        # Decode base64
-        image_bytes = base64.b64decode(image_base64)
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        # Near-duplicate frame detection
+        self.change_detector = get_frame_change_detector()
         
-        return image
-    
-    def preprocess_frame(self, image: np.ndarray) -> Tuple[bool, Dict[str, Any]]:
-        """
-        Preprocess frame using MediaPipe for face detection and landmark extraction.
+        # Local fast path before Gemini Vision
+        self.local_classifier = get_landmark_classifier()
         
-        Returns:
-            Tuple of (face_detected: bool, face_info: dict)
-        """
-        # Convert to RGB for MediaPipe
-        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        
-        # Run face detection
-        detection_results = self.face_detection.process(rgb_image)
+        # Client frame interval hints
+        self.pacer = get_frame_pacer()
         
-        if not detection_results.detections:
-            return False, {"error": "No face detected"}
-        
-        # Run face mesh for landmarks
-        mesh_results = self.face_mesh.process(rgb_image)
-        
-        face_info = {
-            "detected": True,
-            "confidence": detection_results.detections[0].score[0] if detection_results.detections else 0,
-        }
+        # Newest in-flight frame per session (latest frame wins)
+        self._latest_frames: Dict[str, asyncio.Task] = {}
         
-        if mesh_results.multi_face_landmarks:
-            landmarks = mesh_results.multi_face_landmarks[0]
-            face_info["metrics"] = self._calculate_face_metrics(landmarks, image.shape)
+        # History clears scheduled by session eviction, referenced until done
+        self._cleanup_tasks: Set[asyncio.Task] = set()
         
-        return True, face_info
+        # Idle and over-capacity sessions are released without an explicit clear
+        self.sessions = get_session_registry()
+        self.sessions.add_eviction_callback(self._evict_session)
     
-    def _calculate_face_metrics(self, landmarks, image_shape: tuple) -> Dict[str, float]:
-        """Calculate facial metrics that indicate emotions."""
-        h, w = image_shape[:2]
-        
-        # Get key points
-        left_eye_top = landmarks.landmark[159]
-        left_eye_bottom = landmarks.landmark[145]
-        right_eye_top = landmarks.landmark[386]
-        right_eye_bottom = landmarks.landmark[374]
+    def decode_image(self, image_base64: str) -> ImageFrame:
+        """Decode base64 image (with or without data URI prefix) to an image frame."""
+        return ImageFrame.from_base64(image_base64)
+    
+    def _classify_locally(self, face_info: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Run the landmark classifier on a preprocessed frame.
         
-        mouth_top = landmarks.landmark[13]
-        mouth_bottom = landmarks.landmark[14]
-        mouth_left = landmarks.landmark[61]
-        mouth_right = landmarks.landmark[291]
+        Returns:
+            Analysis result, or None if the frame should go to Gemini
+        """
+        landmarks = face_info.get("landmarks")
+        if not settings.local_classifier_enabled or landmarks is None:
+            return None
         
-        left_eyebrow = landmarks.landmark[105]
-        right_eyebrow = landmarks.landmark[334]
+        result = self.local_classifier.classify(landmarks)
+        if result["confidence"] < settings.local_classifier_min_confidence:
+            return None
         
-        # Calculate metrics
-        left_eye_openness = abs(left_eye_top.y - left_eye_bottom.y)
-        right_eye_openness = abs(right_eye_top.y - right_eye_bottom.y)
-        mouth_openness = abs(mouth_top.y - mouth_bottom.y)
-        mouth_width = abs(mouth_left.x - mouth_right.x)
-        left_eyebrow_height = abs(left_eyebrow.y - left_eye_top.y)
-        right_eyebrow_height = abs(right_eyebrow.y - right_eye_top.y)
+        return {"success": True, "source": "local", **result}
+    
+    async def _llm_frame(
+        self,
+        frame: ImageFrame,
+        face_box: Optional[Tuple[float, float, float, float]]
+    ) -> ImageFrame:
+        """The downscaled face crop for the vision model, or the original frame."""
+        if not settings.llm_image_downscale_enabled:
+            return frame
+        try:
+            crop = await self.preprocessor.prepare_llm_image(frame.data, face_box)
+        except Exception as e:
+            print(f"Face crop failed, sending the full frame: {e}")
+            return frame
+        return ImageFrame(crop, "image/jpeg")
+    
+    async def _cached_result(
+        self,
+        call_id: Optional[str],
+        user_id: str,
+        face_info: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Build a result from the session's last analyzed frame, if there is one."""
+        last_entry = await self.memory.get_last_emotion(call_id, user_id) if call_id else None
+        if not last_entry:
+            return None
         
         return {
-            "eyeOpenness": (left_eye_openness + right_eye_openness) / 2,
-            "mouthOpenness": mouth_openness,
-            "mouthWidth": mouth_width,
-            "eyebrowHeight": (left_eyebrow_height + right_eyebrow_height) / 2,
-            "mouthAspectRatio": mouth_openness / mouth_width if mouth_width > 0 else 0
+            "success": True,
+            "emotions": last_entry["emotions"],
+            "dominantEmotion": last_entry["dominant"],
+            "confidence": last_entry["confidence"],
+            "intensity": last_entry.get("intensity", 0.5),
+            "nuances": last_entry.get("nuances", {}),
+            "generatedText": last_entry.get("text", ""),
+            "faceDetected": True,
+            "faceMetrics": (face_info or {}).get("metrics", {}),
+            "cached": True
         }
     
+    async def _expects_cached_text(
+        self,
+        call_id: Optional[str],
+        user_id: str,
+        context: Optional[str],
+        previous_emotions: Optional[List[str]]
+    ) -> bool:
+        """
+        Whether the text cache holds phrasings for the session's last expression.
+        Expressions usually hold across frames, so the message can then come
+        from the cache and only the analysis needs the vision call.
+        """
+        last_result = await self._cached_result(call_id, user_id)
+        return last_result is not None and self.text_chain.has_cached_text(
+            last_result, context, previous_emotions
+        )
+    
+    async def _stale_result(self, call_id: Optional[str], user_id: str, **flags: bool) -> Dict[str, Any]:
+        """Result for a frame that was superseded or missed its deadline."""
+        result = await self._cached_result(call_id, user_id)
+        if result is None:
+            result = {
+                "success": False,
+                "emotions": ["unknown"],
+                "dominantEmotion": "unknown",
+                "confidence": 0,
+                "intensity": 0.5,
+                "generatedText": "Still analyzing. Trying again shortly."
+            }
+        result.update(flags)
+        return result
+    
+    def _forget_frame(self, session_id: str, task: asyncio.Task) -> None:
+        """Drop a finished frame unless a newer one already replaced it."""
+        if self._latest_frames.get(session_id) is task:
+            del self._latest_frames[session_id]
+    
     async def translate(
         self,
-        image_base64: str,
+        image_base64: Optional[str],
         user_id: str,
         call_id: Optional[str] = None,
-        context: Optional[str] = None
+        context: Optional[str] = None,
+        pipeline_mode: Optional[str] = None,
+        frame: Optional[ImageFrame] = None,
+        deadline_ms: Optional[int] = None
     ) -> Dict[str, Any]:
         """
         Full emotion translation pipeline.
         
+        Within a call, a newer frame from the same user cancels the older
+        frame's pipeline wherever it is (preprocessing, waiting for an LLM slot
+        or mid-request); the older request then gets the last analyzed result.
+        
         Args:
             image_base64: Base64 encoded image
             user_id: ID of the user being analyzed
             call_id: Optional call session ID
             context: Optional conversation context
+            pipeline_mode: "combined" or "two_call" (defaults to settings)
+            frame: Already decoded image, used instead of image_base64 when given
+            deadline_ms: Optional time budget; past it the last analyzed result is
+                returned while this frame keeps running to refresh memory
             
         Returns:
-            Complete emotion translation with generated text
+            Complete emotion translation with generated text and a
+            nextFrameAfterMs pacing hint for the client
+        """
+        session_id = f"{call_id}:{user_id}" if call_id else None
+        task = asyncio.ensure_future(self._run_pipeline(
+            image_base64, user_id, call_id, context, pipeline_mode, frame
+        ))
+        if session_id:
+            previous = self._latest_frames.get(session_id)
+            if previous is not None and not previous.done():
+                previous.cancel()
+            self._latest_frames[session_id] = task
+            task.add_done_callback(lambda done: self._forget_frame(session_id, done))
+        
+        try:
+            # Shielded so the deadline only stops waiting, not the pipeline
+            if deadline_ms is not None:
+                result = await asyncio.wait_for(asyncio.shield(task), deadline_ms / 1000)
+            else:
+                result = await asyncio.shield(task)
+        except asyncio.TimeoutError:
+            result = await self._stale_result(call_id, user_id, deadlineExceeded=True)
+        except asyncio.CancelledError:
+            if not task.cancelled():
+                # The request itself was cancelled
+                task.cancel()
+                raise
+            result = await self._stale_result(call_id, user_id, superseded=True)
+        
+        result["nextFrameAfterMs"] = await self.pacer.next_frame_after_ms(
+            call_id,
+            user_id,
+            queue_depth=self.preprocessor.pending,
+            queue_capacity=self.preprocessor.max_pending
+        )
+        return result
+    
+    async def _run_pipeline(
+        self,
+        image_base64: Optional[str],
+        user_id: str,
+        call_id: Optional[str],
+        context: Optional[str],
+        pipeline_mode: Optional[str],
+        frame: Optional[ImageFrame],
+        emit: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Run preprocessing, analysis, text generation and memory updates for one frame.
+        When emit is given, it receives an "analysis" event once emotions are known
+        and a "token" event per generated text chunk.
         """
         try:
-            # Step 1: Decode and preprocess image
-            image = self.decode_image(image_base64)
-            face_detected, face_info = self.preprocess_frame(image)
+            # Step 1: Decode and preprocess image off the event loop
+            if frame is None:
+                frame = self.decode_image(image_base64)
+            session_id = f"{call_id}:{user_id}" if call_id else None
+            if call_id:
+                self.sessions.touch(call_id, user_id)
+            face_detected, face_info = await self.preprocessor.preprocess(frame.data, session_id)
+            face_box = face_info.pop("face_box", None)
             
             if not face_detected:
                 return {
@@ -158,23 +254,58 @@ class EmotionTranslatorAgent:
                     "faceDetected": False
                 }
             
+            # Reuse the last result if the face hasn't meaningfully changed
+            if session_id and self.change_detector.is_unchanged(session_id, face_info):
+                cached_result = await self._cached_result(call_id, user_id, face_info)
+                if cached_result:
+                    return cached_result
+            
             # Step 2: Get previous emotions for context
             previous_emotions = None
             if call_id:
-                previous_emotions = self.memory.get_recent_emotions(
+                previous_emotions = await self.memory.get_recent_emotions(
                     call_id=call_id,
                     user_id=user_id,
                     limit=5
                 )
             
-            # Step 3: Analyze emotions with LangChain chain
-            session_id = f"{call_id}:{user_id}" if call_id else None
-            emotion_result = await self.emotion_chain.analyze(
-                image_base64=image_base64,
-                context=context,
-                session_id=session_id,
-                previous_emotions=previous_emotions
-            )
+            # Step 3: Classify locally, escalating to the LangChain chain when unsure
+            pipeline_mode = pipeline_mode or settings.emotion_pipeline_mode
+            if emit is not None:
+                # The combined call returns JSON, so its text can't be streamed
+                pipeline_mode = "two_call"
+            emotion_result = self._classify_locally(face_info)
+            if emotion_result is not None:
+                if session_id:
+                    await self.emotion_chain.record(session_id, emotion_result)
+            elif pipeline_mode == "combined" and not await self._expects_cached_text(
+                call_id, user_id, context, previous_emotions
+            ):
+                # Analysis and partner message in one round trip
+                llm_frame = await self._llm_frame(frame, face_box)
+                llm_started = time.perf_counter()
+                emotion_result = await self.emotion_chain.analyze_and_describe(
+                    image_base64=llm_frame,
+                    context=context,
+                    session_id=session_id,
+                    previous_emotions=previous_emotions,
+                    recent_texts=await self.text_chain.get_recent_texts(session_id) if session_id else None
+                )
+                self.pacer.record_llm_latency(time.perf_counter() - llm_started)
+                emotion_result["source"] = "gemini"
+            else:
+                # Two-call mode, or a recurring expression whose message the
+                # text cache can serve without generating it
+                llm_frame = await self._llm_frame(frame, face_box)
+                llm_started = time.perf_counter()
+                emotion_result = await self.emotion_chain.analyze(
+                    image_base64=llm_frame,
+                    context=context,
+                    session_id=session_id,
+                    previous_emotions=previous_emotions
+                )
+                self.pacer.record_llm_latency(time.perf_counter() - llm_started)
+                emotion_result["source"] = "gemini"
             
             if not emotion_result.get("success"):
                 return {
@@ -188,26 +319,60 @@ class EmotionTranslatorAgent:
                     "faceMetrics": face_info.get("metrics", {})
                 }
             
-            # Step 4: Generate natural language text
-            generated_text = await self.text_chain.generate(
-                emotion_data=emotion_result,
-                context=context,
-                previous_emotions=previous_emotions,
-                session_id=session_id
-            )
+            if emit is not None:
+                await emit({
+                    "type": "analysis",
+                    "emotions": emotion_result["emotions"],
+                    "dominantEmotion": emotion_result["dominantEmotion"],
+                    "confidence": emotion_result["confidence"],
+                    "intensity": emotion_result["intensity"],
+                    "nuances": emotion_result.get("nuances", {}),
+                    "analysisSource": emotion_result["source"]
+                })
+            
+            # Step 4: Generate natural language text, unless the combined call already did
+            generated_text = emotion_result.pop("generatedText", "")
+            if generated_text:
+                if session_id:
+                    await self.text_chain.remember(session_id, generated_text)
+                self.text_chain.cache_text(emotion_result, generated_text, context, previous_emotions)
+            elif emit is not None:
+                llm_started = time.perf_counter()
+                async for chunk in self.text_chain.astream(
+                    emotion_data=emotion_result,
+                    context=context,
+                    previous_emotions=previous_emotions,
+                    session_id=session_id
+                ):
+                    generated_text += chunk
+                    await emit({"type": "token", "text": chunk, "generatedText": generated_text})
+                self.pacer.record_llm_latency(time.perf_counter() - llm_started)
+                generated_text = generated_text.strip().strip('"').strip("'")
+            else:
+                llm_started = time.perf_counter()
+                generated_text = await self.text_chain.generate(
+                    emotion_data=emotion_result,
+                    context=context,
+                    previous_emotions=previous_emotions,
+                    session_id=session_id
+                )
+                self.pacer.record_llm_latency(time.perf_counter() - llm_started)
             
             # Step 5: Store in memory
             if call_id:
-                self.memory.add_emotion(
+                await self.memory.add_emotion(
                     call_id=call_id,
                     user_id=user_id,
                     emotion_data={
                         "emotions": emotion_result["emotions"],
                         "dominant": emotion_result["dominantEmotion"],
                         "confidence": emotion_result["confidence"],
+                        "intensity": emotion_result["intensity"],
+                        "nuances": emotion_result.get("nuances", {}),
                         "text": generated_text
                     }
                 )
+                self.change_detector.update(session_id, face_info)
             
             return {
                 "success": True,
@@ -218,9 +383,21 @@ class EmotionTranslatorAgent:
                 "nuances": emotion_result.get("nuances", {}),
                 "generatedText": generated_text,
                 "faceDetected": True,
-                "faceMetrics": face_info.get("metrics", {})
+                "faceMetrics": face_info.get("metrics", {}),
+                "analysisSource": emotion_result["source"]
             }
             
+        except PreprocessQueueFullError as e:
+            print(f"Emotion translation skipped: {e}")
+            return {
+                "success": False,
+                "emotions": ["unknown"],
+                "dominantEmotion": "unknown",
+                "confidence": 0,
+                "intensity": 0.5,
+                "generatedText": "Emotion analysis is busy. Trying again shortly.",
+                "error": str(e)
+            }
         except Exception as e:
             print(f"Emotion translation error: {e}")
             return {
@@ -233,28 +410,120 @@ class EmotionTranslatorAgent:
                 "error": str(e)
             }
     
-    def get_emotion_summary(
+    async def translate_stream(
+        self,
+        image_base64: Optional[str],
+        user_id: str,
+        call_id: Optional[str] = None,
+        context: Optional[str] = None,
+        frame: Optional[ImageFrame] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Emotion translation pipeline that streams the generated text.
+        
+        Args:
+            image_base64: Base64 encoded image
+            user_id: ID of the user being analyzed
+            call_id: Optional call session ID
+            context: Optional conversation context
+            frame: Already decoded image, used instead of image_base64 when given
+            
+        Yields:
+            An "analysis" event with the detected emotions, "token" events with each
+            text chunk and the generatedText so far, then a "final" event with the
+            complete result (the only event for cached or failed frames)
+        """
+        events: asyncio.Queue = asyncio.Queue()
+        
+        async def emit(event: Dict[str, Any]) -> None:
+            await events.put(event)
+        
+        async def run() -> None:
+            try:
+                result = await self._run_pipeline(
+                    image_base64, user_id, call_id, context, None, frame, emit=emit
+                )
+                result["nextFrameAfterMs"] = await self.pacer.next_frame_after_ms(
+                    call_id,
+                    user_id,
+                    queue_depth=self.preprocessor.pending,
+                    queue_capacity=self.preprocessor.max_pending
+                )
+            except Exception as e:
+                print(f"Emotion stream error: {e}")
+                result = {
+                    "success": False,
+                    "emotions": ["unknown"],
+                    "dominantEmotion": "unknown",
+                    "confidence": 0,
+                    "intensity": 0.5,
+                    "generatedText": "Unable to process emotion at this moment.",
+                    "error": str(e)
+                }
+            await events.put({"type": "final", **result})
+        
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                event = await events.get()
+                yield event
+                if event["type"] == "final":
+                    break
+        finally:
+            # Stop generating if the caller went away
+            if not task.done():
+                task.cancel()
+    
+    async def get_emotion_summary(
         self,
         call_id: str,
         user_id: str
     ) -> Optional[str]:
         """Get emotion summary for a call."""
-        return self.memory.get_emotion_summary(call_id, user_id)
+        return await self.memory.get_emotion_summary(call_id, user_id)
     
-    def get_emotion_transitions(
+    async def get_emotion_transitions(
         self,
         call_id: str,
         user_id: str
     ) -> List[Dict[str, str]]:
         """Get emotional transitions during a call."""
-        return self.memory.get_emotional_transitions(call_id, user_id)
+        return await self.memory.get_emotional_transitions(call_id, user_id)
     
-    def clear_session(self, call_id: str, user_id: str) -> None:
-        """Clear all memory for a session."""
+    def _release_session_state(self, call_id: str, user_id: str) -> None:
+        """Release a session's in-process state: in-flight frame, change detector and tracker."""
         session_id = f"{call_id}:{user_id}"
-        self.emotion_chain.clear_session(session_id)
-        self.text_chain.clear_session(session_id)
-        self.memory.clear_call(call_id)
+        in_flight = self._latest_frames.pop(session_id, None)
+        if in_flight is not None:
+            in_flight.cancel()
+        self.change_detector.clear_session(session_id)
+        self.preprocessor.release_session(session_id)
+    
+    async def _clear_session_history(self, call_id: str, user_id: str, clear_call: bool) -> None:
+        """Clear the chains' session history and, if asked, the call's emotion history."""
+        session_id = f"{call_id}:{user_id}"
+        await self.emotion_chain.clear_session(session_id)
+        await self.text_chain.clear_session(session_id)
+        if clear_call:
+            await self.memory.clear_call(call_id)
+    
+    def _evict_session(self, call_id: str, user_id: str, call_ended: bool) -> None:
+        """Session registry callback for idle or least recently used sessions."""
+        self._release_session_state(call_id, user_id)
+        # Shared backends expire their keys themselves (MEMORY_TTL_SECONDS),
+        # and other workers may still be using the session's history
+        if not self.memory.backend.shared:
+            task = asyncio.get_running_loop().create_task(
+                self._clear_session_history(call_id, user_id, clear_call=call_ended)
+            )
+            self._cleanup_tasks.add(task)
+            task.add_done_callback(self._cleanup_tasks.discard)
+    
+    async def clear_session(self, call_id: str, user_id: str) -> None:
+        """Clear all memory for a session."""
+        self.sessions.remove(call_id, user_id)
+        self._release_session_state(call_id, user_id)
+        await self._clear_session_history(call_id, user_id, clear_call=True)
 
 
 # Singleton instance
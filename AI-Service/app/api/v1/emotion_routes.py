@@ -2,11 +2,16 @@
 Emotion Analysis API Routes for HeartSpeak.
 Uses LangChain-powered emotion translator agent.
 """
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+import asyncio
+import json
+import struct
+from fastapi import APIRouter, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, PositiveInt, ValidationError
+from typing import List, Optional, Dict, Any, Literal, Tuple, Union
 from app.agents.emotion_translator import get_emotion_translator
 from app.memory import get_emotion_memory
+from app.services.image_frame import ImageFrame
 
 router = APIRouter()
 
@@ -17,6 +22,8 @@ class EmotionAnalysisRequest(BaseModel):
     userId: str
     callId: Optional[str] = None
     context: Optional[str] = None
+    pipelineMode: Optional[Literal["combined", "two_call"]] = None  # Defaults to EMOTION_PIPELINE_MODE
+    deadlineMs: Optional[int] = None  # Past this, return the last analyzed result instead of waiting
 
 
 class EmotionAnalysisResponse(BaseModel):
@@ -30,13 +37,20 @@ class EmotionAnalysisResponse(BaseModel):
     faceDetected: Optional[bool] = True
     nuances: Optional[Dict[str, Any]] = None
     faceMetrics: Optional[Dict[str, float]] = None
+    cached: Optional[bool] = False  # True when reused from the last analyzed frame
+    analysisSource: Optional[str] = None  # "local" landmark classifier or "gemini"
+    nextFrameAfterMs: Optional[int] = None  # Suggested delay before the next frame of this session
+    superseded: Optional[bool] = False  # A newer frame of this session replaced this one
+    deadlineExceeded: Optional[bool] = False  # deadlineMs passed before analysis finished
 
 
 class EmotionHistoryRequest(BaseModel):
     """Request model for emotion history."""
     callId: str
-    userId: str
-    limit: Optional[int] = 10
+    userId: Optional[str] = None  # Omit for the call-wide timeline of every user
+    limit: Optional[int] = 10  # null for the whole history
+    since: Optional[float] = None  # Only entries newer than this epoch time
+    before: Optional[float] = None  # Only entries older than this epoch time (nextBefore of the previous page)
 
 
 class EmotionHistoryResponse(BaseModel):
@@ -44,6 +58,7 @@ class EmotionHistoryResponse(BaseModel):
     emotions: List[Dict[str, Any]]
     summary: Optional[str] = None
     transitions: Optional[List[Dict[str, str]]] = None
+    nextBefore: Optional[float] = None  # Cursor for the next (older) page, when the page was full
 
 
 class EmotionSummaryRequest(BaseModel):
@@ -60,6 +75,26 @@ class EmotionSummaryResponse(BaseModel):
     transitions: List[Dict[str, str]] = []
 
 
+def _build_analysis_response(result: Dict[str, Any]) -> EmotionAnalysisResponse:
+    """Convert a translator result into the analysis response model."""
+    return EmotionAnalysisResponse(
+        success=result.get("success", False),
+        emotions=result.get("emotions", ["unknown"]),
+        dominantEmotion=result.get("dominantEmotion", "unknown"),
+        confidence=result.get("confidence", 0),
+        intensity=result.get("intensity", 0.5),
+        generatedText=result.get("generatedText", "Unable to analyze emotions."),
+        faceDetected=result.get("faceDetected", False),
+        nuances=result.get("nuances"),
+        faceMetrics=result.get("faceMetrics"),
+        cached=result.get("cached", False),
+        analysisSource=result.get("analysisSource"),
+        nextFrameAfterMs=result.get("nextFrameAfterMs"),
+        superseded=result.get("superseded", False),
+        deadlineExceeded=result.get("deadlineExceeded", False)
+    )
+
+
 @router.post("/analyze", response_model=EmotionAnalysisResponse)
 async def analyze_emotion(request: EmotionAnalysisRequest):
     """
@@ -69,6 +104,7 @@ async def analyze_emotion(request: EmotionAnalysisRequest):
     1. Preprocesses with MediaPipe for face detection
     2. Analyzes emotions with Gemini Vision via LangChain
     3. Generates natural language text with context awareness
+       (in the same LLM call when pipelineMode is "combined")
     4. Maintains session memory for continuity
     """
     try:
@@ -80,22 +116,14 @@ async def analyze_emotion(request: EmotionAnalysisRequest):
             image_base64=request.image,
             user_id=request.userId,
             call_id=request.callId,
-            context=request.context
+            context=request.context,
+            pipeline_mode=request.pipelineMode,
+            deadline_ms=request.deadlineMs
         )
         
         print(f"[Emotion] Result: success={result.get('success')}, emotion={result.get('dominantEmotion')}")
         
-        return EmotionAnalysisResponse(
-            success=result.get("success", False),
-            emotions=result.get("emotions", ["unknown"]),
-            dominantEmotion=result.get("dominantEmotion", "unknown"),
-            confidence=result.get("confidence", 0),
-            intensity=result.get("intensity", 0.5),
-            generatedText=result.get("generatedText", "Unable to analyze emotions."),
-            faceDetected=result.get("faceDetected", False),
-            nuances=result.get("nuances"),
-            faceMetrics=result.get("faceMetrics")
-        )
+        return _build_analysis_response(result)
         
     except Exception as e:
         import traceback
@@ -107,40 +135,131 @@ async def analyze_emotion(request: EmotionAnalysisRequest):
         )
 
 
+@router.post("/analyze/raw", response_model=EmotionAnalysisResponse)
+async def analyze_emotion_raw(
+    request: Request,
+    userId: str,
+    callId: Optional[str] = None,
+    context: Optional[str] = None,
+    pipelineMode: Optional[Literal["combined", "two_call"]] = None,
+    deadlineMs: Optional[int] = None
+):
+    """
+    Same as /analyze, but the body is the raw encoded image
+    (application/octet-stream or image/jpeg) and the other fields are query parameters.
+    Skips base64 and JSON parsing of the frame entirely.
+    """
+    try:
+        body = await request.body()
+        if not body:
+            raise HTTPException(status_code=400, detail="Request body is empty")
+        
+        content_type = request.headers.get("content-type", "")
+        mime_type = content_type if content_type.startswith("image/") else "image/jpeg"
+        
+        translator = get_emotion_translator()
+        
+        result = await translator.translate(
+            image_base64=None,
+            frame=ImageFrame(body, mime_type),
+            user_id=userId,
+            call_id=callId,
+            context=context,
+            pipeline_mode=pipelineMode,
+            deadline_ms=deadlineMs
+        )
+        
+        return _build_analysis_response(result)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[Emotion] ERROR: {str(e)}")
+        raise HTTPException(
+            status_code=500, 
+            detail=f"Emotion analysis failed: {str(e)}"
+        )
+
+
+def _format_sse(event: Dict[str, Any]) -> str:
+    """Encode one pipeline event as a server-sent event."""
+    if event["type"] == "final":
+        data = {"type": "final", **_build_analysis_response(event).model_dump()}
+    else:
+        data = event
+    return f"event: {event['type']}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/analyze/stream")
+async def analyze_emotion_stream(request: EmotionAnalysisRequest):
+    """
+    Same as /analyze, streamed as server-sent events so the receiver sees the
+    first words of the generated text as soon as they are produced.
+    
+    Events:
+    - analysis: detected emotions, before any text is generated
+    - token: one text chunk ("text") and the generatedText so far
+    - final: the complete EmotionAnalysisResponse
+    """
+    translator = get_emotion_translator()
+    
+    async def event_stream():
+        async for event in translator.translate_stream(
+            image_base64=request.image,
+            user_id=request.userId,
+            call_id=request.callId,
+            context=request.context
+        ):
+            yield _format_sse(event)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.post("/history", response_model=EmotionHistoryResponse)
 async def get_emotion_history(request: EmotionHistoryRequest):
     """
-    Get emotion history for a call session.
-    Includes summary and emotional transitions if enough data exists.
+    Get emotion history for a call session, newest `limit` entries oldest first.
+    Without userId, every user's entries are merged into one timeline.
+    Includes summary and emotional transitions (per user) if enough data exists.
+    Pass nextBefore back as `before` to page through older entries.
     """
     try:
         memory = get_emotion_memory()
         translator = get_emotion_translator()
         
-        emotions = memory.get_call_emotions(
+        emotions = await memory.get_call_emotions(
             call_id=request.callId,
             user_id=request.userId,
-            limit=request.limit
+            limit=request.limit,
+            since=request.since,
+            before=request.before
         )
         
         # Generate summary if enough emotions
         summary = None
         transitions = None
         
-        if len(emotions) >= 3:
-            summary = translator.get_emotion_summary(
+        if request.userId and len(emotions) >= 3:
+            summary = await translator.get_emotion_summary(
                 request.callId, 
                 request.userId
             )
-            transitions = translator.get_emotion_transitions(
+            transitions = await translator.get_emotion_transitions(
                 request.callId,
                 request.userId
             )
         
+        full_page = request.limit and len(emotions) == request.limit
+        
         return EmotionHistoryResponse(
             emotions=emotions,
             summary=summary,
-            transitions=transitions
+            transitions=transitions,
+            nextBefore=emotions[0]["ts"] if full_page else None
         )
         
     except Exception as e:
@@ -159,36 +278,19 @@ async def get_call_summary(request: EmotionSummaryRequest):
         memory = get_emotion_memory()
         translator = get_emotion_translator()
         
-        # Get all emotions
-        emotions = memory.get_call_emotions(
-            call_id=request.callId,
-            user_id=request.userId,
-            limit=50
-        )
-        
-        # Count emotions
-        emotion_counts: Dict[str, int] = {}
-        for e in emotions:
-            dominant = e.get("dominant", "unknown")
-            emotion_counts[dominant] = emotion_counts.get(dominant, 0) + 1
-        
-        # Sort by frequency
-        sorted_emotions = sorted(
-            emotion_counts.items(), 
-            key=lambda x: x[1], 
-            reverse=True
-        )
+        # Running counts, most frequent first
+        sorted_emotions = await memory.get_emotion_counts(request.callId, request.userId)
         
         dominant_emotions = [e[0] for e in sorted_emotions[:5]]
         
         # Get summary and transitions
-        summary = translator.get_emotion_summary(request.callId, request.userId)
-        transitions = translator.get_emotion_transitions(request.callId, request.userId)
+        summary = await translator.get_emotion_summary(request.callId, request.userId)
+        transitions = await translator.get_emotion_transitions(request.callId, request.userId)
         
         return EmotionSummaryResponse(
             summary=summary,
             dominantEmotions=dominant_emotions,
-            totalAnalyzed=len(emotions),
+            totalAnalyzed=sum(count for _, count in sorted_emotions),
             transitions=transitions
         )
         
@@ -207,7 +309,7 @@ async def clear_session(call_id: str, user_id: str):
     """
     try:
         translator = get_emotion_translator()
-        translator.clear_session(call_id, user_id)
+        await translator.clear_session(call_id, user_id)
         
         return {"success": True, "message": "Session cleared"}
         
@@ -216,3 +318,149 @@ async def clear_session(call_id: str, user_id: str):
             status_code=500,
             detail=f"Failed to clear session: {str(e)}"
         )
+
+
+# ============ Streaming ============
+
+class StreamFrameHeader(BaseModel):
+    """JSON header of a binary stream frame."""
+    userId: str = Field(min_length=1)
+    callId: Optional[str] = None
+    frameId: Optional[Union[int, str]] = None  # Echoed back with the result
+    context: Optional[str] = None
+    pipelineMode: Optional[Literal["combined", "two_call"]] = None
+    deadlineMs: Optional[PositiveInt] = None
+
+
+class FrameStreamSession:
+    """
+    Latest-frame-wins slot for one callId/userId on a stream connection.
+    A frame that arrives while the previous one is still waiting replaces it.
+    """
+    
+    def __init__(self):
+        self.pending: Optional[Tuple[StreamFrameHeader, bytes]] = None
+        self.worker: Optional[asyncio.Task] = None
+        self.dropped = 0
+
+
+def _parse_stream_frame(data: bytes) -> Tuple[StreamFrameHeader, bytes]:
+    """
+    Split a binary stream message into its JSON header and JPEG payload.
+    Layout: 4-byte big-endian header length, UTF-8 JSON header (see
+    StreamFrameHeader), image bytes.
+    
+    Raises:
+        ValueError: If the frame is truncated or the header is not valid JSON
+        ValidationError: If the header does not match StreamFrameHeader
+    """
+    if len(data) < 4:
+        raise ValueError("Frame too short")
+    
+    (header_length,) = struct.unpack(">I", data[:4])
+    if len(data) < 4 + header_length:
+        raise ValueError("Frame shorter than its header length")
+    
+    header = json.loads(data[4:4 + header_length].decode("utf-8"))
+    return StreamFrameHeader.model_validate(header), data[4 + header_length:]
+
+
+def _describe_frame_error(error: Exception) -> str:
+    """One-line description of a frame parsing error for the client."""
+    if isinstance(error, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(part) for part in e['loc']) or 'header'}: {e['msg']}"
+            for e in error.errors()
+        )
+    return str(error)
+
+
+@router.websocket("/stream")
+async def stream_emotions(websocket: WebSocket):
+    """
+    Continuous frame analysis over a WebSocket.
+    
+    Each binary message is a frame tagged with callId/userId (see
+    _parse_stream_frame). Results are pushed back as JSON text messages as
+    they complete. While a frame is being analyzed for a callId/userId, only
+    the newest incoming frame is kept; older waiting frames are dropped.
+    """
+    await websocket.accept()
+    
+    translator = get_emotion_translator()
+    sessions: Dict[Tuple[Optional[str], str], FrameStreamSession] = {}
+    send_lock = asyncio.Lock()
+    
+    async def send(message: Dict[str, Any]) -> None:
+        async with send_lock:
+            await websocket.send_json(message)
+    
+    async def drain(session: FrameStreamSession) -> None:
+        while session.pending is not None:
+            header, image_bytes = session.pending
+            session.pending = None
+            
+            # One failed frame is reported and skipped; the session keeps draining
+            try:
+                result = await translator.translate(
+                    image_base64=None,
+                    frame=ImageFrame(image_bytes),
+                    user_id=header.userId,
+                    call_id=header.callId,
+                    context=header.context,
+                    pipeline_mode=header.pipelineMode,
+                    deadline_ms=header.deadlineMs
+                )
+                message = {
+                    "type": "result",
+                    "callId": header.callId,
+                    "userId": header.userId,
+                    "frameId": header.frameId,
+                    "droppedFrames": session.dropped,
+                    **_build_analysis_response(result).model_dump()
+                }
+            except Exception as e:
+                print(f"Stream frame error: {e}")
+                message = {
+                    "type": "error",
+                    "callId": header.callId,
+                    "userId": header.userId,
+                    "frameId": header.frameId,
+                    "error": f"Frame analysis failed: {e}"
+                }
+            
+            await send(message)
+    
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            
+            data = message.get("bytes")
+            if data is None:
+                continue
+            
+            try:
+                header, image_bytes = _parse_stream_frame(data)
+            except (ValueError, ValidationError) as e:
+                # Also covers bad JSON and UTF-8 (both ValueErrors)
+                await send({"type": "error", "error": f"Invalid frame: {_describe_frame_error(e)}"})
+                continue
+            
+            key = (header.callId, header.userId)
+            session = sessions.setdefault(key, FrameStreamSession())
+            
+            if session.pending is not None:
+                session.dropped += 1
+            session.pending = (header, image_bytes)
+            
+            if session.worker is None or session.worker.done():
+                session.worker = asyncio.create_task(drain(session))
+    
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for session in sessions.values():
+            if session.worker is not None:
+                session.worker.cancel()
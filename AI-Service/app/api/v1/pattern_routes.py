@@ -2,10 +2,18 @@
 Pattern Analysis API Routes for HeartSpeak.
 Handles pattern analysis, feature extraction, and interpretation using LangChain + Gemini Vision.
 """
-from fastapi import APIRouter, HTTPException
+import asyncio
+import json
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from app.chains.pattern_analysis_chain import get_pattern_chain
+from app.services.image_frame import ImageFrame
+from app.services.llm_scheduler import LLMPriority
+from app.services.pattern_cache import content_hash
+from app.services.pattern_index import get_pattern_index_store, pattern_embedding
+from app.config import settings
 
 router = APIRouter()
 
@@ -67,7 +75,8 @@ class PatternMatchRequest(BaseModel):
     image: str  # Base64 encoded image of received pattern
     senderId: str
     recipientId: str
-    libraryPatterns: List[Dict[str, Any]]  # Sender's pattern library
+    libraryPatterns: Optional[List[Dict[str, Any]]] = None  # Sender's full library; replaces the index when sent
+    limit: Optional[int] = 5
 
 
 class PatternMatchResponse(BaseModel):
@@ -80,8 +89,60 @@ class PatternMatchResponse(BaseModel):
     error: Optional[str] = None
 
 
+class PatternLibraryRequest(BaseModel):
+    """Patterns to add to or update in a user's server-side library index."""
+    patterns: List[Dict[str, Any]]
+
+
+class PatternLibraryResponse(BaseModel):
+    """Size of a user's library index after an update."""
+    success: bool
+    userId: str
+    patternCount: int
+
+
 # ============ API Endpoints ============
 
+def _build_analysis_response(result: Dict[str, Any]) -> PatternAnalysisResponse:
+    """Convert a pattern chain result into the analysis response model."""
+    if not result.get("success", False):
+        return PatternAnalysisResponse(
+            success=False,
+            features=PatternFeatures(
+                shapeType="unknown",
+                colorMood="unknown",
+                lineQuality="unknown",
+                density=0.5,
+                symmetry=0.5
+            ),
+            suggestedEmotion="neutral",
+            suggestedIntensity=0.5,
+            interpretation="Unable to analyze pattern",
+            suggestedTags=[],
+            error=result.get("error", "Analysis failed")
+        )
+    
+    features = result.get("features", {})
+    
+    return PatternAnalysisResponse(
+        success=True,
+        features=PatternFeatures(
+            shapeType=features.get("shapeType", "organic"),
+            colorMood=features.get("colorMood", "muted"),
+            lineQuality=features.get("lineQuality", "smooth"),
+            density=features.get("density", 0.5),
+            symmetry=features.get("symmetry", 0.5),
+            dominantColors=features.get("dominantColors", []),
+            movement=features.get("movement", "static"),
+            complexity=features.get("complexity", "moderate")
+        ),
+        suggestedEmotion=result.get("suggestedEmotion", "calm"),
+        suggestedIntensity=result.get("suggestedIntensity", 0.5),
+        interpretation=result.get("interpretation", ""),
+        suggestedTags=result.get("suggestedTags", [])
+    )
+
+
 @router.post("/analyze", response_model=PatternAnalysisResponse)
 async def analyze_pattern(request: PatternAnalysisRequest):
     """
@@ -97,49 +158,164 @@ async def analyze_pattern(request: PatternAnalysisRequest):
     try:
         chain = get_pattern_chain()
         result = await chain.analyze(request.image)
+        return _build_analysis_response(result)
         
-        if not result.get("success", False):
-            return PatternAnalysisResponse(
-                success=False,
-                features=PatternFeatures(
-                    shapeType="unknown",
-                    colorMood="unknown",
-                    lineQuality="unknown",
-                    density=0.5,
-                    symmetry=0.5
-                ),
-                suggestedEmotion="neutral",
-                suggestedIntensity=0.5,
-                interpretation="Unable to analyze pattern",
-                suggestedTags=[],
-                error=result.get("error", "Analysis failed")
-            )
+    except Exception as e:
+        print(f"Pattern analysis endpoint error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/analyze/raw", response_model=PatternAnalysisResponse)
+async def analyze_pattern_raw(request: Request):
+    """
+    Same as /analyze, but the body is the raw encoded image
+    (application/octet-stream or image/png) instead of a base64 JSON field.
+    """
+    try:
+        body = await request.body()
+        if not body:
+            raise HTTPException(status_code=400, detail="Request body is empty")
         
-        features = result.get("features", {})
+        content_type = request.headers.get("content-type", "")
+        mime_type = content_type if content_type.startswith("image/") else "image/png"
         
-        return PatternAnalysisResponse(
-            success=True,
-            features=PatternFeatures(
-                shapeType=features.get("shapeType", "organic"),
-                colorMood=features.get("colorMood", "muted"),
-                lineQuality=features.get("lineQuality", "smooth"),
-                density=features.get("density", 0.5),
-                symmetry=features.get("symmetry", 0.5),
-                dominantColors=features.get("dominantColors", []),
-                movement=features.get("movement", "static"),
-                complexity=features.get("complexity", "moderate")
-            ),
-            suggestedEmotion=result.get("suggestedEmotion", "calm"),
-            suggestedIntensity=result.get("suggestedIntensity", 0.5),
-            interpretation=result.get("interpretation", ""),
-            suggestedTags=result.get("suggestedTags", [])
-        )
+        chain = get_pattern_chain()
+        result = await chain.analyze(ImageFrame(body, mime_type))
+        return _build_analysis_response(result)
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Pattern analysis endpoint error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _read_batch_images(request: Request) -> List[Tuple[str, Optional[ImageFrame], Optional[str]]]:
+    """
+    Parse the images of a batch request.
+    
+    Multipart bodies carry one image per part (file uploads, or base64 text
+    fields); any other body is NDJSON with one {"id", "image"} object per line.
+    
+    Returns:
+        List of (id, decoded image or None, error or None) in request order
+    """
+    items: List[Tuple[str, Optional[ImageFrame], Optional[str]]] = []
+    content_type = request.headers.get("content-type", "")
+    
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        for field, value in form.multi_items():
+            if isinstance(value, str):
+                try:
+                    frame = ImageFrame.from_base64(value, "image/png")
+                    items.append((field, frame, None) if len(frame) else (field, None, "Empty image"))
+                except Exception as e:
+                    items.append((field, None, f"Invalid base64 image: {e}"))
+                continue
+            
+            data = await value.read()
+            mime_type = value.content_type if (value.content_type or "").startswith("image/") else "image/png"
+            item_id = value.filename or field
+            items.append((item_id, ImageFrame(data, mime_type), None) if data else (item_id, None, "Empty image"))
+        return items
+    
+    body = await request.body()
+    for line_number, line in enumerate(body.splitlines()):
+        if not line.strip():
+            continue
+        item_id = str(line_number)
+        try:
+            entry = json.loads(line)
+            item_id = str(entry.get("id", item_id))
+            frame = ImageFrame.from_base64(entry["image"], "image/png")
+            items.append((item_id, frame, None) if len(frame) else (item_id, None, "Empty image"))
+        except Exception as e:
+            items.append((item_id, None, f"Invalid batch line: {e}"))
+    return items
+
+
+@router.post("/analyze-batch")
+async def analyze_pattern_batch(request: Request):
+    """
+    Analyze many patterns at once (e.g. importing a pattern library).
+    
+    The body is multipart/form-data (one image per part) or NDJSON
+    (one {"id", "image"} object per line). Identical images are analyzed once,
+    and at most PATTERN_BATCH_CONCURRENCY images are in flight; their Gemini
+    calls run at background priority so live requests go first.
+    
+    Returns:
+        NDJSON stream with one PatternAnalysisResponse per image, plus its
+        "id", request "index", "contentHash" and "duplicateOf" (the id of the
+        first identical image in the batch), in completion order
+    """
+    items = await _read_batch_images(request)
+    if not items:
+        raise HTTPException(status_code=400, detail="No images in request")
+    if len(items) > settings.pattern_batch_max_images:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch exceeds {settings.pattern_batch_max_images} images"
+        )
+    
+    # Group request positions by image content
+    frames: Dict[str, ImageFrame] = {}
+    positions: Dict[str, List[int]] = {}
+    hashes: List[Optional[str]] = []
+    for index, (_, frame, _) in enumerate(items):
+        key = content_hash(frame.data) if frame is not None else None
+        hashes.append(key)
+        if key is not None:
+            frames.setdefault(key, frame)
+            positions.setdefault(key, []).append(index)
+    
+    chain = get_pattern_chain()
+    semaphore = asyncio.Semaphore(max(settings.pattern_batch_concurrency, 1))
+    
+    async def analyze_one(key: str) -> Tuple[str, Dict[str, Any]]:
+        async with semaphore:
+            try:
+                return key, await chain.analyze(frames[key], priority=LLMPriority.BACKGROUND)
+            except Exception as e:
+                print(f"Pattern batch analysis error: {e}")
+                return key, {"success": False, "error": str(e)}
+    
+    def result_line(index: int, result: Dict[str, Any]) -> str:
+        key = hashes[index]
+        first = positions[key][0] if key is not None else index
+        return json.dumps({
+            "id": items[index][0],
+            "index": index,
+            "contentHash": key,
+            "duplicateOf": items[first][0] if first != index else None,
+            **_build_analysis_response(result).model_dump()
+        }) + "\n"
+    
+    async def result_stream():
+        # Undecodable entries fail immediately
+        for index, (_, frame, error) in enumerate(items):
+            if frame is None:
+                yield result_line(index, {"success": False, "error": error})
+        
+        tasks = [asyncio.ensure_future(analyze_one(key)) for key in frames]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                key, result = await next_done
+                for index in positions[key]:
+                    yield result_line(index, result)
+        finally:
+            # Client went away: stop queued analyses
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(
+        result_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.post("/interpret", response_model=PatternInterpretResponse)
 async def interpret_pattern(request: PatternInterpretRequest):
     """
@@ -209,37 +385,22 @@ async def match_pattern(request: PatternMatchRequest):
         received_features = analysis.get("features", {})
         received_emotion = analysis.get("suggestedEmotion", "")
         
-        # Simple matching logic based on emotion and color mood
-        matched_patterns = []
-        for pattern in request.libraryPatterns:
-            score = 0.0
-            
-            # Emotion match (highest weight)
-            if pattern.get("emotion", "").lower() == received_emotion.lower():
-                score += 0.5
-            
-            # Feature matching
-            pattern_features = pattern.get("features", {})
-            if pattern_features.get("colorMood") == received_features.get("colorMood"):
-                score += 0.2
-            if pattern_features.get("shapeType") == received_features.get("shapeType"):
-                score += 0.15
-            if pattern_features.get("lineQuality") == received_features.get("lineQuality"):
-                score += 0.1
-            
-            # Intensity similarity
-            intensity_diff = abs(pattern.get("intensity", 50) - int(analysis.get("suggestedIntensity", 0.5) * 100))
-            if intensity_diff < 20:
-                score += 0.05
-            
-            if score > 0.3:  # Threshold for match
-                matched_patterns.append({
-                    **pattern,
-                    "matchScore": round(score, 2)
-                })
+        # A library sent along is the sender's complete current library, so deleted patterns drop out
+        store = get_pattern_index_store()
+        if request.libraryPatterns is not None:
+            store.sync_patterns(request.senderId, request.libraryPatterns)
         
-        # Sort by match score
-        matched_patterns.sort(key=lambda x: x.get("matchScore", 0), reverse=True)
+        # Top-k cosine similarity over the sender's library
+        query = pattern_embedding(
+            received_features,
+            received_emotion,
+            analysis.get("suggestedIntensity", 0.5)
+        )
+        matched_patterns = [
+            {**pattern, "matchScore": round(score, 2)}
+            for score, pattern in store.get(request.senderId).query(query, k=request.limit or 5)
+            if score >= settings.pattern_match_min_score
+        ]
         
         best_match = matched_patterns[0] if matched_patterns else None
         confidence = best_match.get("matchScore", 0) if best_match else 0
@@ -253,7 +414,7 @@ async def match_pattern(request: PatternMatchRequest):
         
         return PatternMatchResponse(
             success=True,
-            matchedPatterns=matched_patterns[:5],  # Top 5 matches
+            matchedPatterns=matched_patterns,
             bestMatch=best_match,
             confidence=confidence,
             interpretation=interpretation
@@ -264,6 +425,25 @@ async def match_pattern(request: PatternMatchRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/library/{user_id}", response_model=PatternLibraryResponse)
+async def upsert_library_patterns(user_id: str, request: PatternLibraryRequest):
+    """
+    Add or update patterns in a user's library index, so /match requests
+    don't need to send the whole library.
+    """
+    count = get_pattern_index_store().upsert_patterns(user_id, request.patterns)
+    return PatternLibraryResponse(success=True, userId=user_id, patternCount=count)
+
+
+@router.delete("/library/{user_id}/{pattern_id}", response_model=PatternLibraryResponse)
+async def remove_library_pattern(user_id: str, pattern_id: str):
+    """Remove one pattern from a user's library index."""
+    store = get_pattern_index_store()
+    if not store.remove_pattern(user_id, pattern_id):
+        raise HTTPException(status_code=404, detail="Pattern not found")
+    return PatternLibraryResponse(success=True, userId=user_id, patternCount=len(store.get(user_id)))
+
+
 @router.get("/health")
 async def health_check():
     """Health check endpoint for pattern service."""
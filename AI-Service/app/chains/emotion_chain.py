@@ -3,13 +3,14 @@ LangChain Emotion Analysis Chain for HeartSpeak.
 Analyzes facial expressions from images using Gemini Vision.
 """
 import json
-from typing import Optional, Dict, Any, List
-from collections import deque
-from langchain_google_genai import ChatGoogleGenerativeAI
+from typing import Optional, Dict, Any, List, Union
 from langchain_core.output_parsers import JsonOutputParser
 from langchain_core.messages import HumanMessage
 from pydantic import BaseModel, Field
-from app.config import settings
+from app.memory.backends import MemoryBackend, get_memory_backend
+from app.services.image_frame import ImageFrame
+from app.services.llm_registry import get_llm_registry
+from app.services.llm_scheduler import LLMPriority
 
 
 class EmotionAnalysisOutput(BaseModel):
@@ -21,7 +22,12 @@ class EmotionAnalysisOutput(BaseModel):
     nuances: Dict[str, str] = Field(description="Detailed nuances like eye contact, mouth expression, etc.")
 
 
-EMOTION_ANALYSIS_PROMPT = """You are an expert emotion analyst for HeartSpeak, an AI-powered communication platform helping speech-impaired individuals express their feelings.
+class EmotionDescriptionOutput(EmotionAnalysisOutput):
+    """Schema for combined emotion analysis and partner message output."""
+    generatedText: str = Field(description="Warm 1-2 sentence message describing the emotional state")
+
+
+EMOTION_ANALYSIS_INSTRUCTIONS = """You are an expert emotion analyst for HeartSpeak, an AI-powered communication platform helping speech-impaired individuals express their feelings.
 
 Analyze the facial expression in the provided image with extreme care and empathy. Focus on:
 
@@ -48,7 +54,9 @@ IMPORTANT GUIDELINES:
 - Consider cultural differences in emotional expression
 - Always prioritize the person's dignity in your analysis
 
-Respond with ONLY a valid JSON object matching this exact schema:
+"""
+
+EMOTION_ANALYSIS_PROMPT = EMOTION_ANALYSIS_INSTRUCTIONS + """Respond with ONLY a valid JSON object matching this exact schema:
 {{
     "emotions": ["emotion1", "emotion2"],
     "dominantEmotion": "primary_emotion",
@@ -63,28 +71,65 @@ Respond with ONLY a valid JSON object matching this exact schema:
 }}"""
 
 
+EMOTION_DESCRIBE_INSTRUCTIONS = """ALSO WRITE A MESSAGE FOR THE COMMUNICATION PARTNER in the "generatedText" field:
+- Be warm, supportive, and never clinical
+- Use phrases like "They seem to be...", "Your friend appears...", "They're showing signs of..."
+- Keep it to 1-2 concise sentences
+- Match the intensity - subtle emotions get gentle language, strong emotions get more emphatic language
+- If your confidence is low (<0.5), use tentative language like "might be", "seems like", "could be"
+- Note emotional transitions if the person's mood has shifted
+- Focus on helping the receiver understand, not judge
+
+{recent_texts}
+
+"""
+
+EMOTION_ANALYZE_AND_DESCRIBE_PROMPT = EMOTION_ANALYSIS_INSTRUCTIONS + EMOTION_DESCRIBE_INSTRUCTIONS + """Respond with ONLY a valid JSON object matching this exact schema:
+{{
+    "emotions": ["emotion1", "emotion2"],
+    "dominantEmotion": "primary_emotion",
+    "confidence": 0.85,
+    "intensity": 0.7,
+    "nuances": {{
+        "eyeContact": "direct/averted/looking_away",
+        "mouthExpression": "description",
+        "eyebrowPosition": "raised/neutral/furrowed",
+        "overallTension": "relaxed/moderate/tense"
+    }},
+    "generatedText": "A warm 1-2 sentence message for the partner"
+}}"""
+
+
 class SimpleSessionMemory:
-    """Simple in-memory session storage for emotion context."""
+    """Session emotion history, stored in the shared memory backend."""
     
-    def __init__(self, max_entries: int = 10):
+    NAMESPACE = "emotions"
+    
+    def __init__(self, session_id: str, backend: MemoryBackend, max_entries: int = 10):
+        self.session_id = session_id
+        self.backend = backend
         self.max_entries = max_entries
-        self.history: deque = deque(maxlen=max_entries)
     
-    def add(self, emotion: str, confidence: float, intensity: float):
+    async def add(self, emotion: str, confidence: float, intensity: float):
         """Add an emotion entry to history."""
-        self.history.append({
-            "emotion": emotion,
-            "confidence": confidence,
-            "intensity": intensity
-        })
+        await self.backend.push_session_value(
+            self.NAMESPACE,
+            self.session_id,
+            {
+                "emotion": emotion,
+                "confidence": confidence,
+                "intensity": intensity
+            },
+            self.max_entries
+        )
     
-    def get_recent_emotions(self) -> List[str]:
+    async def get_recent_emotions(self) -> List[str]:
         """Get list of recent emotions."""
-        return [entry["emotion"] for entry in self.history]
+        return [entry["emotion"] for entry in await self.backend.get_session_values(self.NAMESPACE, self.session_id)]
     
-    def clear(self):
+    async def clear(self):
         """Clear the history."""
-        self.history.clear()
+        await self.backend.clear_session_values(self.NAMESPACE, self.session_id)
 
 
 class EmotionAnalysisChain:
@@ -93,39 +138,100 @@ class EmotionAnalysisChain:
     """
     
     def __init__(self):
-        self.llm = ChatGoogleGenerativeAI(
-            model="models/gemini-3-flash-preview",
-            google_api_key=settings.gemini_api_key,
-            temperature=0.3,
-            convert_system_message_to_human=True
-        )
+        self.llm_registry = get_llm_registry()
+        self.llm = self.llm_registry.chat_model(temperature=0.3)
         self.output_parser = JsonOutputParser(pydantic_object=EmotionAnalysisOutput)
         
-        # Session memories for call context
-        self._session_memories: Dict[str, SimpleSessionMemory] = {}
+        # Session memories for call context (shared across workers with the Redis backend)
+        self.memory_backend = get_memory_backend()
     
     def _get_session_memory(self, session_id: str) -> SimpleSessionMemory:
-        """Get or create session memory."""
-        if session_id not in self._session_memories:
-            self._session_memories[session_id] = SimpleSessionMemory(max_entries=10)
-        return self._session_memories[session_id]
+        """Get the session memory view."""
+        return SimpleSessionMemory(session_id, self.memory_backend, max_entries=10)
     
-    def _prepare_image_content(self, image_base64: str) -> Dict[str, Any]:
+    def _prepare_image_content(self, image_base64: Union[str, ImageFrame]) -> Dict[str, Any]:
         """Prepare image for Gemini Vision."""
-        # Remove data URI prefix if present
-        if "," in image_base64:
-            image_base64 = image_base64.split(",")[1]
+        # Already-decoded frames are only base64 encoded here, when actually sent
+        if isinstance(image_base64, ImageFrame):
+            url = image_base64.data_url()
+        else:
+            # Remove data URI prefix if present
+            if "," in image_base64:
+                image_base64 = image_base64.split(",")[1]
+            url = f"data:image/jpeg;base64,{image_base64}"
         
         return {
             "type": "image_url",
             "image_url": {
-                "url": f"data:image/jpeg;base64,{image_base64}"
+                "url": url
             }
         }
     
+    async def _build_context(
+        self,
+        context: Optional[str],
+        session_id: Optional[str],
+        previous_emotions: Optional[List[str]]
+    ) -> str:
+        """Build the context block for the analysis prompt."""
+        context_parts = []
+        
+        if context:
+            context_parts.append(f"Conversation context: {context}")
+        
+        if previous_emotions:
+            context_parts.append(f"Previous emotions detected in this call: {', '.join(previous_emotions[-5:])}")
+            context_parts.append("Note any emotional transitions or shifts from previous states.")
+        
+        if session_id:
+            memory = self._get_session_memory(session_id)
+            recent = await memory.get_recent_emotions()
+            if recent:
+                context_parts.append(f"Recent emotion history: {', '.join(recent[-5:])}")
+                context_parts.append("This is an ongoing call. Consider emotional continuity.")
+        
+        return "\n".join(context_parts) if context_parts else "No additional context provided."
+    
+    async def _invoke_vision(self, prompt: str, image_base64: Union[str, ImageFrame]) -> Dict[str, Any]:
+        """Send the prompt and image to Gemini Vision and parse the JSON reply."""
+        # Prepare the image
+        image_content = self._prepare_image_content(image_base64)
+        
+        # Create the message with image
+        message = HumanMessage(
+            content=[
+                {"type": "text", "text": prompt},
+                image_content
+            ]
+        )
+        
+        # Invoke the LLM
+        async with self.llm_registry.slot(LLMPriority.LIVE):
+            response = await self.llm.ainvoke([message])
+        
+        # Parse the response - handle both string and list content
+        result_text = response.content
+        if isinstance(result_text, list):
+            result_text = result_text[0] if result_text else ""
+            if hasattr(result_text, 'text'):
+                result_text = result_text.text
+            elif isinstance(result_text, dict):
+                result_text = result_text.get('text', str(result_text))
+        
+        result_text = str(result_text)
+        
+        # Clean up response if wrapped in markdown
+        if "```" in result_text:
+            result_text = result_text.split("```")[1]
+            if result_text.startswith("json"):
+                result_text = result_text[4:]
+            result_text = result_text.strip()
+        
+        return json.loads(result_text)
+    
     async def analyze(
         self,
-        image_base64: str,
+        image_base64: Union[str, ImageFrame],
         context: Optional[str] = None,
         session_id: Optional[str] = None,
         previous_emotions: Optional[List[str]] = None
@@ -134,7 +240,7 @@ class EmotionAnalysisChain:
         Analyze facial expression from an image.
         
         Args:
-            image_base64: Base64 encoded image
+            image_base64: Base64 encoded image, or a decoded ImageFrame
             context: Optional conversation context
             session_id: Optional session ID for memory
             previous_emotions: List of previously detected emotions
@@ -143,73 +249,77 @@ class EmotionAnalysisChain:
             Dictionary with emotion analysis results
         """
         try:
-            # Build context string
-            context_parts = []
-            
-            if context:
-                context_parts.append(f"Conversation context: {context}")
-            
-            if previous_emotions:
-                context_parts.append(f"Previous emotions detected in this call: {', '.join(previous_emotions[-5:])}")
-                context_parts.append("Note any emotional transitions or shifts from previous states.")
-            
-            if session_id:
-                memory = self._get_session_memory(session_id)
-                recent = memory.get_recent_emotions()
-                if recent:
-                    context_parts.append(f"Recent emotion history: {', '.join(recent[-5:])}")
-                    context_parts.append("This is an ongoing call. Consider emotional continuity.")
-            
-            context_str = "\n".join(context_parts) if context_parts else "No additional context provided."
+            context_str = await self._build_context(context, session_id, previous_emotions)
             
             # Format the prompt
             prompt = EMOTION_ANALYSIS_PROMPT.format(context=context_str)
             
-            # Prepare the image
-            image_content = self._prepare_image_content(image_base64)
+            result = await self._invoke_vision(prompt, image_base64)
             
-            # Create the message with image
-            message = HumanMessage(
-                content=[
-                    {"type": "text", "text": prompt},
-                    image_content
-                ]
-            )
+            # Validate and normalize
+            result = self._validate_result(result)
             
-            # Invoke the LLM
-            response = await self.llm.ainvoke([message])
+            # Update session memory if provided
+            if session_id:
+                await self.record(session_id, result)
             
-            # Parse the response - handle both string and list content
-            result_text = response.content
-            if isinstance(result_text, list):
-                result_text = result_text[0] if result_text else ""
-                if hasattr(result_text, 'text'):
-                    result_text = result_text.text
-                elif isinstance(result_text, dict):
-                    result_text = result_text.get('text', str(result_text))
+            return {
+                "success": True,
+                **result
+            }
             
-            result_text = str(result_text)
+        except json.JSONDecodeError as e:
+            print(f"JSON parsing error: {e}")
+            return self._default_response("Failed to parse emotion analysis")
+        except Exception as e:
+            print(f"Emotion analysis error: {e}")
+            return self._default_response(str(e))
+    
+    async def analyze_and_describe(
+        self,
+        image_base64: Union[str, ImageFrame],
+        context: Optional[str] = None,
+        session_id: Optional[str] = None,
+        previous_emotions: Optional[List[str]] = None,
+        recent_texts: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """
+        Analyze facial expression and write the partner message in a single LLM call.
+        
+        Args:
+            image_base64: Base64 encoded image, or a decoded ImageFrame
+            context: Optional conversation context
+            session_id: Optional session ID for memory
+            previous_emotions: List of previously detected emotions
+            recent_texts: Recently generated messages to avoid repeating
             
-            # Clean up response if wrapped in markdown
-            if "```" in result_text:
-                result_text = result_text.split("```")[1]
-                if result_text.startswith("json"):
-                    result_text = result_text[4:]
-                result_text = result_text.strip()
+        Returns:
+            Dictionary with emotion analysis results plus generatedText
+            (empty if the model omitted it)
+        """
+        try:
+            context_str = await self._build_context(context, session_id, previous_emotions)
+            
+            recent_str = ""
+            if recent_texts:
+                recent_str = "Avoid phrases similar to these recent messages. Vary your language:\n"
+                recent_str += "\n".join(f"- {text}" for text in recent_texts[-3:])
+            
+            # Format the prompt
+            prompt = EMOTION_ANALYZE_AND_DESCRIBE_PROMPT.format(
+                context=context_str,
+                recent_texts=recent_str
+            )
             
-            result = json.loads(result_text)
+            raw = await self._invoke_vision(prompt, image_base64)
             
             # Validate and normalize
-            result = self._validate_result(result)
+            result = self._validate_result(raw)
+            result["generatedText"] = str(raw.get("generatedText", "")).strip().strip('"').strip("'")
             
             # Update session memory if provided
             if session_id:
-                memory = self._get_session_memory(session_id)
-                memory.add(
-                    result['dominantEmotion'],
-                    result['confidence'],
-                    result['intensity']
-                )
+                await self.record(session_id, result)
             
             return {
                 "success": True,
@@ -223,6 +333,15 @@ class EmotionAnalysisChain:
             print(f"Emotion analysis error: {e}")
             return self._default_response(str(e))
     
+    async def record(self, session_id: str, result: Dict[str, Any]) -> None:
+        """Add an analysis result produced elsewhere to the session memory."""
+        memory = self._get_session_memory(session_id)
+        await memory.add(
+            result['dominantEmotion'],
+            result['confidence'],
+            result['intensity']
+        )
+    
     def _validate_result(self, result: Dict[str, Any]) -> Dict[str, Any]:
         """Validate and normalize analysis result."""
         # Ensure all required fields exist
@@ -262,10 +381,9 @@ class EmotionAnalysisChain:
             "error": error
         }
     
-    def clear_session(self, session_id: str) -> None:
+    async def clear_session(self, session_id: str) -> None:
         """Clear session memory."""
-        if session_id in self._session_memories:
-            del self._session_memories[session_id]
+        await self._get_session_memory(session_id).clear()
 
 
 # Singleton instance
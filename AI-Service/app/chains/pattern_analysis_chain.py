@@ -2,13 +2,18 @@
 LangChain Pattern Analysis Chain for HeartSpeak.
 Analyzes visual patterns/drawings using Gemini Vision to extract features and suggest emotions.
 """
+import asyncio
 import json
 import base64
-from typing import Optional, Dict, Any, List
-from langchain_google_genai import ChatGoogleGenerativeAI
+from typing import Optional, Dict, Any, List, Union
 from langchain_core.messages import HumanMessage
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 from app.config import settings
+from app.services.image_frame import ImageFrame
+from app.services.llm_registry import get_llm_registry
+from app.services.llm_scheduler import LLMPriority
+from app.services.pattern_cache import get_pattern_cache
+from app.services.pattern_features import extract_pattern_features
 
 
 class PatternFeatures(BaseModel):
@@ -87,6 +92,37 @@ Respond with ONLY a valid JSON object matching this exact schema:
 }}"""
 
 
+PATTERN_SEMANTICS_PROMPT = """You are an expert visual pattern analyst for HeartSpeak, an AI-powered communication platform helping speech-impaired individuals express their feelings through visual patterns.
+
+This pattern will be used as a personal "emotional signature" - a visual way for the user to express a specific feeling. Its measurable features were already extracted from the pixels:
+{measured_features}
+
+Judge only what can't be measured:
+
+### Shape Type (choose one)
+spiral, angular, flowing, geometric, chaotic, organic
+
+### Movement (choose one)
+static, flowing, dynamic, chaotic
+
+### Suggested Emotion (choose most appropriate):
+joy, calm, love, sadness, anxiety, excitement, confusion, gratitude, 
+hope, loneliness, frustration, peace, curiosity, fear, contentment
+
+### Suggested Tags
+Provide 3-5 descriptive tags that capture the essence of this pattern.
+
+Respond with ONLY a valid JSON object matching this exact schema:
+{{
+    "shapeType": "flowing",
+    "movement": "flowing",
+    "suggestedEmotion": "calm",
+    "suggestedIntensity": 0.65,
+    "interpretation": "A gentle, flowing pattern with warm undertones suggesting a peaceful yet engaged emotional state.",
+    "suggestedTags": ["peaceful", "gentle", "warm"]
+}}"""
+
+
 PATTERN_INTERPRETATION_PROMPT = """You are an empathetic emotion interpreter for HeartSpeak. A user has sent a visual pattern to express their feelings to someone.
 
 ## Context:
@@ -123,70 +159,209 @@ class PatternAnalysisChain:
     """
     
     def __init__(self):
-        self.llm = ChatGoogleGenerativeAI(
-            model="models/gemini-3-flash-preview",
-            google_api_key=settings.gemini_api_key,
-            temperature=0.4,
-            convert_system_message_to_human=True
-        )
+        self.llm_registry = get_llm_registry()
+        self.llm = self.llm_registry.chat_model(temperature=0.4)
+        
+        # Analyses by image content, and analyses currently running per content hash
+        self.cache = get_pattern_cache()
+        self._in_flight: Dict[str, asyncio.Future] = {}
     
-    def _prepare_image_content(self, image_base64: str) -> Dict[str, Any]:
+    def _to_frame(self, image_base64: Union[str, ImageFrame]) -> ImageFrame:
+        """Decode a base64 pattern image once; frames pass through."""
+        if isinstance(image_base64, ImageFrame):
+            return image_base64
+        return ImageFrame.from_base64(image_base64, "image/png")
+    
+    def _prepare_image_content(self, image_base64: Union[str, ImageFrame]) -> Dict[str, Any]:
         """Prepare image for Gemini Vision."""
-        # Remove data URI prefix if present
-        if "," in image_base64:
-            image_base64 = image_base64.split(",")[1]
+        # Already-decoded frames are only base64 encoded here, when actually sent
+        if isinstance(image_base64, ImageFrame):
+            url = image_base64.data_url()
+        else:
+            # Remove data URI prefix if present
+            if "," in image_base64:
+                image_base64 = image_base64.split(",")[1]
+            url = f"data:image/png;base64,{image_base64}"
         
         return {
             "type": "image_url",
             "image_url": {
-                "url": f"data:image/png;base64,{image_base64}"
+                "url": url
             }
         }
     
-    async def analyze(self, image_base64: str) -> Dict[str, Any]:
+    async def analyze(
+        self,
+        image_base64: Union[str, ImageFrame],
+        priority: LLMPriority = LLMPriority.PATTERN
+    ) -> Dict[str, Any]:
         """
         Analyze a pattern image and extract features.
+        Identical (or, with perceptual matching, near-identical) images are
+        answered from the cache, and concurrent requests for the same image
+        share a single Gemini call.
         
         Args:
-            image_base64: Base64 encoded image of the pattern
+            image_base64: Base64 encoded image of the pattern, or a decoded ImageFrame
+            priority: Scheduling class of the Gemini call (bulk imports use BACKGROUND)
             
         Returns:
             Dictionary with pattern analysis results
         """
         try:
-            # Prepare the image
-            image_content = self._prepare_image_content(image_base64)
-            
-            # Create the message with image
-            message = HumanMessage(
-                content=[
-                    {"type": "text", "text": PATTERN_ANALYSIS_PROMPT},
-                    image_content
-                ]
-            )
-            
-            # Invoke the LLM
+            frame = self._to_frame(image_base64)
+        except Exception as e:
+            print(f"Pattern analysis error: {e}")
+            return self._default_response(str(e))
+        
+        if not settings.pattern_cache_enabled:
+            return await self._analyze_uncached(frame, priority)
+        
+        cached, key, phash = self.cache.get(frame.data)
+        if cached is not None:
+            return {"success": True, **cached}
+        
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            try:
+                return dict(await asyncio.shield(in_flight))
+            except asyncio.CancelledError:
+                if not in_flight.cancelled():
+                    raise
+                # The request that started the analysis went away
+                return await self._analyze_uncached(frame, priority)
+        
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            result = await self._analyze_uncached(frame, priority)
+            if result.get("success"):
+                try:
+                    validated = PatternAnalysisOutput(
+                        **{k: v for k, v in result.items() if k != "success"}
+                    ).model_dump()
+                    self.cache.put(key, validated, phash)
+                except ValidationError as e:
+                    print(f"Pattern analysis not cached: {e}")
+            future.set_result(result)
+            return result
+        finally:
+            if not future.done():
+                future.cancel()
+            del self._in_flight[key]
+    
+    async def _invoke_vision(
+        self,
+        prompt: str,
+        image_base64: Union[str, ImageFrame],
+        priority: LLMPriority = LLMPriority.PATTERN
+    ) -> Dict[str, Any]:
+        """Send the prompt and image to Gemini Vision and parse the JSON reply."""
+        # Prepare the image
+        image_content = self._prepare_image_content(image_base64)
+        
+        # Create the message with image
+        message = HumanMessage(
+            content=[
+                {"type": "text", "text": prompt},
+                image_content
+            ]
+        )
+        
+        # Invoke the LLM
+        async with self.llm_registry.slot(priority):
             response = await self.llm.ainvoke([message])
+        
+        # Parse the response - handle both string and list content
+        result_text = response.content
+        if isinstance(result_text, list):
+            result_text = result_text[0] if result_text else ""
+            if hasattr(result_text, 'text'):
+                result_text = result_text.text
+            elif isinstance(result_text, dict):
+                result_text = result_text.get('text', str(result_text))
+        
+        result_text = str(result_text)
+        
+        # Clean up response if wrapped in markdown
+        if "```" in result_text:
+            result_text = result_text.split("```")[1]
+            if result_text.startswith("json"):
+                result_text = result_text[4:]
+            result_text = result_text.strip()
+        
+        return json.loads(result_text)
+    
+    async def extract_features(self, image_base64: Union[str, ImageFrame]) -> Optional[Dict[str, Any]]:
+        """
+        Measure pattern features locally (no LLM call).
+        
+        Args:
+            image_base64: Base64 encoded image of the pattern, or a decoded ImageFrame
             
-            # Parse the response - handle both string and list content
-            result_text = response.content
-            if isinstance(result_text, list):
-                result_text = result_text[0] if result_text else ""
-                if hasattr(result_text, 'text'):
-                    result_text = result_text.text
-                elif isinstance(result_text, dict):
-                    result_text = result_text.get('text', str(result_text))
+        Returns:
+            Dictionary with density, symmetry, dominantColors, colorMood, lineQuality
+            and complexity, or None if disabled or the image can't be decoded
+        """
+        if not settings.pattern_local_features_enabled:
+            return None
+        
+        frame = self._to_frame(image_base64)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, extract_pattern_features, frame.data)
+    
+    async def _try_extract_features(self, frame: ImageFrame) -> Optional[Dict[str, Any]]:
+        """extract_features that logs failures and returns None, so callers fall back to the LLM."""
+        try:
+            return await self.extract_features(frame)
+        except Exception as e:
+            print(f"Local pattern feature extraction error: {e}")
+            return None
+    
+    async def _analyze_uncached(
+        self,
+        frame: ImageFrame,
+        priority: LLMPriority = LLMPriority.PATTERN
+    ) -> Dict[str, Any]:
+        """Measure what the pixels give locally and ask Gemini only for the rest."""
+        local_features = await self._try_extract_features(frame)
+        if local_features is None:
+            return await self._analyze_with_llm(frame, priority)
+        
+        try:
+            prompt = PATTERN_SEMANTICS_PROMPT.format(
+                measured_features=json.dumps(local_features, indent=2)
+            )
+            result = await self._invoke_vision(prompt, frame, priority)
             
-            result_text = str(result_text)
+            result = self._validate_result({
+                **result,
+                "features": {
+                    **local_features,
+                    "shapeType": result.get("shapeType", "organic"),
+                    "movement": result.get("movement", "static")
+                }
+            })
             
-            # Clean up response if wrapped in markdown
-            if "```" in result_text:
-                result_text = result_text.split("```")[1]
-                if result_text.startswith("json"):
-                    result_text = result_text[4:]
-                result_text = result_text.strip()
+            return {
+                "success": True,
+                **result
+            }
             
-            result = json.loads(result_text)
+        except Exception as e:
+            print(f"Pattern analysis error: {e}")
+            response = self._default_response(str(e))
+            response["features"].update(local_features)
+            return response
+    
+    async def _analyze_with_llm(
+        self,
+        image_base64: Union[str, ImageFrame],
+        priority: LLMPriority = LLMPriority.PATTERN
+    ) -> Dict[str, Any]:
+        """Run the full Gemini Vision analysis (all features) for one pattern image."""
+        try:
+            result = await self._invoke_vision(PATTERN_ANALYSIS_PROMPT, image_base64, priority)
             
             # Validate and normalize
             result = self._validate_result(result)
@@ -205,7 +380,7 @@ class PatternAnalysisChain:
     
     async def interpret(
         self,
-        image_base64: str,
+        image_base64: Union[str, ImageFrame],
         sender_name: str,
         pattern_name: str,
         emotion: str,
@@ -218,7 +393,7 @@ class PatternAnalysisChain:
         Generate an interpretation of a pattern for the recipient.
         
         Args:
-            image_base64: Base64 encoded image
+            image_base64: Base64 encoded image, or a decoded ImageFrame
             sender_name: Name of the person who sent the pattern
             pattern_name: Name of the pattern
             emotion: Associated emotion
@@ -231,7 +406,13 @@ class PatternAnalysisChain:
             Dictionary with interpretation
         """
         try:
-            # If features not provided, analyze the pattern first
+            # Decode once for both the analysis and the interpretation call
+            image_base64 = self._to_frame(image_base64)
+            
+            # If features not provided, measure them locally, or analyze the pattern
+            # (usually cached) when local extraction is unavailable
+            if not features:
+                features = await self._try_extract_features(image_base64)
             if not features:
                 analysis = await self.analyze(image_base64)
                 if analysis.get("success"):
@@ -258,39 +439,7 @@ class PatternAnalysisChain:
                 library_context=library_context
             )
             
-            # Prepare the image
-            image_content = self._prepare_image_content(image_base64)
-            
-            # Create the message with image
-            message = HumanMessage(
-                content=[
-                    {"type": "text", "text": prompt},
-                    image_content
-                ]
-            )
-            
-            # Invoke the LLM
-            response = await self.llm.ainvoke([message])
-            
-            # Parse the response - handle both string and list content
-            result_text = response.content
-            if isinstance(result_text, list):
-                result_text = result_text[0] if result_text else ""
-                if hasattr(result_text, 'text'):
-                    result_text = result_text.text
-                elif isinstance(result_text, dict):
-                    result_text = result_text.get('text', str(result_text))
-            
-            result_text = str(result_text)
-            
-            # Clean up response if wrapped in markdown
-            if "```" in result_text:
-                result_text = result_text.split("```")[1]
-                if result_text.startswith("json"):
-                    result_text = result_text[4:]
-                result_text = result_text.strip()
-            
-            result = json.loads(result_text)
+            result = await self._invoke_vision(prompt, image_base64)
             
             return {
                 "success": True,
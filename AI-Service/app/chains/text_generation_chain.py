@@ -2,10 +2,13 @@
 LangChain Text Generation Chain for HeartSpeak.
 Generates empathetic, natural language descriptions of emotions.
 """
-from typing import Optional, Dict, Any, List
-from langchain_google_genai import ChatGoogleGenerativeAI
+from typing import Optional, Dict, Any, List, AsyncIterator
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from app.memory.backends import get_memory_backend
+from app.services.llm_registry import get_llm_registry
+from app.services.llm_scheduler import LLMPriority
+from app.services.text_response_cache import get_text_response_cache, CacheKey
 from app.config import settings
 
 
@@ -46,18 +49,17 @@ NUANCES:
 Generate ONLY the message text, no quotes or formatting. Make it feel human and caring."""
 
 
+RECENT_TEXTS_NAMESPACE = "texts"
+
+
 class EmotionTextGenerationChain:
     """
     LangChain-based text generation for emotion descriptions.
     """
     
     def __init__(self):
-        self.llm = ChatGoogleGenerativeAI(
-            model="models/gemini-3-flash-preview",
-            google_api_key=settings.gemini_api_key,
-            temperature=0.7,  # Higher for more natural variation
-            convert_system_message_to_human=True
-        )
+        self.llm_registry = get_llm_registry()
+        self.llm = self.llm_registry.chat_model(temperature=0.7)  # Higher for more natural variation
         
         self.prompt = ChatPromptTemplate.from_messages([
             ("system", EMOTION_TEXT_SYSTEM_PROMPT),
@@ -66,8 +68,11 @@ class EmotionTextGenerationChain:
         
         self.chain = self.prompt | self.llm | StrOutputParser()
         
-        # Track recent generations per session
-        self._recent_texts: Dict[str, List[str]] = {}
+        # Track recent generations per session (shared across workers with the Redis backend)
+        self.memory_backend = get_memory_backend()
+        
+        # Phrasings shared across sessions for recurring inputs
+        self.response_cache = get_text_response_cache()
     
     async def generate(
         self,
@@ -89,60 +94,25 @@ class EmotionTextGenerationChain:
             Natural language string describing the emotional state
         """
         try:
-            # Extract data with defaults
-            emotions = emotion_data.get("emotions", ["neutral"])
-            dominant = emotion_data.get("dominantEmotion", "neutral")
-            confidence = emotion_data.get("confidence", 0.5)
-            intensity = emotion_data.get("intensity", 0.5)
-            nuances = emotion_data.get("nuances", {})
-            
-            # Build context info
-            context_parts = []
-            
-            if context:
-                context_parts.append(f"Conversation context: {context}")
-            
-            if previous_emotions and len(previous_emotions) > 0:
-                context_parts.append(f"Previous emotions: {', '.join(previous_emotions[-3:])}")
-                
-                # Note transitions
-                if previous_emotions[-1] != dominant:
-                    context_parts.append(f"Note: Emotional shift from {previous_emotions[-1]} to {dominant}")
-            
-            # Avoid repetition
-            if session_id and session_id in self._recent_texts:
-                recent = self._recent_texts[session_id]
-                if recent:
-                    context_parts.append(f"Avoid phrases similar to recent messages. Vary your language.")
+            cache_key = self._cache_key(emotion_data, context, previous_emotions)
+            cached = await self._get_cached(cache_key, session_id)
+            if cached:
+                return cached
             
-            context_info = "\n".join(context_parts) if context_parts else "No additional context."
-            
-            # Prepare input
-            input_data = {
-                "emotions": ", ".join(emotions),
-                "dominant_emotion": dominant,
-                "confidence": f"{confidence:.0%}",
-                "intensity": self._intensity_label(intensity),
-                "eye_contact": nuances.get("eyeContact", "unknown"),
-                "mouth_expression": nuances.get("mouthExpression", "unknown"),
-                "eyebrow_position": nuances.get("eyebrowPosition", "neutral"),
-                "overall_tension": nuances.get("overallTension", "unknown"),
-                "context_info": context_info
-            }
+            input_data = await self._build_input(emotion_data, context, previous_emotions, session_id)
             
             # Generate text
-            result = await self.chain.ainvoke(input_data)
+            async with self.llm_registry.slot(LLMPriority.LIVE):
+                result = await self.chain.ainvoke(input_data)
             
             # Clean up
             result = result.strip().strip('"').strip("'")
+            if cache_key is not None:
+                self.response_cache.add(cache_key, result)
             
             # Track recent generations
             if session_id:
-                if session_id not in self._recent_texts:
-                    self._recent_texts[session_id] = []
-                self._recent_texts[session_id].append(result)
-                # Keep only last 5
-                self._recent_texts[session_id] = self._recent_texts[session_id][-5:]
+                await self.remember(session_id, result)
             
             return result
             
@@ -150,6 +120,182 @@ class EmotionTextGenerationChain:
             print(f"Text generation error: {e}")
             return self._fallback_text(emotion_data)
     
+    async def _build_input(
+        self,
+        emotion_data: Dict[str, Any],
+        context: Optional[str],
+        previous_emotions: Optional[List[str]],
+        session_id: Optional[str]
+    ) -> Dict[str, Any]:
+        """Build the prompt variables for one generation."""
+        # Extract data with defaults
+        emotions = emotion_data.get("emotions", ["neutral"])
+        dominant = emotion_data.get("dominantEmotion", "neutral")
+        confidence = emotion_data.get("confidence", 0.5)
+        intensity = emotion_data.get("intensity", 0.5)
+        nuances = emotion_data.get("nuances", {})
+        
+        # Build context info
+        context_parts = []
+        
+        if context:
+            context_parts.append(f"Conversation context: {context}")
+        
+        if previous_emotions and len(previous_emotions) > 0:
+            context_parts.append(f"Previous emotions: {', '.join(previous_emotions[-3:])}")
+            
+            # Note transitions
+            if previous_emotions[-1] != dominant:
+                context_parts.append(f"Note: Emotional shift from {previous_emotions[-1]} to {dominant}")
+        
+        # Avoid repetition
+        if session_id:
+            recent = await self.get_recent_texts(session_id)
+            if recent:
+                context_parts.append(f"Avoid phrases similar to recent messages. Vary your language.")
+        
+        context_info = "\n".join(context_parts) if context_parts else "No additional context."
+        
+        # Prepare input
+        input_data = {
+            "emotions": ", ".join(emotions),
+            "dominant_emotion": dominant,
+            "confidence": f"{confidence:.0%}",
+            "intensity": self._intensity_label(intensity),
+            "eye_contact": nuances.get("eyeContact", "unknown"),
+            "mouth_expression": nuances.get("mouthExpression", "unknown"),
+            "eyebrow_position": nuances.get("eyebrowPosition", "neutral"),
+            "overall_tension": nuances.get("overallTension", "unknown"),
+            "context_info": context_info
+        }
+        return input_data
+    
+    async def astream(
+        self,
+        emotion_data: Dict[str, Any],
+        context: Optional[str] = None,
+        previous_emotions: Optional[List[str]] = None,
+        session_id: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream the natural language description as it is generated.
+        
+        Args:
+            emotion_data: Dictionary with emotion analysis results
+            context: Optional conversation context
+            previous_emotions: List of previously detected emotions
+            session_id: Optional session ID for tracking
+            
+        Yields:
+            Text chunks; the fallback text as a single chunk if generation fails
+            before anything was produced
+        """
+        chunks: List[str] = []
+        cache_key = self._cache_key(emotion_data, context, previous_emotions)
+        cached = await self._get_cached(cache_key, session_id)
+        if cached:
+            yield cached
+            return
+        
+        try:
+            input_data = await self._build_input(emotion_data, context, previous_emotions, session_id)
+            
+            async with self.llm_registry.slot(LLMPriority.LIVE):
+                async for chunk in self.chain.astream(input_data):
+                    if not chunks:
+                        # Quotes are stripped from the finished text; skip them up front too
+                        chunk = chunk.lstrip().lstrip('"').lstrip("'")
+                    if chunk:
+                        chunks.append(chunk)
+                        yield chunk
+        except Exception as e:
+            print(f"Text streaming error: {e}")
+            if not chunks:
+                fallback = self._fallback_text(emotion_data)
+                if session_id:
+                    await self.remember(session_id, fallback)
+                yield fallback
+            return
+        
+        result = "".join(chunks).strip().strip('"').strip("'")
+        if cache_key is not None:
+            self.response_cache.add(cache_key, result)
+        if session_id and result:
+            await self.remember(session_id, result)
+    
+    def _cache_key(
+        self,
+        emotion_data: Dict[str, Any],
+        context: Optional[str],
+        previous_emotions: Optional[List[str]]
+    ) -> Optional[CacheKey]:
+        """
+        Normalize the generation input into a cache key.
+        Free-form conversation context makes every input unique, so it isn't cached.
+        """
+        if not settings.text_cache_enabled or context:
+            return None
+        
+        emotions = emotion_data.get("emotions", ["neutral"])
+        dominant = emotion_data.get("dominantEmotion", "neutral")
+        nuances = emotion_data.get("nuances") or {}
+        secondary = next((e for e in emotions if e != dominant), None)
+        shifted_from = previous_emotions[-1] if previous_emotions and previous_emotions[-1] != dominant else None
+        
+        return (
+            dominant,
+            secondary,
+            self._intensity_label(emotion_data.get("intensity", 0.5)),
+            "tentative" if emotion_data.get("confidence", 0.5) < 0.5 else "confident",
+            nuances.get("eyeContact", "unknown"),
+            nuances.get("mouthExpression", "unknown"),
+            nuances.get("eyebrowPosition", "neutral"),
+            nuances.get("overallTension", "unknown"),
+            shifted_from,
+        )
+    
+    async def _get_cached(self, cache_key: Optional[CacheKey], session_id: Optional[str]) -> Optional[str]:
+        """Serve a cached phrasing the session hasn't seen recently."""
+        if cache_key is None:
+            return None
+        
+        recent = await self.get_recent_texts(session_id) if session_id else []
+        text = self.response_cache.get(cache_key, avoid=recent)
+        if text and session_id:
+            await self.remember(session_id, text)
+        return text
+    
+    def has_cached_text(
+        self,
+        emotion_data: Dict[str, Any],
+        context: Optional[str] = None,
+        previous_emotions: Optional[List[str]] = None
+    ) -> bool:
+        """Whether the cache holds enough phrasings to serve this input."""
+        cache_key = self._cache_key(emotion_data, context, previous_emotions)
+        return cache_key is not None and self.response_cache.is_warm(cache_key)
+    
+    def cache_text(
+        self,
+        emotion_data: Dict[str, Any],
+        text: str,
+        context: Optional[str] = None,
+        previous_emotions: Optional[List[str]] = None
+    ) -> None:
+        """Add a message generated elsewhere (e.g. the combined vision call) to the cache."""
+        cache_key = self._cache_key(emotion_data, context, previous_emotions)
+        if cache_key is not None:
+            self.response_cache.add(cache_key, text)
+    
+    async def remember(self, session_id: str, text: str) -> None:
+        """Track a generated message so later generations avoid repeating it."""
+        # Keep only last 5
+        await self.memory_backend.push_session_value(RECENT_TEXTS_NAMESPACE, session_id, text, 5)
+    
+    async def get_recent_texts(self, session_id: str) -> List[str]:
+        """Get recently generated messages for a session."""
+        return await self.memory_backend.get_session_values(RECENT_TEXTS_NAMESPACE, session_id)
+    
     def _intensity_label(self, intensity: float) -> str:
         """Convert intensity float to descriptive label."""
         if intensity < 0.3:
@@ -187,10 +333,9 @@ class EmotionTextGenerationChain:
         
         return fallback_templates.get(dominant, f"Your friend appears {dominant} at the moment.")
     
-    def clear_session(self, session_id: str) -> None:
+    async def clear_session(self, session_id: str) -> None:
         """Clear session tracking."""
-        if session_id in self._recent_texts:
-            del self._recent_texts[session_id]
+        await self.memory_backend.clear_session_values(RECENT_TEXTS_NAMESPACE, session_id)
 
 
 # Singleton instance
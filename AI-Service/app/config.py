@@ -18,9 +18,88 @@ class Settings(BaseSettings):
     mongodb_url: str = os.getenv("MONGODB_URL", "mongodb://localhost:27017/heartspeak")
     redis_url: str = os.getenv("REDIS_URL", "redis://localhost:6379")
     
+    # Call Memory: "local" (per process) or "redis" (shared by all workers and replicas)
+    memory_backend: str = os.getenv("MEMORY_BACKEND", "local")
+    memory_key_prefix: str = os.getenv("MEMORY_KEY_PREFIX", "heartspeak:")
+    memory_ttl_seconds: int = int(os.getenv("MEMORY_TTL_SECONDS", "86400"))  # Redis key expiry, refreshed on write (0 = never)
+    
+    # Session Lifetime (per-call state of this worker is released when idle or over the cap)
+    session_ttl_seconds: float = float(os.getenv("SESSION_TTL_SECONDS", "900"))
+    session_max_live: int = int(os.getenv("SESSION_MAX_LIVE", "10000"))  # Least recently used sessions are evicted beyond this
+    session_sweep_interval_seconds: float = float(os.getenv("SESSION_SWEEP_INTERVAL_SECONDS", "30"))
+    
     # Services
     node_server_url: str = os.getenv("NODE_SERVER_URL", "http://localhost:5000")
     
+    # Frame Preprocessing
+    preprocess_workers: int = int(os.getenv("PREPROCESS_WORKERS", "0"))  # 0 = one per CPU core
+    preprocess_max_pending: int = int(os.getenv("PREPROCESS_MAX_PENDING", "0"))  # 0 = 4 per worker
+    
+    # Face detection pass: "mesh_only" (single pass), "gated" (detection on a downscaled
+    # copy as a presence gate, then mesh) or "full" (detection and mesh at full resolution)
+    preprocess_detection_mode: str = os.getenv("PREPROCESS_DETECTION_MODE", "mesh_only")
+    detection_gate_max_edge: int = int(os.getenv("DETECTION_GATE_MAX_EDGE", "320"))
+    
+    # Landmark Tracking (per-session video-mode face mesh in each worker)
+    tracking_enabled: bool = os.getenv("TRACKING_ENABLED", "true").lower() == "true"
+    tracker_max_sessions_per_worker: int = int(os.getenv("TRACKER_MAX_SESSIONS_PER_WORKER", "32"))
+    tracker_idle_seconds: float = float(os.getenv("TRACKER_IDLE_SECONDS", "60"))
+    
+    # Vision Model Upload (face crop + downscale + re-encode before the LLM call)
+    llm_image_downscale_enabled: bool = os.getenv("LLM_IMAGE_DOWNSCALE_ENABLED", "true").lower() == "true"
+    llm_image_max_edge: int = int(os.getenv("LLM_IMAGE_MAX_EDGE", "384"))
+    llm_image_jpeg_quality: int = int(os.getenv("LLM_IMAGE_JPEG_QUALITY", "80"))
+    llm_image_face_margin: float = float(os.getenv("LLM_IMAGE_FACE_MARGIN", "0.35"))
+    
+    # Frame Change Detection (skip LLM calls for near-duplicate frames)
+    frame_metric_change_threshold: float = float(os.getenv("FRAME_METRIC_CHANGE_THRESHOLD", "0.05"))
+    frame_landmark_change_threshold: float = float(os.getenv("FRAME_LANDMARK_CHANGE_THRESHOLD", "0.02"))
+    frame_cache_max_age_seconds: float = float(os.getenv("FRAME_CACHE_MAX_AGE_SECONDS", "15"))
+    
+    # Local Landmark Classifier (escalate to Gemini only when unsure)
+    local_classifier_enabled: bool = os.getenv("LOCAL_CLASSIFIER_ENABLED", "false").lower() == "true"  # Enable only with trained, evaluated weights
+    local_classifier_min_confidence: float = float(os.getenv("LOCAL_CLASSIFIER_MIN_CONFIDENCE", "0.75"))
+    local_classifier_weights: str = os.getenv("LOCAL_CLASSIFIER_WEIGHTS", "")  # Optional trained .npz
+    
+    # LLM Client (one shared Gemini client for every chain)
+    llm_model: str = os.getenv("LLM_MODEL", "models/gemini-3-flash-preview")
+    llm_transport: str = os.getenv("LLM_TRANSPORT", "")  # "" = library default (gRPC), or "rest"
+    llm_keepalive_seconds: float = float(os.getenv("LLM_KEEPALIVE_SECONDS", "30"))
+    llm_max_concurrency: int = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))  # Concurrent upstream calls
+    llm_rate_per_minute: float = float(os.getenv("LLM_RATE_PER_MINUTE", "0"))  # Token bucket refill (0 = unlimited)
+    llm_rate_burst: int = int(os.getenv("LLM_RATE_BURST", "0"))  # Bucket size (0 = LLM_MAX_CONCURRENCY)
+    
+    # Text Response Cache (phrasings reused across sessions for recurring inputs)
+    text_cache_enabled: bool = os.getenv("TEXT_CACHE_ENABLED", "true").lower() == "true"
+    text_cache_max_keys: int = int(os.getenv("TEXT_CACHE_MAX_KEYS", "2048"))
+    text_cache_variants: int = int(os.getenv("TEXT_CACHE_VARIANTS", "6"))  # Phrasings per key; above the 5 recent texts a session avoids
+    text_cache_ttl_seconds: float = float(os.getenv("TEXT_CACHE_TTL_SECONDS", "86400"))
+    
+    # Local Pattern Features (measured with OpenCV; Gemini only judges shape, movement and emotion)
+    pattern_local_features_enabled: bool = os.getenv("PATTERN_LOCAL_FEATURES_ENABLED", "true").lower() == "true"
+    
+    # Pattern Analysis Cache (content-addressed, optional near-duplicate matching)
+    pattern_cache_enabled: bool = os.getenv("PATTERN_CACHE_ENABLED", "true").lower() == "true"
+    pattern_cache_max_entries: int = int(os.getenv("PATTERN_CACHE_MAX_ENTRIES", "1024"))
+    pattern_cache_dir: str = os.getenv("PATTERN_CACHE_DIR", "")  # "" = memory only
+    pattern_cache_phash_max_distance: int = int(os.getenv("PATTERN_CACHE_PHASH_MAX_DISTANCE", "-1"))  # -1 = exact only, e.g. 3 to match re-renders
+    
+    # Pattern Batch Analysis (/pattern/analyze-batch)
+    pattern_batch_max_images: int = int(os.getenv("PATTERN_BATCH_MAX_IMAGES", "200"))
+    pattern_batch_concurrency: int = int(os.getenv("PATTERN_BATCH_CONCURRENCY", "4"))  # Unique images analyzed at once per batch
+    
+    # Pattern Matching (cosine similarity over the sender's library index)
+    pattern_match_min_score: float = float(os.getenv("PATTERN_MATCH_MIN_SCORE", "0.3"))  # Emotion-only matches score ~0.35-0.45, unrelated ~0
+    pattern_index_max_users: int = int(os.getenv("PATTERN_INDEX_MAX_USERS", "1000"))  # Least recently used libraries are dropped beyond this
+    
+    # Emotion Pipeline: "combined" (one LLM call for analysis + text) or "two_call"
+    emotion_pipeline_mode: str = os.getenv("EMOTION_PIPELINE_MODE", "combined")
+    
+    # Adaptive Frame Pacing (nextFrameAfterMs hints)
+    frame_interval_base_ms: int = int(os.getenv("FRAME_INTERVAL_BASE_MS", "3000"))
+    frame_interval_min_ms: int = int(os.getenv("FRAME_INTERVAL_MIN_MS", "1000"))
+    frame_interval_max_ms: int = int(os.getenv("FRAME_INTERVAL_MAX_MS", "15000"))
+    
     # App Settings
     app_name: str = "HeartSpeak AI Service"
     debug: bool = os.getenv("DEBUG", "true").lower() == "true"
@@ -1,12 +1,32 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import settings
 from app.api.router import api_router
+from app.services.frame_preprocessor import get_frame_preprocessor, shutdown_frame_preprocessor
+from app.services.llm_scheduler import get_llm_scheduler
+from app.services.text_response_cache import get_text_response_cache
+from app.services.pattern_cache import get_pattern_cache
+from app.services.session_registry import get_session_registry
+from app.memory.backends import get_memory_backend
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Release state of sessions that went idle without being cleared
+    sessions = get_session_registry()
+    sessions.start()
+    yield
+    await sessions.stop()
+    # Stop preprocessing worker processes
+    shutdown_frame_preprocessor()
+
 
 app = FastAPI(
     title=settings.app_name,
     description="AI-powered emotion analysis and text generation for HeartSpeak",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # CORS
@@ -30,3 +50,23 @@ async def root():
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": settings.app_name}
+
+
+@app.get("/metrics")
+async def metrics():
+    """Upstream LLM scheduling, cache, session and preprocessing queue metrics."""
+    preprocessor = get_frame_preprocessor()
+    return {
+        "llm": get_llm_scheduler().metrics(),
+        "textCache": get_text_response_cache().metrics(),
+        "patternCache": get_pattern_cache().metrics(),
+        "sessions": {
+            **get_session_registry().metrics(),
+            "memoryBytes": get_memory_backend().approx_bytes()
+        },
+        "preprocess": {
+            "pending": preprocessor.pending,
+            "maxPending": preprocessor.max_pending,
+            "restartedWorkers": preprocessor.restarted_workers
+        }
+    }
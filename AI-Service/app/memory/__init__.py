@@ -2,25 +2,23 @@
 Emotion Memory Service for HeartSpeak
 Manages session-based emotion context.
 """
-from typing import Optional, List, Dict, Any
-from datetime import datetime
-from collections import defaultdict
+import time
+from typing import Optional, List, Dict, Any, Tuple
+from app.memory.backends import ALL_ENTRIES, MemoryBackend, get_memory_backend
 
 
 class EmotionMemory:
     """
     Memory system for tracking emotions during calls.
-    Uses session-based in-memory storage.
+    Storage is delegated to a MemoryBackend (in-process or Redis), so every
+    read and write is awaited.
     """
     
-    def __init__(self, window_size: int = 10):
+    def __init__(self, window_size: int = 10, backend: Optional[MemoryBackend] = None):
         self.window_size = window_size
-        # In-memory storage: {call_id: {user_id: [emotion_data]}}
-        self._call_emotions: Dict[str, Dict[str, List[Dict[str, Any]]]] = defaultdict(lambda: defaultdict(list))
-        # Simple context storage per call
-        self._call_context: Dict[str, List[Dict[str, str]]] = defaultdict(list)
+        self.backend = backend or get_memory_backend()
     
-    def add_emotion(
+    async def add_emotion(
         self,
         call_id: str,
         user_id: str,
@@ -34,31 +32,16 @@ class EmotionMemory:
             user_id: The user whose emotion was detected
             emotion_data: Dictionary containing emotion detection results
         """
-        # Add timestamp
-        entry = {
-            **emotion_data,
-            "timestamp": datetime.utcnow().isoformat(),
-            "user_id": user_id
-        }
-        
-        # Store in session
-        self._call_emotions[call_id][user_id].append(entry)
-        
-        # Keep only last N entries per user
-        if len(self._call_emotions[call_id][user_id]) > self.window_size * 2:
-            self._call_emotions[call_id][user_id] = self._call_emotions[call_id][user_id][-self.window_size * 2:]
-        
-        # Store context
-        self._call_context[call_id].append({
-            "user_id": user_id,
-            "emotion": emotion_data.get("dominant", "unknown"),
-            "text": emotion_data.get("text", "")
-        })
-        # Keep context windowed
-        if len(self._call_context[call_id]) > self.window_size:
-            self._call_context[call_id] = self._call_context[call_id][-self.window_size:]
+        # Store in session with an epoch timestamp, keeping the last N entries per user
+        await self.backend.add_emotion(
+            call_id,
+            user_id,
+            emotion_data,
+            timestamp=time.time(),
+            max_entries=self.window_size * 2
+        )
     
-    def get_recent_emotions(
+    async def get_recent_emotions(
         self,
         call_id: str,
         user_id: str,
@@ -70,39 +53,50 @@ class EmotionMemory:
         Returns:
             List of recent dominant emotions
         """
-        emotions = self._call_emotions.get(call_id, {}).get(user_id, [])
-        return [e.get("dominant", "neutral") for e in emotions[-limit:]]
+        return await self.backend.get_dominants(call_id, user_id, limit)
     
-    def get_call_emotions(
+    async def get_last_emotion(
+        self,
+        call_id: str,
+        user_id: str
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Get the most recent emotion entry for a user in a call.
+        
+        Returns:
+            Latest emotion entry or None if nothing is stored
+        """
+        emotions = await self.backend.get_emotions(call_id, user_id, 1)
+        return emotions[-1] if emotions else None
+    
+    async def get_call_emotions(
         self,
         call_id: str,
         user_id: Optional[str] = None,
-        limit: int = 10
+        limit: Optional[int] = 10,
+        since: Optional[float] = None,
+        before: Optional[float] = None
     ) -> List[Dict[str, Any]]:
         """
         Get emotion history for a call.
+        Without a user, every user's history is merged by timestamp.
         
         Args:
             call_id: The call session ID
             user_id: Optional filter by user
-            limit: Maximum number of entries to return
+            limit: Maximum number of entries to return (None for all of them)
+            since: Only entries newer than this epoch time
+            before: Only entries older than this epoch time (the "ts" of the
+                oldest entry of the previous page, to page backwards)
             
         Returns:
-            List of emotion entries
-        """
-        if user_id:
-            emotions = self._call_emotions.get(call_id, {}).get(user_id, [])
-        else:
-            # Get all emotions for the call
-            emotions = []
-            for uid, user_emotions in self._call_emotions.get(call_id, {}).items():
-                emotions.extend(user_emotions)
-            # Sort by timestamp
-            emotions.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
-        
-        return emotions[-limit:]
+            The newest `limit` matching entries, oldest first
+        """
+        if limit is None:
+            limit = ALL_ENTRIES
+        return await self.backend.get_timeline(call_id, limit, user_id=user_id or None, since=since, before=before)
     
-    def get_emotion_summary(
+    async def get_emotion_summary(
         self,
         call_id: str,
         user_id: str
@@ -113,22 +107,17 @@ class EmotionMemory:
         Returns:
             Summary string or None if not enough data
         """
-        emotions = self.get_call_emotions(call_id, user_id, limit=20)
+        # Counts are kept up to date as emotions are added, most frequent first
+        sorted_emotions = await self.get_emotion_counts(call_id, user_id)
+        total = sum(count for _, count in sorted_emotions)
         
-        if len(emotions) < 3:
+        if total < 3:
             return None
         
-        # Count dominant emotions
-        emotion_counts: Dict[str, int] = defaultdict(int)
-        for e in emotions:
-            emotion_counts[e.get("dominant", "unknown")] += 1
-        
         # Find top emotions
-        sorted_emotions = sorted(emotion_counts.items(), key=lambda x: x[1], reverse=True)
         top_emotions = sorted_emotions[:3]
         
         # Generate summary
-        total = sum(emotion_counts.values())
         summary_parts = [
             f"{emotion} ({count/total*100:.0f}%)"
             for emotion, count in top_emotions
@@ -136,7 +125,28 @@ class EmotionMemory:
         
         return f"Main emotions: {', '.join(summary_parts)}"
     
-    def get_context_for_generation(
+    async def get_emotion_counts(
+        self,
+        call_id: str,
+        user_id: str
+    ) -> List[Tuple[str, int]]:
+        """
+        Get how often each dominant emotion occurs in the stored history.
+        
+        Returns:
+            List of (emotion, count), most frequent first
+        """
+        return await self.backend.get_dominant_counts(call_id, user_id)
+    
+    async def get_history_size(
+        self,
+        call_id: str,
+        user_id: str
+    ) -> int:
+        """Get the number of stored emotion entries for a user in a call."""
+        return sum(count for _, count in await self.get_emotion_counts(call_id, user_id))
+    
+    async def get_context_for_generation(
         self,
         call_id: str,
         user_id: str
@@ -147,21 +157,18 @@ class EmotionMemory:
         Returns:
             Context string with recent emotion history
         """
-        emotions = self.get_recent_emotions(call_id, user_id, limit=5)
+        emotions = await self.get_recent_emotions(call_id, user_id, limit=5)
         
         if not emotions:
             return "No previous emotions detected in this call."
         
         return f"Recent emotions in this call: {', '.join(emotions)}"
     
-    def clear_call(self, call_id: str) -> None:
+    async def clear_call(self, call_id: str) -> None:
         """Clear all memory for a call session."""
-        if call_id in self._call_emotions:
-            del self._call_emotions[call_id]
-        if call_id in self._call_context:
-            del self._call_context[call_id]
+        await self.backend.clear_call(call_id)
     
-    def get_emotional_transitions(
+    async def get_emotional_transitions(
         self,
         call_id: str,
         user_id: str
@@ -172,21 +179,7 @@ class EmotionMemory:
         Returns:
             List of transition records
         """
-        emotions = self.get_call_emotions(call_id, user_id, limit=20)
-        
-        transitions = []
-        for i in range(1, len(emotions)):
-            prev_emotion = emotions[i-1].get("dominant")
-            curr_emotion = emotions[i].get("dominant")
-            
-            if prev_emotion != curr_emotion:
-                transitions.append({
-                    "from": prev_emotion,
-                    "to": curr_emotion,
-                    "timestamp": emotions[i].get("timestamp")
-                })
-        
-        return transitions
+        return await self.backend.get_transitions(call_id, user_id)
 
 
 # Singleton instance
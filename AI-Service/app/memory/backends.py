@@ -0,0 +1,383 @@
+"""
+Memory Backends for HeartSpeak.
+Storage behind EmotionMemory and the chains' per-session state: in-process
+for a single worker, or Redis so every worker and replica sees the same calls.
+"""
+import heapq
+import json
+import sys
+from itertools import islice
+from abc import ABC, abstractmethod
+from collections import defaultdict, deque
+from typing import Optional, List, Dict, Any, Tuple, Iterator
+from app.config import settings
+from app.memory.ring_buffer import EmotionRingBuffer, iso_timestamp
+
+
+def _deep_size(obj: Any) -> int:
+    """Size of an object and everything in its containers (strings are not deduplicated)."""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_size(k) + _deep_size(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, deque, set)):
+        size += sum(_deep_size(item) for item in obj)
+    return size
+
+
+ALL_ENTRIES = 2 ** 31  # `limit` that returns a whole history
+
+
+def _newest_first(
+    position: int,
+    buffer: EmotionRingBuffer,
+    since: Optional[float],
+    before: Optional[float]
+) -> Iterator[Tuple[float, int, int]]:
+    """Merge keys (-timestamp, buffer position, index) of a buffer, newest first."""
+    for timestamp, index in buffer.newest_first(since, before):
+        yield -timestamp, position, index
+
+
+class MemoryBackend(ABC):
+    """
+    Storage interface for call emotion history and per-session values.
+    Lists are ordered oldest first and capped at the length given on write.
+    Storage methods are coroutines so network backends never block the event loop.
+    """
+
+    # True when other workers see the same state, so one worker must not delete it on its own
+    shared = False
+
+    def approx_bytes(self) -> Optional[int]:
+        """Approximate memory held in this process, or None if stored elsewhere."""
+        return None
+
+    @abstractmethod
+    async def add_emotion(
+        self,
+        call_id: str,
+        user_id: str,
+        emotion_data: Dict[str, Any],
+        timestamp: float,
+        max_entries: int
+    ) -> None:
+        """Append an emotion entry (epoch timestamp) for a user in a call."""
+
+    @abstractmethod
+    async def get_emotions(self, call_id: str, user_id: str, limit: int) -> List[Dict[str, Any]]:
+        """The newest `limit` emotion entries of a user in a call, oldest first."""
+
+    async def get_dominants(self, call_id: str, user_id: str, limit: int) -> List[str]:
+        """The dominant emotions of the newest `limit` entries, oldest first."""
+        return [e.get("dominant", "neutral") for e in await self.get_emotions(call_id, user_id, limit)]
+
+    async def get_dominant_counts(self, call_id: str, user_id: str) -> List[Tuple[str, int]]:
+        """Dominant emotions of the stored history with their counts, most frequent first."""
+        counts: Dict[str, int] = {}
+        for dominant in await self.get_dominants(call_id, user_id, ALL_ENTRIES):
+            counts[dominant] = counts.get(dominant, 0) + 1
+        return sorted(counts.items(), key=lambda item: item[1], reverse=True)
+
+    async def get_transitions(self, call_id: str, user_id: str) -> List[Dict[str, str]]:
+        """Changes of dominant emotion between consecutive stored entries."""
+        emotions = await self.get_emotions(call_id, user_id, ALL_ENTRIES)
+        return [
+            {"from": previous.get("dominant"), "to": current.get("dominant"), "timestamp": current.get("timestamp")}
+            for previous, current in zip(emotions, emotions[1:])
+            if previous.get("dominant") != current.get("dominant")
+        ]
+
+    @abstractmethod
+    async def get_timeline(
+        self,
+        call_id: str,
+        limit: int,
+        user_id: Optional[str] = None,
+        since: Optional[float] = None,
+        before: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        The newest `limit` entries of a call (or one user in it), oldest first.
+        Entries of several users are merged by timestamp; since and before are
+        exclusive epoch-time bounds.
+        """
+
+    @abstractmethod
+    async def get_call_users(self, call_id: str) -> List[str]:
+        """IDs of the users with emotion history in a call."""
+
+    @abstractmethod
+    async def clear_call(self, call_id: str) -> None:
+        """Delete the emotion history of a call."""
+
+    @abstractmethod
+    async def push_session_value(self, namespace: str, session_id: str, value: Any, max_len: int) -> None:
+        """Append a value to a session's list in a namespace (e.g. "texts")."""
+
+    @abstractmethod
+    async def get_session_values(self, namespace: str, session_id: str) -> List[Any]:
+        """All values of a session's list, oldest first."""
+
+    @abstractmethod
+    async def clear_session_values(self, namespace: str, session_id: str) -> None:
+        """Delete a session's list."""
+
+
+class LocalMemoryBackend(MemoryBackend):
+    """In-process storage; state is only visible to the worker that wrote it."""
+
+    def __init__(self):
+        # {call_id: {user_id: ring buffer of emotion entries}}
+        self._call_emotions: Dict[str, Dict[str, EmotionRingBuffer]] = defaultdict(dict)
+        # {namespace: {session_id: deque of values}}
+        self._session_values: Dict[str, Dict[str, deque]] = defaultdict(dict)
+
+    async def add_emotion(
+        self,
+        call_id: str,
+        user_id: str,
+        emotion_data: Dict[str, Any],
+        timestamp: float,
+        max_entries: int
+    ) -> None:
+        users = self._call_emotions[call_id]
+        buffer = users.get(user_id)
+        if buffer is None:
+            buffer = users[user_id] = EmotionRingBuffer(max_entries)
+        buffer.append(emotion_data, timestamp)
+
+    def approx_bytes(self) -> Optional[int]:
+        size = sys.getsizeof(self._call_emotions) + _deep_size(self._session_values)
+        for users in self._call_emotions.values():
+            size += sys.getsizeof(users) + sum(buffer.nbytes() for buffer in users.values())
+        return size
+
+    def _buffer(self, call_id: str, user_id: str) -> Optional[EmotionRingBuffer]:
+        users = self._call_emotions.get(call_id)
+        return users.get(user_id) if users else None
+
+    async def get_emotions(self, call_id: str, user_id: str, limit: int) -> List[Dict[str, Any]]:
+        buffer = self._buffer(call_id, user_id)
+        if buffer is None or limit <= 0:
+            return []
+        return buffer.entries(user_id, limit)
+
+    async def get_dominants(self, call_id: str, user_id: str, limit: int) -> List[str]:
+        buffer = self._buffer(call_id, user_id)
+        if buffer is None or limit <= 0:
+            return []
+        count = min(limit, len(buffer))
+        return [buffer.dominant(i) for i in range(len(buffer) - count, len(buffer))]
+
+    async def get_dominant_counts(self, call_id: str, user_id: str) -> List[Tuple[str, int]]:
+        buffer = self._buffer(call_id, user_id)
+        return list(buffer.ranked_counts()) if buffer is not None else []
+
+    async def get_transitions(self, call_id: str, user_id: str) -> List[Dict[str, str]]:
+        buffer = self._buffer(call_id, user_id)
+        return [dict(t) for t in buffer.transitions()] if buffer is not None else []
+
+    async def get_timeline(
+        self,
+        call_id: str,
+        limit: int,
+        user_id: Optional[str] = None,
+        since: Optional[float] = None,
+        before: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        users = self._call_emotions.get(call_id, {})
+        if user_id is not None:
+            users = {user_id: users[user_id]} if user_id in users else {}
+        if not users or limit <= 0:
+            return []
+
+        # Lazy k-way merge of the per-user newest-first walks; only `limit` entries are visited
+        buffers = list(users.items())
+        walks = [
+            _newest_first(position, buffer, since, before)
+            for position, (_, buffer) in enumerate(buffers)
+        ]
+        newest = list(islice(heapq.merge(*walks), limit))
+
+        return [buffers[position][1].entry(index, buffers[position][0]) for _, position, index in reversed(newest)]
+
+    async def get_call_users(self, call_id: str) -> List[str]:
+        return list(self._call_emotions.get(call_id, {}))
+
+    async def clear_call(self, call_id: str) -> None:
+        self._call_emotions.pop(call_id, None)
+
+    async def push_session_value(self, namespace: str, session_id: str, value: Any, max_len: int) -> None:
+        sessions = self._session_values[namespace]
+        if session_id not in sessions:
+            sessions[session_id] = deque(maxlen=max_len)
+        sessions[session_id].append(value)
+
+    async def get_session_values(self, namespace: str, session_id: str) -> List[Any]:
+        return list(self._session_values[namespace].get(session_id, ()))
+
+    async def clear_session_values(self, namespace: str, session_id: str) -> None:
+        self._session_values[namespace].pop(session_id, None)
+
+
+class RedisMemoryBackend(MemoryBackend):
+    """
+    Redis storage shared by every worker: capped lists (RPUSH + LTRIM) of JSON
+    entries, written in one pipeline per call and expired after MEMORY_TTL_SECONDS
+    so abandoned calls don't accumulate. Uses the asyncio Redis client.
+    """
+
+    shared = True
+
+    def __init__(
+        self,
+        client: Optional[Any] = None,
+        key_prefix: Optional[str] = None,
+        ttl_seconds: Optional[int] = None
+    ):
+        """
+        Args:
+            client: asyncio Redis-compatible client (e.g. fakeredis.aioredis.FakeRedis
+                in tests); one is created from REDIS_URL when omitted
+            key_prefix: Prefix of every key
+            ttl_seconds: Expiry refreshed on every write (0 = never expire)
+        """
+        if client is None:
+            import redis.asyncio as redis
+            client = redis.Redis.from_url(settings.redis_url)
+        self.client = client
+        self.key_prefix = key_prefix if key_prefix is not None else settings.memory_key_prefix
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.memory_ttl_seconds
+
+    def _emotions_key(self, call_id: str, user_id: str) -> str:
+        return f"{self.key_prefix}call:{call_id}:emotions:{user_id}"
+
+    def _users_key(self, call_id: str) -> str:
+        return f"{self.key_prefix}call:{call_id}:users"
+
+    def _session_key(self, namespace: str, session_id: str) -> str:
+        return f"{self.key_prefix}session:{namespace}:{session_id}"
+
+    @staticmethod
+    def _decode(values: List[Any]) -> List[Any]:
+        return [json.loads(v) for v in values]
+
+    def _push(self, pipe: Any, key: str, value: Any, max_len: int) -> None:
+        """Queue a capped append (and expiry refresh) on a pipeline."""
+        pipe.rpush(key, json.dumps(value))
+        pipe.ltrim(key, -max_len, -1)
+        if self.ttl_seconds > 0:
+            pipe.expire(key, self.ttl_seconds)
+
+    async def add_emotion(
+        self,
+        call_id: str,
+        user_id: str,
+        emotion_data: Dict[str, Any],
+        timestamp: float,
+        max_entries: int
+    ) -> None:
+        users_key = self._users_key(call_id)
+        pipe = self.client.pipeline(transaction=False)
+        self._push(pipe, self._emotions_key(call_id, user_id), {**emotion_data, "ts": timestamp}, max_entries)
+        pipe.sadd(users_key, user_id)
+        if self.ttl_seconds > 0:
+            pipe.expire(users_key, self.ttl_seconds)
+        await pipe.execute()
+
+    async def get_emotions(self, call_id: str, user_id: str, limit: int) -> List[Dict[str, Any]]:
+        if limit <= 0:
+            return []
+        entries = self._decode(await self.client.lrange(self._emotions_key(call_id, user_id), -limit, -1))
+        return [self._materialize(entry, user_id) for entry in entries]
+
+    @staticmethod
+    def _materialize(entry: Dict[str, Any], user_id: str) -> Dict[str, Any]:
+        """Add the API's ISO timestamp and user ID to a stored entry."""
+        entry["timestamp"] = iso_timestamp(entry["ts"])
+        entry["user_id"] = user_id
+        return entry
+
+    async def get_timeline(
+        self,
+        call_id: str,
+        limit: int,
+        user_id: Optional[str] = None,
+        since: Optional[float] = None,
+        before: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        if limit <= 0:
+            return []
+        user_ids = [user_id] if user_id is not None else await self.get_call_users(call_id)
+
+        # One round trip for every user's list
+        pipe = self.client.pipeline(transaction=False)
+        for uid in user_ids:
+            pipe.lrange(self._emotions_key(call_id, uid), 0, -1)
+        walks = [
+            [
+                (-entry["ts"], position, entry)
+                for entry in reversed(self._decode(values))
+                if before is None or entry["ts"] < before
+            ]
+            for position, values in enumerate(await pipe.execute())
+        ]
+        newest = []
+        for negative_ts, position, entry in heapq.merge(*walks, key=lambda item: item[:2]):
+            if since is not None and -negative_ts <= since:
+                break
+            newest.append(self._materialize(entry, user_ids[position]))
+            if len(newest) == limit:
+                break
+        return newest[::-1]
+
+    async def get_call_users(self, call_id: str) -> List[str]:
+        return [
+            u.decode() if isinstance(u, bytes) else u
+            for u in await self.client.smembers(self._users_key(call_id))
+        ]
+
+    async def clear_call(self, call_id: str) -> None:
+        keys = [self._emotions_key(call_id, u) for u in await self.get_call_users(call_id)]
+        await self.client.delete(self._users_key(call_id), *keys)
+
+    async def push_session_value(self, namespace: str, session_id: str, value: Any, max_len: int) -> None:
+        pipe = self.client.pipeline(transaction=False)
+        self._push(pipe, self._session_key(namespace, session_id), value, max_len)
+        await pipe.execute()
+
+    async def get_session_values(self, namespace: str, session_id: str) -> List[Any]:
+        return self._decode(await self.client.lrange(self._session_key(namespace, session_id), 0, -1))
+
+    async def clear_session_values(self, namespace: str, session_id: str) -> None:
+        await self.client.delete(self._session_key(namespace, session_id))
+
+
+def create_memory_backend(name: Optional[str] = None) -> MemoryBackend:
+    """
+    Create the backend selected by MEMORY_BACKEND.
+
+    Args:
+        name: "local" or "redis" (defaults to settings.memory_backend)
+
+    Returns:
+        A new MemoryBackend
+    """
+    name = (name or settings.memory_backend).lower()
+    if name == "redis":
+        return RedisMemoryBackend()
+    if name != "local":
+        print(f"Unknown memory backend '{name}', using local")
+    return LocalMemoryBackend()
+
+
+# Singleton instance
+_memory_backend: Optional[MemoryBackend] = None
+
+
+def get_memory_backend() -> MemoryBackend:
+    """Get the singleton memory backend."""
+    global _memory_backend
+    if _memory_backend is None:
+        _memory_backend = create_memory_backend()
+    return _memory_backend
@@ -0,0 +1,243 @@
+"""
+Compact Emotion History Storage for HeartSpeak.
+Fixed-size ring buffers of emotion entries: labels as interned small ints,
+scores as float32 and timestamps as epoch floats in preallocated arrays.
+Dicts are only built when history is read. Per-label counts and the
+transition list are updated on every append (and eviction), so summaries
+never rescan the history.
+"""
+import sys
+from array import array
+from collections import deque
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List, Tuple, Iterator
+
+
+NUANCE_KEYS = ("eyeContact", "mouthExpression", "eyebrowPosition", "overallTension")
+
+
+def iso_timestamp(epoch: float) -> str:
+    """Epoch seconds as the naive UTC ISO string the API has always returned."""
+    return datetime.fromtimestamp(epoch, timezone.utc).replace(tzinfo=None).isoformat()
+
+
+class LabelTable:
+    """
+    Interns emotion labels as small ints shared by every buffer.
+    Labels are normalised (trimmed, lower case, length-capped) before
+    interning so free-form LLM labels collapse into fewer entries. Once the
+    table is full, new labels map to "unknown" (always code 0).
+    """
+
+    MAX_LABELS = 4096  # Codes are stored as unsigned shorts; the table is process-wide and never shrinks
+    MAX_LABEL_LENGTH = 32
+    UNKNOWN = 0
+
+    def __init__(self, max_labels: int = MAX_LABELS):
+        self.max_labels = max_labels
+        self._codes: Dict[str, int] = {"unknown": self.UNKNOWN}
+        self._labels: List[str] = ["unknown"]
+
+    @classmethod
+    def normalize(cls, label: Any) -> str:
+        """Canonical form of a label; empty and non-string labels become "unknown"."""
+        if not isinstance(label, str):
+            return "unknown"
+        label = " ".join(label.split()).lower()[:cls.MAX_LABEL_LENGTH]
+        return label or "unknown"
+
+    def code(self, label: Any) -> int:
+        """Code of a label, assigned on first use."""
+        label = self.normalize(label)
+        code = self._codes.get(label)
+        if code is None:
+            if len(self._labels) >= self.max_labels:
+                return self.UNKNOWN
+            code = len(self._labels)
+            self._codes[label] = code
+            self._labels.append(label)
+        return code
+
+    def label(self, code: int) -> str:
+        return self._labels[code]
+
+    def __len__(self) -> int:
+        return len(self._labels)
+
+
+labels = LabelTable()
+
+
+class EmotionRingBuffer:
+    """
+    The last `capacity` emotion entries of one user in one call.
+    Appending overwrites the oldest slot in place, so a full buffer allocates
+    nothing per frame beyond the label tuple.
+    """
+
+    __slots__ = (
+        "capacity", "_start", "_size", "_appended",
+        "_dominant", "_confidence", "_intensity", "_timestamp",
+        "_emotions", "_nuances", "_texts",
+        "_counts", "_ranked", "_transitions", "_transition_list",
+    )
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._start = 0
+        self._size = 0
+        self._dominant = array("H", bytes(2 * capacity))
+        self._confidence = array("f", bytes(4 * capacity))
+        self._intensity = array("f", bytes(4 * capacity))
+        self._timestamp = array("d", bytes(8 * capacity))
+        # Variable-length fields: tuples of label codes / nuance values, and text
+        self._emotions: List[Optional[Tuple[int, ...]]] = [None] * capacity
+        self._nuances: List[Optional[Tuple[str, ...]]] = [None] * capacity
+        self._texts: List[str] = [""] * capacity
+
+        # Running aggregates over the stored window
+        self._appended = 0  # Sequence number of the next entry
+        self._counts: Dict[int, int] = {}
+        self._ranked: Optional[List[Tuple[str, int]]] = None  # Cached ranking, rebuilt after a write
+        self._transitions: deque = deque()  # (sequence of the "to" entry, from code, to code, timestamp)
+        self._transition_list: Optional[List[Dict[str, str]]] = None  # Cached materialization
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _slot(self, index: int) -> int:
+        """Physical slot of the index-th oldest entry."""
+        return (self._start + index) % self.capacity
+
+    def append(self, emotion_data: Dict[str, Any], timestamp: float) -> None:
+        """Store one emotion entry, overwriting the oldest when full."""
+        previous = self._dominant[self._slot(self._size - 1)] if self._size else None
+        if self._size < self.capacity:
+            slot = self._slot(self._size)
+            self._size += 1
+        else:
+            slot = self._start
+            self._start = (self._start + 1) % self.capacity
+            self._count(self._dominant[slot], -1)
+
+        emotions = emotion_data.get("emotions") or []
+        if isinstance(emotions, str):
+            emotions = [emotions]
+        nuances = emotion_data.get("nuances") or {}
+
+        dominant = labels.code(emotion_data.get("dominant", "unknown"))
+        self._dominant[slot] = dominant
+        self._confidence[slot] = emotion_data.get("confidence", 0.0)
+        self._intensity[slot] = emotion_data.get("intensity", 0.5)
+        self._timestamp[slot] = timestamp
+        self._emotions[slot] = tuple(labels.code(e) for e in emotions)
+        self._nuances[slot] = tuple(nuances.get(key, "unknown") for key in NUANCE_KEYS)
+        self._texts[slot] = emotion_data.get("text", "")
+
+        self._count(dominant, 1)
+        sequence = self._appended
+        self._appended += 1
+        if previous is not None and previous != dominant:
+            self._transitions.append((sequence, previous, dominant, timestamp))
+        # A transition into the oldest stored entry came from an evicted one
+        oldest = self._appended - self._size
+        while self._transitions and self._transitions[0][0] <= oldest:
+            self._transitions.popleft()
+        self._transition_list = None
+
+    def _count(self, code: int, delta: int) -> None:
+        count = self._counts.get(code, 0) + delta
+        if count > 0:
+            self._counts[code] = count
+        else:
+            self._counts.pop(code, None)
+        self._ranked = None
+
+    def ranked_counts(self) -> List[Tuple[str, int]]:
+        """Dominant emotions with their counts in the window, most frequent first."""
+        if self._ranked is None:
+            self._ranked = sorted(
+                ((labels.label(code), count) for code, count in self._counts.items()),
+                key=lambda item: item[1],
+                reverse=True
+            )
+        return self._ranked
+
+    def transitions(self) -> List[Dict[str, str]]:
+        """Changes of dominant emotion between consecutive stored entries."""
+        if self._transition_list is None:
+            self._transition_list = [
+                {"from": labels.label(previous), "to": labels.label(current), "timestamp": iso_timestamp(timestamp)}
+                for _, previous, current, timestamp in self._transitions
+            ]
+        return self._transition_list
+
+    def dominant(self, index: int) -> str:
+        """Dominant emotion of the index-th oldest entry (negative indexes count from the newest)."""
+        return labels.label(self._dominant[self._slot(index % self._size)])
+
+    def timestamp(self, index: int) -> float:
+        """Epoch timestamp of the index-th oldest entry (negative indexes count from the newest)."""
+        return self._timestamp[self._slot(index % self._size)]
+
+    def entry(self, index: int, user_id: str) -> Dict[str, Any]:
+        """Materialize the index-th oldest entry in the API's dict format."""
+        slot = self._slot(index % self._size)
+        return {
+            "emotions": [labels.label(code) for code in self._emotions[slot]],
+            "dominant": labels.label(self._dominant[slot]),
+            "confidence": round(self._confidence[slot], 4),
+            "intensity": round(self._intensity[slot], 4),
+            "nuances": dict(zip(NUANCE_KEYS, self._nuances[slot])),
+            "text": self._texts[slot],
+            "timestamp": iso_timestamp(self._timestamp[slot]),
+            "ts": self._timestamp[slot],
+            "user_id": user_id,
+        }
+
+    def entries(self, user_id: str, limit: int) -> List[Dict[str, Any]]:
+        """The newest `limit` entries, oldest first."""
+        count = min(limit, self._size)
+        return [self.entry(i, user_id) for i in range(self._size - count, self._size)]
+
+    def newest_first(self, since: Optional[float] = None, before: Optional[float] = None) -> Iterator[Tuple[float, int]]:
+        """
+        Walk entries from newest to oldest.
+
+        Args:
+            since: Stop at entries at or before this epoch time
+            before: Start below this epoch time (found by binary search)
+
+        Yields:
+            (epoch timestamp, index) pairs
+        """
+        high = self._size
+        if before is not None:
+            # Timestamps are appended in order, so the entries before `before` are a prefix
+            low = 0
+            while low < high:
+                middle = (low + high) // 2
+                if self.timestamp(middle) < before:
+                    low = middle + 1
+                else:
+                    high = middle
+
+        for index in range(high - 1, -1, -1):
+            timestamp = self.timestamp(index)
+            if since is not None and timestamp <= since:
+                return
+            yield timestamp, index
+
+    def nbytes(self) -> int:
+        """Approximate memory held by this buffer."""
+        size = sys.getsizeof(self)
+        for arr in (self._dominant, self._confidence, self._intensity, self._timestamp):
+            size += sys.getsizeof(arr)
+        for values in (self._emotions, self._nuances, self._texts, self._counts, self._transitions):
+            size += sys.getsizeof(values)
+        size += len(self._transitions) * sys.getsizeof((0, 0, 0, 0.0))
+        for i in range(self._size):
+            slot = self._slot(i)
+            size += sys.getsizeof(self._emotions[slot]) + sys.getsizeof(self._nuances[slot])
+            size += sys.getsizeof(self._texts[slot])
+        return size
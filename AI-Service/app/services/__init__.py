@@ -1,5 +1,14 @@
 # AI Services
-from app.services.emotion_service import EmotionService
-from app.services.gemini_service import GeminiService
-
+# Imported lazily: preprocessing worker processes load modules from this
+# package and must not pull in the LLM clients behind these services.
 __all__ = ["EmotionService", "GeminiService"]
+
+
+def __getattr__(name):
+    if name == "EmotionService":
+        from app.services.emotion_service import EmotionService
+        return EmotionService
+    if name == "GeminiService":
+        from app.services.gemini_service import GeminiService
+        return GeminiService
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
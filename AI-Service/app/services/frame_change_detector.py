@@ -0,0 +1,131 @@
+"""
+Frame Change Detector for HeartSpeak.
+Detects when a face has not meaningfully changed since the last analyzed frame
+so the LLM calls can be skipped and the previous result reused.
+"""
+import time
+from typing import Optional, Dict, Any
+import numpy as np
+from app.config import settings
+from app.services.frame_preprocessor import METRIC_KEYS
+from app.services.landmark_classifier import LEFT_EYE_OUTER, RIGHT_EYE_OUTER
+
+
+# Metrics that are already ratios; the others are image distances
+SCALE_FREE_METRICS = np.array([key == "mouthAspectRatio" for key in METRIC_KEYS])
+
+
+class FrameSignature:
+    """Face geometry of the last frame that went through full analysis."""
+
+    __slots__ = ("metrics", "landmarks", "timestamp")
+
+    def __init__(self, metrics: np.ndarray, landmarks: np.ndarray, timestamp: float):
+        self.metrics = metrics
+        self.landmarks = landmarks
+        self.timestamp = timestamp
+
+
+def _normalize_landmarks(landmarks: np.ndarray) -> np.ndarray:
+    """Remove translation and scale so head position and distance don't count as change."""
+    centered = landmarks - landmarks.mean(axis=0)
+    scale = np.sqrt((centered ** 2).sum(axis=1).mean())
+    return centered / scale if scale > 0 else centered
+
+
+class FrameChangeDetector:
+    """
+    Per-session change detector over face metrics and landmark geometry.
+    The reference frame only moves when a frame is reported as analyzed,
+    so slow drift still adds up to a change eventually.
+    """
+
+    def __init__(
+        self,
+        metric_threshold: Optional[float] = None,
+        landmark_threshold: Optional[float] = None,
+        max_age_seconds: Optional[float] = None
+    ):
+        self.metric_threshold = metric_threshold if metric_threshold is not None else settings.frame_metric_change_threshold
+        self.landmark_threshold = landmark_threshold if landmark_threshold is not None else settings.frame_landmark_change_threshold
+        self.max_age_seconds = max_age_seconds if max_age_seconds is not None else settings.frame_cache_max_age_seconds
+
+        self._signatures: Dict[str, FrameSignature] = {}
+
+    def _build_signature(self, face_info: Dict[str, Any]) -> Optional[FrameSignature]:
+        """Build a signature from preprocessing output, if landmarks are available."""
+        metrics = face_info.get("metrics")
+        landmarks = face_info.get("landmarks")
+        if not metrics or landmarks is None:
+            return None
+
+        landmarks = np.asarray(landmarks, dtype=np.float32)
+        if landmarks.shape[0] <= max(LEFT_EYE_OUTER, RIGHT_EYE_OUTER):
+            return None
+
+        # Express distance metrics in inter-ocular distances so their deltas
+        # don't depend on face size and stay meaningful near zero (closed mouth)
+        iod = max(float(np.linalg.norm(landmarks[LEFT_EYE_OUTER, :2] - landmarks[RIGHT_EYE_OUTER, :2])), 1e-6)
+        values = np.array([metrics.get(k, 0.0) for k in METRIC_KEYS], dtype=np.float32)
+        values = np.where(SCALE_FREE_METRICS, values, values / iod)
+
+        return FrameSignature(
+            metrics=values,
+            landmarks=_normalize_landmarks(landmarks),
+            timestamp=time.monotonic()
+        )
+
+    def is_unchanged(self, session_id: str, face_info: Dict[str, Any]) -> bool:
+        """
+        Check whether a frame is a near-duplicate of the session's last analyzed frame.
+
+        Args:
+            session_id: The call/user session ID
+            face_info: Preprocessing output with "metrics" and "landmarks"
+
+        Returns:
+            True if the previous result can be reused
+        """
+        reference = self._signatures.get(session_id)
+        if reference is None:
+            return False
+
+        if time.monotonic() - reference.timestamp > self.max_age_seconds:
+            return False
+
+        current = self._build_signature(face_info)
+        if current is None or current.landmarks.shape != reference.landmarks.shape:
+            return False
+
+        # Absolute change of each scalar metric, in inter-ocular distances
+        metric_delta = np.abs(current.metrics - reference.metrics)
+        if float(metric_delta.max()) >= self.metric_threshold:
+            return False
+
+        # Mean per-landmark displacement in normalized face space
+        landmark_delta = np.linalg.norm(current.landmarks - reference.landmarks, axis=1).mean()
+        return float(landmark_delta) < self.landmark_threshold
+
+    def update(self, session_id: str, face_info: Dict[str, Any]) -> None:
+        """Record the frame that was just fully analyzed as the session reference."""
+        signature = self._build_signature(face_info)
+        if signature is None:
+            self._signatures.pop(session_id, None)
+        else:
+            self._signatures[session_id] = signature
+
+    def clear_session(self, session_id: str) -> None:
+        """Forget the reference frame for a session."""
+        self._signatures.pop(session_id, None)
+
+
+# Singleton instance
+_frame_change_detector: Optional[FrameChangeDetector] = None
+
+
+def get_frame_change_detector() -> FrameChangeDetector:
+    """Get the singleton frame change detector."""
+    global _frame_change_detector
+    if _frame_change_detector is None:
+        _frame_change_detector = FrameChangeDetector()
+    return _frame_change_detector
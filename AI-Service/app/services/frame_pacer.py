@@ -0,0 +1,89 @@
+"""
+Frame Pacer for HeartSpeak.
+Computes how long a client should wait before sending the next frame of a call,
+so frame volume drops when the service is busy or the face is static.
+"""
+from typing import Optional
+from app.config import settings
+from app.memory import get_emotion_memory
+
+
+class FramePacer:
+    """
+    Per-session frame interval hints based on emotional volatility,
+    preprocessing queue depth and upstream LLM latency.
+    """
+
+    def __init__(self, latency_smoothing: float = 0.2):
+        self.latency_smoothing = latency_smoothing
+        self.memory = get_emotion_memory()
+
+        # Exponentially weighted moving average of LLM round trips
+        self._llm_latency_ms: Optional[float] = None
+
+    def record_llm_latency(self, seconds: float) -> None:
+        """Record the duration of one upstream LLM call."""
+        latency_ms = seconds * 1000
+        if self._llm_latency_ms is None:
+            self._llm_latency_ms = latency_ms
+        else:
+            self._llm_latency_ms += self.latency_smoothing * (latency_ms - self._llm_latency_ms)
+
+    @property
+    def llm_latency_ms(self) -> Optional[float]:
+        """Smoothed upstream LLM latency, if any call has been recorded."""
+        return self._llm_latency_ms
+
+    async def next_frame_after_ms(
+        self,
+        call_id: Optional[str],
+        user_id: str,
+        queue_depth: int = 0,
+        queue_capacity: int = 1
+    ) -> int:
+        """
+        Suggest the delay before the session's next frame.
+
+        Args:
+            call_id: The call session ID (no history is used without one)
+            user_id: The user whose frames are being analyzed
+            queue_depth: Frames currently waiting for preprocessing
+            queue_capacity: Maximum frames that may wait for preprocessing
+
+        Returns:
+            Suggested delay in milliseconds
+        """
+        interval = float(settings.frame_interval_base_ms)
+
+        # Stable emotions need fewer frames; frequent changes need more
+        if call_id:
+            history_size = await self.memory.get_history_size(call_id, user_id)
+            if history_size >= 5:
+                transitions = await self.memory.get_emotional_transitions(call_id, user_id)
+                transition_rate = len(transitions) / (history_size - 1)
+                if transition_rate < 0.1:
+                    interval *= 2
+                elif transition_rate > 0.4:
+                    interval *= 0.67
+
+        # Back off as the preprocessing queue fills up
+        load = min(queue_depth / max(queue_capacity, 1), 1.0)
+        interval *= 1 + 3 * load
+
+        # Frames sent faster than the LLM answers only pile up
+        if self._llm_latency_ms is not None:
+            interval = max(interval, self._llm_latency_ms * 1.2)
+
+        return int(min(max(interval, settings.frame_interval_min_ms), settings.frame_interval_max_ms))
+
+
+# Singleton instance
+_frame_pacer: Optional[FramePacer] = None
+
+
+def get_frame_pacer() -> FramePacer:
+    """Get the singleton frame pacer."""
+    global _frame_pacer
+    if _frame_pacer is None:
+        _frame_pacer = FramePacer()
+    return _frame_pacer
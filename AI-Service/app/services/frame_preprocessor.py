@@ -0,0 +1,460 @@
+"""
+Frame Preprocessing Pool for HeartSpeak.
+Shared vision preprocessing for every MediaPipe consumer: face detection and
+landmark extraction run in worker processes (one graph set per worker) so
+CPU-bound preprocessing never blocks the event loop, and face metrics are
+computed from landmark arrays in one vectorized function.
+"""
+import asyncio
+import multiprocessing
+import os
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Dict, Any, List, Tuple
+import numpy as np
+from app.config import settings
+
+
+# Per-worker MediaPipe graphs, created once by the pool initializer
+_face_mesh = None
+_face_detection = None
+
+# Per-worker video-mode face meshes keyed by session, least recently used first:
+# {session_id: (face_mesh, last_used)}
+_trackers: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+
+
+class PreprocessQueueFullError(Exception):
+    """Raised when the preprocessing queue has no free slots."""
+    pass
+
+
+def _init_worker() -> None:
+    """Create one MediaPipe graph set for this worker process."""
+    global _face_mesh, _face_detection
+    import mediapipe as mp
+
+    _face_mesh = mp.solutions.face_mesh.FaceMesh(
+        static_image_mode=True,
+        max_num_faces=1,
+        refine_landmarks=True,
+        min_detection_confidence=0.5,
+        min_tracking_confidence=0.5
+    )
+
+    _face_detection = mp.solutions.face_detection.FaceDetection(
+        model_selection=1,
+        min_detection_confidence=0.5
+    )
+
+
+def _get_tracker(session_id: str):
+    """
+    Get the video-mode face mesh for a session, creating it if needed.
+    Idle trackers and the least recently used ones beyond the cap are closed.
+    """
+    import mediapipe as mp
+
+    now = time.monotonic()
+
+    # Evict idle trackers, oldest first
+    while _trackers:
+        oldest_id, (oldest_mesh, last_used) = next(iter(_trackers.items()))
+        if now - last_used < settings.tracker_idle_seconds:
+            break
+        _trackers.popitem(last=False)
+        oldest_mesh.close()
+
+    if session_id in _trackers:
+        face_mesh, _ = _trackers.pop(session_id)
+    else:
+        face_mesh = mp.solutions.face_mesh.FaceMesh(
+            static_image_mode=False,
+            max_num_faces=1,
+            refine_landmarks=True,
+            min_detection_confidence=0.5,
+            min_tracking_confidence=0.5
+        )
+        while len(_trackers) >= settings.tracker_max_sessions_per_worker:
+            _, (evicted_mesh, _) = _trackers.popitem(last=False)
+            evicted_mesh.close()
+
+    _trackers[session_id] = (face_mesh, now)
+    return face_mesh
+
+
+def release_tracker(session_id: str) -> None:
+    """Close a session's video-mode face mesh. Executed inside a pool worker."""
+    entry = _trackers.pop(session_id, None)
+    if entry is not None:
+        entry[0].close()
+
+
+# Landmark indices used by the face metrics
+LEFT_EYE_TOP, LEFT_EYE_BOTTOM = 159, 145
+RIGHT_EYE_TOP, RIGHT_EYE_BOTTOM = 386, 374
+MOUTH_TOP, MOUTH_BOTTOM, MOUTH_LEFT, MOUTH_RIGHT = 13, 14, 61, 291
+LEFT_EYEBROW, RIGHT_EYEBROW = 105, 334
+
+METRIC_KEYS = ("eyeOpenness", "mouthOpenness", "mouthWidth", "eyebrowHeight", "mouthAspectRatio")
+
+def face_metrics_array(landmarks: np.ndarray) -> np.ndarray:
+    """
+    Vectorized facial metrics that indicate emotions.
+
+    Args:
+        landmarks: Array of shape (..., N, 3) with normalized landmark coordinates
+
+    Returns:
+        Array of shape (..., len(METRIC_KEYS)) in METRIC_KEYS order
+    """
+    x = landmarks[..., 0]
+    y = landmarks[..., 1]
+
+    eye_openness = (
+        np.abs(y[..., LEFT_EYE_TOP] - y[..., LEFT_EYE_BOTTOM])
+        + np.abs(y[..., RIGHT_EYE_TOP] - y[..., RIGHT_EYE_BOTTOM])
+    ) / 2
+    mouth_openness = np.abs(y[..., MOUTH_TOP] - y[..., MOUTH_BOTTOM])
+    mouth_width = np.abs(x[..., MOUTH_LEFT] - x[..., MOUTH_RIGHT])
+    eyebrow_height = (
+        np.abs(y[..., LEFT_EYEBROW] - y[..., LEFT_EYE_TOP])
+        + np.abs(y[..., RIGHT_EYEBROW] - y[..., RIGHT_EYE_TOP])
+    ) / 2
+    mouth_aspect_ratio = np.divide(
+        mouth_openness,
+        mouth_width,
+        out=np.zeros_like(mouth_openness),
+        where=mouth_width > 0
+    )
+
+    return np.stack([eye_openness, mouth_openness, mouth_width, eyebrow_height, mouth_aspect_ratio], axis=-1)
+
+
+def calculate_face_metrics(landmarks: np.ndarray) -> Dict[str, float]:
+    """Facial metrics for a single face, keyed by METRIC_KEYS."""
+    return dict(zip(METRIC_KEYS, face_metrics_array(landmarks).tolist()))
+
+
+def prepare_llm_image(
+    image,
+    face_box: Optional[Tuple[float, float, float, float]] = None,
+    max_edge: Optional[int] = None,
+    jpeg_quality: Optional[int] = None,
+    margin: Optional[float] = None
+) -> bytes:
+    """
+    Crop a BGR image to the face plus a margin, downscale it and re-encode it as JPEG
+    so the vision model receives a small upload.
+
+    Args:
+        image: BGR image array
+        face_box: Relative (xmin, ymin, width, height) face box, or None to keep the full frame
+        max_edge: Longest edge in pixels after resizing
+        jpeg_quality: JPEG quality (0-100)
+        margin: Extra context around the face box, as a fraction of its size
+
+    Returns:
+        Encoded JPEG bytes
+    """
+    import cv2
+
+    max_edge = max_edge or settings.llm_image_max_edge
+    jpeg_quality = jpeg_quality or settings.llm_image_jpeg_quality
+    margin = settings.llm_image_face_margin if margin is None else margin
+
+    h, w = image.shape[:2]
+
+    if face_box is not None:
+        xmin, ymin, box_w, box_h = face_box
+        x0 = int(max((xmin - box_w * margin) * w, 0))
+        y0 = int(max((ymin - box_h * margin) * h, 0))
+        x1 = int(min((xmin + box_w * (1 + margin)) * w, w))
+        y1 = int(min((ymin + box_h * (1 + margin)) * h, h))
+        if x1 > x0 and y1 > y0:
+            image = image[y0:y1, x0:x1]
+            h, w = image.shape[:2]
+
+    scale = max_edge / max(h, w)
+    if scale < 1:
+        image = cv2.resize(image, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+
+    ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+    if not ok:
+        raise ValueError("Failed to encode image for the vision model")
+    return encoded.tobytes()
+
+
+def _mesh_face_box(landmarks: np.ndarray) -> Tuple[float, Tuple[float, float, float, float]]:
+    """
+    Face confidence and relative bounding box from the mesh alone.
+    Confidence is the share of landmarks that fall inside the frame, so
+    faces cut off by the frame edge score lower.
+    """
+    xy = landmarks[:, :2]
+    inside = np.all((xy >= 0) & (xy <= 1), axis=1)
+    lo = np.clip(xy.min(axis=0), 0, 1)
+    hi = np.clip(xy.max(axis=0), 0, 1)
+    return float(inside.mean()), (float(lo[0]), float(lo[1]), float(hi[0] - lo[0]), float(hi[1] - lo[1]))
+
+
+def preprocess_image_bytes(
+    image_bytes: bytes,
+    session_id: Optional[str] = None
+) -> Tuple[bool, Dict[str, Any]]:
+    """
+    Decode an encoded image and run MediaPipe face detection and landmark extraction.
+    Executed inside a pool worker. Frames with a session_id use that session's
+    video-mode face mesh, which tracks landmarks from the previous frame
+    instead of detecting them from scratch.
+
+    Returns:
+        Tuple of (face_detected: bool, face_info: dict)
+    """
+    import cv2
+
+    nparr = np.frombuffer(image_bytes, np.uint8)
+    image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+    if image is None:
+        return False, {"error": "Invalid image data"}
+
+    # Convert to RGB for MediaPipe
+    rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+    mode = settings.preprocess_detection_mode
+    detection = None
+
+    # Run face detection, unless the mesh alone decides whether there is a face
+    if mode != "mesh_only":
+        detection_input = rgb_image
+        if mode == "gated":
+            # Detection is only a presence gate here, so a small copy is enough
+            h, w = rgb_image.shape[:2]
+            scale = settings.detection_gate_max_edge / max(h, w)
+            if scale < 1:
+                detection_input = cv2.resize(
+                    rgb_image, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA
+                )
+
+        detection_results = _face_detection.process(detection_input)
+
+        if not detection_results.detections:
+            return False, {"error": "No face detected"}
+
+        detection = detection_results.detections[0]
+
+    # Run face mesh for landmarks
+    if session_id and settings.tracking_enabled:
+        mesh_results = _get_tracker(session_id).process(rgb_image)
+    else:
+        mesh_results = _face_mesh.process(rgb_image)
+
+    landmarks = None
+    if mesh_results.multi_face_landmarks:
+        # Landmark geometry as an (N, 3) array; all metrics are computed from it
+        landmarks = np.array(
+            [(lm.x, lm.y, lm.z) for lm in mesh_results.multi_face_landmarks[0].landmark],
+            dtype=np.float32
+        )
+
+    if detection is not None:
+        box = detection.location_data.relative_bounding_box
+        confidence = float(detection.score[0])
+        face_box = (box.xmin, box.ymin, box.width, box.height)
+    elif landmarks is not None:
+        confidence, face_box = _mesh_face_box(landmarks)
+    else:
+        return False, {"error": "No face detected"}
+
+    face_info = {
+        "detected": True,
+        "confidence": confidence,
+        # The vision model's crop is only built if the frame escalates to it
+        "face_box": face_box,
+    }
+
+    if landmarks is not None:
+        face_info["landmarks"] = landmarks
+        face_info["metrics"] = calculate_face_metrics(landmarks)
+
+    return True, face_info
+
+
+def crop_image_bytes(image_bytes: bytes, face_box: Optional[Tuple[float, float, float, float]]) -> bytes:
+    """Decode an encoded image and build the vision model's face crop. Executed inside a pool worker."""
+    import cv2
+
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Invalid image data")
+    return prepare_llm_image(image, face_box)
+
+
+class FramePreprocessor:
+    """
+    Process pool for CPU-bound frame preprocessing.
+    Each worker owns one MediaPipe graph set; the event loop only awaits results.
+    
+    Workers are single-process shards so that every frame of a session lands
+    on the worker holding that session's tracking graph. Frames without a
+    session go to the least busy shard.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_pending: Optional[int] = None):
+        self.max_workers = max_workers or settings.preprocess_workers or os.cpu_count() or 1
+        self.max_pending = max_pending or settings.preprocess_max_pending or self.max_workers * 4
+
+        self._executors: List[ProcessPoolExecutor] = []
+        self._shard_pending: List[int] = [0] * self.max_workers
+        self._pending = 0
+        self.restarted_workers = 0
+
+    @staticmethod
+    def _new_executor() -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker
+        )
+
+    def _get_executors(self) -> List[ProcessPoolExecutor]:
+        """Start the worker processes on first use."""
+        if not self._executors:
+            self._executors = [self._new_executor() for _ in range(self.max_workers)]
+        return self._executors
+
+    def _replace_executor(self, shard: int, broken: ProcessPoolExecutor) -> None:
+        """
+        Swap a shard's dead worker (crashed or killed) for a fresh one.
+        The tracking graphs it held are lost, so its sessions start over.
+        """
+        if shard < len(self._executors) and self._executors[shard] is broken:
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._executors[shard] = self._new_executor()
+            self.restarted_workers += 1
+            print(f"Preprocessing worker {shard} died and was restarted")
+
+    async def _run(self, shard: int, fn, *args):
+        """Run a function on a shard's worker, restarting the worker and retrying once if it died."""
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            executor = self._get_executors()[shard]
+            try:
+                return await loop.run_in_executor(executor, fn, *args)
+            except BrokenProcessPool:
+                self._replace_executor(shard, executor)
+                if attempt:
+                    raise
+
+    def _shard_for(self, session_id: Optional[str]) -> int:
+        """Pick the worker shard for a frame."""
+        if session_id:
+            return zlib.crc32(session_id.encode("utf-8")) % self.max_workers
+        return min(range(self.max_workers), key=self._shard_pending.__getitem__)
+
+    @property
+    def pending(self) -> int:
+        """Number of frames queued or being processed."""
+        return self._pending
+
+    async def preprocess(
+        self,
+        image_bytes: bytes,
+        session_id: Optional[str] = None
+    ) -> Tuple[bool, Dict[str, Any]]:
+        """
+        Preprocess an encoded frame in the worker pool.
+
+        Args:
+            image_bytes: Encoded (JPEG/PNG) image bytes
+            session_id: Optional call/user session ID for landmark tracking
+
+        Returns:
+            Tuple of (face_detected: bool, face_info: dict)
+
+        Raises:
+            PreprocessQueueFullError: If max_pending frames are already queued
+        """
+        if self._pending >= self.max_pending:
+            raise PreprocessQueueFullError(
+                f"Preprocessing queue is full ({self.max_pending} frames pending)"
+            )
+
+        shard = self._shard_for(session_id)
+
+        self._pending += 1
+        self._shard_pending[shard] += 1
+        try:
+            return await self._run(shard, preprocess_image_bytes, image_bytes, session_id)
+        except BrokenProcessPool:
+            # The frame itself keeps crashing the worker; drop it
+            return False, {"error": "Preprocessing worker crashed"}
+        finally:
+            self._pending -= 1
+            self._shard_pending[shard] -= 1
+
+    async def prepare_llm_image(
+        self,
+        image_bytes: bytes,
+        face_box: Optional[Tuple[float, float, float, float]]
+    ) -> bytes:
+        """
+        Build the downscaled face crop for the vision model in the worker pool.
+        Only called for frames that escalate to the LLM.
+
+        Args:
+            image_bytes: Encoded (JPEG/PNG) image bytes
+            face_box: Relative face box from preprocessing
+
+        Returns:
+            Encoded JPEG bytes
+        """
+        shard = self._shard_for(None)
+
+        self._shard_pending[shard] += 1
+        try:
+            return await self._run(shard, crop_image_bytes, image_bytes, face_box)
+        finally:
+            self._shard_pending[shard] -= 1
+
+    def release_session(self, session_id: str) -> None:
+        """Close a session's tracking graph on its worker (fire and forget)."""
+        if not self._executors:
+            return
+        shard = self._shard_for(session_id)
+        executor = self._executors[shard]
+        try:
+            executor.submit(release_tracker, session_id)
+        except BrokenProcessPool:
+            # A dead worker holds no trackers; replace it for the next frame
+            self._replace_executor(shard, executor)
+        except RuntimeError as e:
+            print(f"Tracker release skipped: {e}")
+
+    def shutdown(self) -> None:
+        """Stop the worker processes."""
+        for executor in self._executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+        self._executors = []
+
+
+# Singleton instance
+_frame_preprocessor: Optional[FramePreprocessor] = None
+
+
+def get_frame_preprocessor() -> FramePreprocessor:
+    """Get the singleton frame preprocessor."""
+    global _frame_preprocessor
+    if _frame_preprocessor is None:
+        _frame_preprocessor = FramePreprocessor()
+    return _frame_preprocessor
+
+
+def shutdown_frame_preprocessor() -> None:
+    """Shut down the singleton frame preprocessor if it was started."""
+    if _frame_preprocessor is not None:
+        _frame_preprocessor.shutdown()
@@ -4,17 +4,17 @@ Handles all Gemini API interactions for emotion analysis and text generation.
 """
 import base64
 from typing import Optional
-import google.generativeai as genai
-from app.config import settings
+from app.services.llm_registry import get_llm_registry
+from app.services.llm_scheduler import LLMPriority
 
 
 class GeminiService:
     """Service for interacting with Google's Gemini API."""
     
     def __init__(self):
-        genai.configure(api_key=settings.gemini_api_key)
-        self.vision_model = genai.GenerativeModel("models/gemini-3-flash-preview")
-        self.text_model = genai.GenerativeModel("models/gemini-3-flash-preview")
+        self.llm_registry = get_llm_registry()
+        self.vision_model = self.llm_registry.generative_model()
+        self.text_model = self.llm_registry.generative_model()
     
     async def analyze_facial_expression(
         self,
@@ -71,7 +71,8 @@ Be accurate and specific. If no face is clearly visible, set confidence below 0.
             prompt += f"\n\nConversation context: {context}"
         
         try:
-            response = await self.vision_model.generate_content_async([prompt, image_part])
+            async with self.llm_registry.slot(LLMPriority.LIVE):
+                response = await self.vision_model.generate_content_async([prompt, image_part])
             result_text = response.text.strip()
             
             # Clean up response (remove markdown if present)
@@ -149,7 +150,8 @@ Guidelines:
         prompt += "\n\nRespond with ONLY the description text, no quotes or extra formatting."
         
         try:
-            response = await self.text_model.generate_content_async(prompt)
+            async with self.llm_registry.slot(LLMPriority.LIVE):
+                response = await self.text_model.generate_content_async(prompt)
             return response.text.strip().strip('"')
         except Exception as e:
             print(f"Text generation error: {e}")
@@ -0,0 +1,59 @@
+"""
+Image Frame buffer for HeartSpeak.
+Holds an encoded image decoded once, shared by preprocessing and the LLM chains.
+"""
+import base64
+from typing import Optional, Union
+
+
+class ImageFrame:
+    """
+    Encoded (JPEG/PNG) image bytes decoded once per request.
+    Preprocessing and the LLM chains share the decoded bytes; the base64
+    data URL is only built if a chain actually sends the image.
+    """
+
+    __slots__ = ("_data", "mime_type", "_base64")
+
+    def __init__(self, data: Union[bytes, bytearray, memoryview], mime_type: str = "image/jpeg"):
+        self._data = data
+        self.mime_type = mime_type
+        self._base64: Optional[str] = None
+
+    @classmethod
+    def from_base64(cls, image_base64: str, mime_type: str = "image/jpeg") -> "ImageFrame":
+        """
+        Decode a base64 string, with or without a data URI prefix.
+        The prefix's MIME type wins over mime_type when present.
+        """
+        comma = image_base64.find(",")
+        if comma != -1:
+            header = image_base64[:comma]
+            if header.startswith("data:") and ";" in header:
+                mime_type = header[5:header.index(";")] or mime_type
+            image_base64 = image_base64[comma + 1:]
+
+        frame = cls(base64.b64decode(image_base64), mime_type)
+        frame._base64 = image_base64
+        return frame
+
+    @property
+    def data(self) -> bytes:
+        """Encoded image bytes (copies only if the buffer isn't already bytes)."""
+        if isinstance(self._data, bytes):
+            return self._data
+        return bytes(self._data)
+
+    @property
+    def base64(self) -> str:
+        """Base64 encoding of the image, computed on first use."""
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self._data).decode("ascii")
+        return self._base64
+
+    def data_url(self) -> str:
+        """Data URL for LLM image content."""
+        return f"data:{self.mime_type};base64,{self.base64}"
+
+    def __len__(self) -> int:
+        return len(self._data)
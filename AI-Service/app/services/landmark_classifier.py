@@ -0,0 +1,236 @@
+"""
+Landmark Emotion Classifier for HeartSpeak.
+Fast on-CPU emotion classification from MediaPipe face mesh geometry,
+used before escalating a frame to Gemini Vision.
+"""
+from typing import Optional, Dict, Any, List
+import numpy as np
+from app.config import settings
+
+
+# MediaPipe face mesh landmark indices
+LEFT_EYE_OUTER, LEFT_EYE_INNER, LEFT_EYE_TOP, LEFT_EYE_BOTTOM = 33, 133, 159, 145
+RIGHT_EYE_OUTER, RIGHT_EYE_INNER, RIGHT_EYE_TOP, RIGHT_EYE_BOTTOM = 263, 362, 386, 374
+MOUTH_LEFT, MOUTH_RIGHT, MOUTH_TOP, MOUTH_BOTTOM = 61, 291, 13, 14
+LEFT_BROW_OUTER, LEFT_BROW_MID, LEFT_BROW_INNER = 70, 105, 107
+RIGHT_BROW_OUTER, RIGHT_BROW_MID, RIGHT_BROW_INNER = 300, 334, 336
+LEFT_IRIS, RIGHT_IRIS = 468, 473  # Only present with refine_landmarks=True
+
+FEATURE_NAMES = (
+    "mouthOpen",
+    "mouthWidth",
+    "smile",
+    "eyeOpen",
+    "browRaise",
+    "browGap",
+    "browInnerRaise",
+)
+
+# Default model: a hand-set multinomial logistic prior over standardized features.
+# It is untrained and its confidence is uncalibrated, which is why the classifier
+# is off by default; supply trained weights via LOCAL_CLASSIFIER_WEIGHTS (see
+# load_weights) and check them on labelled frames before enabling it.
+DEFAULT_CLASSES = ("neutral", "happy", "surprised", "sad", "angry")
+
+# Approximate mean/std of each feature on a relaxed frontal face,
+# in units of inter-ocular distance
+DEFAULT_MEAN = np.array([0.03, 0.55, 0.02, 0.10, 0.22, 0.28, 0.01], dtype=np.float32)
+DEFAULT_STD = np.array([0.04, 0.06, 0.03, 0.03, 0.04, 0.04, 0.02], dtype=np.float32)
+
+# Rows follow DEFAULT_CLASSES, columns follow FEATURE_NAMES
+DEFAULT_WEIGHTS = np.array([
+    #  open   width  smile  eye   brow   gap   inner
+    [-0.6,  -0.3,  -0.3,  0.0,  -0.3,  0.0,  -0.3],  # neutral
+    [ 0.2,   1.5,   2.5,  -0.4,  0.0,  0.0,   0.0],  # happy
+    [ 2.0,  -0.5,   0.0,  1.5,   2.0,  0.0,   0.5],  # surprised
+    [-0.5,  -0.5,  -2.0,  -0.5,  0.0,  0.0,   1.8],  # sad
+    [ 0.0,   0.0,  -0.8,  0.5,  -1.5, -2.0,  -0.5],  # angry
+], dtype=np.float32)
+DEFAULT_BIAS = np.array([1.5, -1.0, -1.5, -1.5, -1.5], dtype=np.float32)
+
+
+def extract_landmark_features(landmarks: np.ndarray) -> np.ndarray:
+    """
+    Compute scale-invariant geometric features from face mesh landmarks.
+
+    Args:
+        landmarks: Array of shape (..., N, 3) with normalized landmark coordinates
+
+    Returns:
+        Array of shape (..., len(FEATURE_NAMES))
+    """
+    lm = np.asarray(landmarks, dtype=np.float32)[..., :2]
+
+    def dist(a: int, b: int) -> np.ndarray:
+        return np.linalg.norm(lm[..., a, :] - lm[..., b, :], axis=-1)
+
+    def y(i: int) -> np.ndarray:
+        return lm[..., i, 1]
+
+    # Inter-ocular distance makes every feature independent of face size
+    iod = np.maximum(dist(LEFT_EYE_OUTER, RIGHT_EYE_OUTER), 1e-6)
+
+    mouth_open = dist(MOUTH_TOP, MOUTH_BOTTOM)
+    mouth_width = dist(MOUTH_LEFT, MOUTH_RIGHT)
+    # Image y grows downward, so corners above the lip center give a positive smile
+    smile = (y(MOUTH_TOP) + y(MOUTH_BOTTOM)) / 2 - (y(MOUTH_LEFT) + y(MOUTH_RIGHT)) / 2
+    eye_open = (dist(LEFT_EYE_TOP, LEFT_EYE_BOTTOM) + dist(RIGHT_EYE_TOP, RIGHT_EYE_BOTTOM)) / 2
+    brow_raise = (dist(LEFT_BROW_MID, LEFT_EYE_TOP) + dist(RIGHT_BROW_MID, RIGHT_EYE_TOP)) / 2
+    brow_gap = dist(LEFT_BROW_INNER, RIGHT_BROW_INNER)
+    brow_inner_raise = (
+        (y(LEFT_BROW_OUTER) - y(LEFT_BROW_INNER)) + (y(RIGHT_BROW_OUTER) - y(RIGHT_BROW_INNER))
+    ) / 2
+
+    features = np.stack([
+        mouth_open,
+        mouth_width,
+        smile,
+        eye_open,
+        brow_raise,
+        brow_gap,
+        brow_inner_raise,
+    ], axis=-1)
+
+    return features / iod[..., None]
+
+
+def _gaze_offset(landmarks: np.ndarray) -> Optional[float]:
+    """Horizontal iris offset from the eye center (0 = looking straight ahead)."""
+    if landmarks.shape[0] <= RIGHT_IRIS:
+        return None
+
+    offsets = []
+    for iris, inner, outer in (
+        (LEFT_IRIS, LEFT_EYE_INNER, LEFT_EYE_OUTER),
+        (RIGHT_IRIS, RIGHT_EYE_INNER, RIGHT_EYE_OUTER),
+    ):
+        width = landmarks[outer, 0] - landmarks[inner, 0]
+        if abs(width) < 1e-6:
+            return None
+        offsets.append((landmarks[iris, 0] - landmarks[inner, 0]) / width - 0.5)
+
+    return float(np.mean(offsets))
+
+
+class LandmarkEmotionClassifier:
+    """
+    Multinomial logistic classifier over landmark geometry.
+    Emits results in the same schema as EmotionAnalysisChain._validate_result.
+    """
+
+    def __init__(self, weights_path: Optional[str] = None):
+        self.classes: List[str] = list(DEFAULT_CLASSES)
+        self.mean = DEFAULT_MEAN
+        self.std = DEFAULT_STD
+        self.weights = DEFAULT_WEIGHTS
+        self.bias = DEFAULT_BIAS
+
+        weights_path = weights_path or settings.local_classifier_weights
+        if weights_path:
+            self.load_weights(weights_path)
+
+    def load_weights(self, path: str) -> None:
+        """
+        Load trained weights from an .npz file with arrays
+        classes, mean, std, weights (classes x features) and bias.
+        """
+        data = np.load(path, allow_pickle=False)
+        self.classes = [str(c) for c in data["classes"]]
+        self.mean = data["mean"].astype(np.float32)
+        self.std = data["std"].astype(np.float32)
+        self.weights = data["weights"].astype(np.float32)
+        self.bias = data["bias"].astype(np.float32)
+
+    def predict_proba(self, features: np.ndarray) -> np.ndarray:
+        """Class probabilities for one or more feature vectors."""
+        z = (features - self.mean) / self.std
+        logits = z @ self.weights.T + self.bias
+        logits -= logits.max(axis=-1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=-1, keepdims=True)
+
+    def classify(self, landmarks: np.ndarray) -> Dict[str, Any]:
+        """
+        Classify the emotion of a single face.
+
+        Args:
+            landmarks: Array of shape (N, 3) from the face mesh
+
+        Returns:
+            Dictionary with emotions, dominantEmotion, confidence, intensity and nuances
+        """
+        landmarks = np.asarray(landmarks, dtype=np.float32)
+        features = extract_landmark_features(landmarks)
+        probs = self.predict_proba(features)
+
+        order = np.argsort(probs)[::-1]
+        dominant = self.classes[order[0]]
+        emotions = [self.classes[i] for i in order if probs[i] >= 0.2] or [dominant]
+
+        z = (features - self.mean) / self.std
+        intensity = float(np.clip(np.abs(z).mean() / 2, 0, 1))
+
+        return {
+            "emotions": emotions,
+            "dominantEmotion": dominant,
+            "confidence": float(probs[order[0]]),
+            "intensity": intensity,
+            "nuances": self._nuances(z, landmarks)
+        }
+
+    def _nuances(self, z: np.ndarray, landmarks: np.ndarray) -> Dict[str, str]:
+        """Describe non-verbal cues from standardized features."""
+        named = dict(zip(FEATURE_NAMES, z))
+
+        gaze = _gaze_offset(landmarks)
+        if gaze is None:
+            eye_contact = "unknown"
+        elif abs(gaze) < 0.12:
+            eye_contact = "direct"
+        elif abs(gaze) < 0.25:
+            eye_contact = "averted"
+        else:
+            eye_contact = "looking_away"
+
+        if named["smile"] > 1:
+            mouth = "smiling"
+        elif named["smile"] < -1:
+            mouth = "frowning"
+        elif named["mouthOpen"] > 1.5:
+            mouth = "open"
+        else:
+            mouth = "neutral"
+
+        if named["browRaise"] > 1:
+            eyebrow = "raised"
+        elif named["browGap"] < -1:
+            eyebrow = "furrowed"
+        else:
+            eyebrow = "neutral"
+
+        tension_score = max(-named["browGap"], 0) + max(-named["mouthOpen"], 0)
+        if tension_score > 2:
+            tension = "tense"
+        elif tension_score > 1:
+            tension = "moderate"
+        else:
+            tension = "relaxed"
+
+        return {
+            "eyeContact": eye_contact,
+            "mouthExpression": mouth,
+            "eyebrowPosition": eyebrow,
+            "overallTension": tension
+        }
+
+
+# Singleton instance
+_landmark_classifier: Optional[LandmarkEmotionClassifier] = None
+
+
+def get_landmark_classifier() -> LandmarkEmotionClassifier:
+    """Get the singleton landmark emotion classifier."""
+    global _landmark_classifier
+    if _landmark_classifier is None:
+        _landmark_classifier = LandmarkEmotionClassifier()
+    return _landmark_classifier
@@ -0,0 +1,181 @@
+"""
+LLM Client Registry for HeartSpeak.
+Owns the process-wide Gemini client: one configured transport and one shared
+connection with keep-alive. Every upstream call is admitted by the LLM scheduler.
+"""
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Tuple
+import google.generativeai as genai
+from google.generativeai import client as genai_client
+from langchain_google_genai import ChatGoogleGenerativeAI
+from app.config import settings
+from app.services.llm_scheduler import LLMPriority, get_llm_scheduler
+
+
+# The pooled async client is wired in through private internals of
+# google-generativeai 0.3.2 (pinned in requirements.txt):
+# client._client_manager.clients and google.auth._default.get_api_key_credentials.
+# With any other version the attributes may be gone, and the default client is used.
+SUPPORTED_GENAI_VERSION = "0.3.2"
+
+
+def _genai_clients() -> Optional[Dict[str, object]]:
+    """genai's cache of default clients by name, if this version still has one."""
+    clients = getattr(getattr(genai_client, "_client_manager", None), "clients", None)
+    return clients if isinstance(clients, dict) else None
+
+
+class LLMClientRegistry:
+    """
+    Hands out model handles that all share one underlying client.
+    Chains ask for a handle with their own temperature; the connection,
+    credentials and call scheduler are the same for every handle.
+    """
+
+    def __init__(self):
+        self.model_name = settings.llm_model
+        self.scheduler = get_llm_scheduler()
+
+        self._generative_models: Dict[str, genai.GenerativeModel] = {}
+        self._chat_models: Dict[Tuple[str, float], ChatGoogleGenerativeAI] = {}
+        self._async_client = None
+        self._client_installed = False
+
+        self._configure()
+
+    def _configure(self) -> None:
+        """Capture the client configuration shared by every model handle."""
+        genai.configure(
+            api_key=settings.gemini_api_key,
+            transport=settings.llm_transport or None
+        )
+
+    def _install_async_client(self) -> None:
+        """
+        Register one gRPC channel with keep-alive as genai's default async client.
+        Built inside the event loop on the first call; genai.configure drops
+        its cached clients, so it is registered again after every configure.
+        """
+        if settings.llm_transport not in ("", "grpc", "grpc_asyncio"):
+            return
+
+        clients = _genai_clients()
+        if clients is None:
+            print(
+                f"google-generativeai {getattr(genai, '__version__', '?')} has no client cache "
+                f"(expected {SUPPORTED_GENAI_VERSION}), using default client"
+            )
+            return
+
+        if self._async_client is None:
+            try:
+                self._async_client = self._build_async_client()
+            except Exception as e:
+                print(f"Pooled LLM channel unavailable, using default client: {e}")
+                return
+
+        clients["generative_async"] = self._async_client
+
+    def _build_async_client(self):
+        """Create the async generative client over a keep-alive gRPC channel."""
+        import google.auth._default
+        from google.ai.generativelanguage_v1beta.services.generative_service import (
+            GenerativeServiceAsyncClient,
+        )
+        from google.ai.generativelanguage_v1beta.services.generative_service.transports import (
+            GenerativeServiceGrpcAsyncIOTransport,
+        )
+
+        get_api_key_credentials = getattr(google.auth._default, "get_api_key_credentials", None)
+        if get_api_key_credentials is None:
+            raise RuntimeError("google.auth has no get_api_key_credentials")
+
+        keepalive_ms = int(settings.llm_keepalive_seconds * 1000)
+        channel = GenerativeServiceGrpcAsyncIOTransport.create_channel(
+            credentials=get_api_key_credentials(settings.gemini_api_key),
+            options=[
+                ("grpc.max_send_message_length", -1),
+                ("grpc.max_receive_message_length", -1),
+                ("grpc.keepalive_time_ms", keepalive_ms),
+                ("grpc.keepalive_timeout_ms", min(keepalive_ms, 20000)),
+                ("grpc.keepalive_permit_without_calls", 1),
+                ("grpc.http2.max_pings_without_data", 0),
+            ]
+        )
+        transport = GenerativeServiceGrpcAsyncIOTransport(channel=channel)
+        return GenerativeServiceAsyncClient(transport=transport)
+
+    def generative_model(self, model: Optional[str] = None) -> genai.GenerativeModel:
+        """
+        Get the shared google-generativeai model handle.
+
+        Args:
+            model: Model name (defaults to LLM_MODEL)
+
+        Returns:
+            GenerativeModel backed by the shared client
+        """
+        model = model or self.model_name
+        handle = self._generative_models.get(model)
+        if handle is None:
+            handle = genai.GenerativeModel(model)
+            self._generative_models[model] = handle
+        return handle
+
+    def chat_model(self, temperature: float, model: Optional[str] = None) -> ChatGoogleGenerativeAI:
+        """
+        Get a LangChain chat model handle with its own temperature.
+
+        Args:
+            temperature: Sampling temperature for this handle
+            model: Model name (defaults to LLM_MODEL)
+
+        Returns:
+            ChatGoogleGenerativeAI sharing the registry's client
+        """
+        model = model or self.model_name
+        key = (model, temperature)
+        handle = self._chat_models.get(key)
+        if handle is None:
+            handle = ChatGoogleGenerativeAI(
+                model=model,
+                google_api_key=settings.gemini_api_key,
+                transport=settings.llm_transport or None,
+                temperature=temperature,
+                convert_system_message_to_human=True
+            )
+            # Temperature travels with each request, so every handle can reuse
+            # the same GenerativeModel instead of the one built by the validator
+            handle.client = self.generative_model(model)
+            # The validator re-ran genai.configure, which dropped the pooled client
+            if self._async_client is not None:
+                self._install_async_client()
+            self._chat_models[key] = handle
+        return handle
+
+    @asynccontextmanager
+    async def slot(self, priority: LLMPriority = LLMPriority.LIVE):
+        """
+        Wait for the scheduler to admit an upstream call.
+
+        Args:
+            priority: Priority class of the call
+        """
+        if not self._client_installed:
+            self._client_installed = True
+            self._install_async_client()
+
+        async with self.scheduler.slot(priority):
+            yield
+
+
+# Singleton instance
+_llm_registry: Optional[LLMClientRegistry] = None
+
+
+def get_llm_registry() -> LLMClientRegistry:
+    """Get the singleton LLM client registry."""
+    global _llm_registry
+    if _llm_registry is None:
+        _llm_registry = LLMClientRegistry()
+    return _llm_registry
@@ -0,0 +1,188 @@
+"""
+LLM Call Scheduler for HeartSpeak.
+Admits upstream Gemini calls by priority class under a concurrency cap
+and a token-bucket rate limit, and records how long each class waits.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Optional, Dict, Any, List, Tuple
+import numpy as np
+from app.config import settings
+
+
+class LLMPriority(IntEnum):
+    """Priority classes for upstream calls (lower is served first)."""
+    LIVE = 0        # Live call frames
+    PATTERN = 1     # Pattern analysis and interpretation
+    BACKGROUND = 2  # Avatar suggestions and profile building
+
+
+class _ClassStats:
+    """Queue-time statistics for one priority class."""
+
+    __slots__ = ("admitted", "queued", "total_wait", "max_wait", "recent_waits")
+
+    def __init__(self, window: int = 512):
+        self.admitted = 0
+        self.queued = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.recent_waits: deque = deque(maxlen=window)
+
+    def record(self, wait: float) -> None:
+        self.admitted += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.recent_waits.append(wait)
+
+    def to_dict(self) -> Dict[str, Any]:
+        waits = np.fromiter(self.recent_waits, dtype=np.float64) * 1000
+        return {
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "avgWaitMs": round(self.total_wait * 1000 / self.admitted, 2) if self.admitted else 0.0,
+            "p95WaitMs": round(float(np.percentile(waits, 95)), 2) if waits.size else 0.0,
+            "maxWaitMs": round(self.max_wait * 1000, 2)
+        }
+
+
+class LLMScheduler:
+    """
+    Priority admission for upstream LLM calls.
+    A call starts only when a concurrency slot and a rate token are both free;
+    waiting calls are admitted strictly by priority, then in arrival order.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        rate_per_minute: Optional[float] = None,
+        burst: Optional[int] = None
+    ):
+        self.max_concurrency = max(max_concurrency or settings.llm_max_concurrency, 1)
+        rate_per_minute = rate_per_minute if rate_per_minute is not None else settings.llm_rate_per_minute
+        self.rate_per_second = rate_per_minute / 60 if rate_per_minute > 0 else 0.0
+        self.burst = max(burst or settings.llm_rate_burst or self.max_concurrency, 1)
+
+        self._tokens = float(self.burst)
+        self._last_refill = time.monotonic()
+        self._active = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+        self._stats: Dict[LLMPriority, _ClassStats] = {p: _ClassStats() for p in LLMPriority}
+
+    def _refill(self) -> None:
+        """Add the rate tokens earned since the last refill."""
+        if not self.rate_per_second:
+            self._tokens = float(self.burst)
+            return
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate_per_second)
+        self._last_refill = now
+
+    def _can_start(self) -> bool:
+        self._refill()
+        return self._active < self.max_concurrency and self._tokens >= 1
+
+    def _start(self) -> None:
+        self._active += 1
+        self._tokens -= 1
+
+    def _dispatch(self) -> None:
+        """Admit waiting calls while capacity and rate tokens allow."""
+        self._wakeup = None
+        while self._waiters and self._can_start():
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():  # Cancelled while waiting
+                continue
+            self._start()
+            future.set_result(None)
+
+        # Out of tokens with calls still waiting: wake up when the next one is earned
+        if self._waiters and self._active < self.max_concurrency and self._wakeup is None:
+            delay = (1 - self._tokens) / self.rate_per_second
+            self._wakeup = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    async def acquire(self, priority: LLMPriority = LLMPriority.LIVE) -> float:
+        """
+        Wait until a call of the given priority may start.
+
+        Args:
+            priority: Priority class of the call
+
+        Returns:
+            Seconds spent waiting in the queue
+        """
+        stats = self._stats[priority]
+        started = time.monotonic()
+
+        if not self._waiters and self._can_start():
+            self._start()
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (int(priority), next(self._sequence), future))
+            stats.queued += 1
+            try:
+                self._dispatch()
+                await future
+            except asyncio.CancelledError:
+                # Admitted just as the caller gave up: hand the slot on
+                if future.done() and not future.cancelled():
+                    self.release()
+                else:
+                    future.cancel()
+                raise
+            finally:
+                stats.queued -= 1
+
+        wait = time.monotonic() - started
+        stats.record(wait)
+        return wait
+
+    def release(self) -> None:
+        """Free the slot of a finished call and admit the next waiter."""
+        self._active -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority: LLMPriority = LLMPriority.LIVE):
+        """Hold one upstream call slot for the duration of the block."""
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @property
+    def active(self) -> int:
+        """Upstream LLM calls currently running."""
+        return self._active
+
+    def metrics(self) -> Dict[str, Any]:
+        """Current load and per-class queue-time statistics."""
+        self._refill()
+        return {
+            "active": self._active,
+            "maxConcurrency": self.max_concurrency,
+            "ratePerMinute": self.rate_per_second * 60,
+            "availableTokens": round(self._tokens, 2),
+            "classes": {p.name.lower(): self._stats[p].to_dict() for p in LLMPriority}
+        }
+
+
+# Singleton instance
+_llm_scheduler: Optional[LLMScheduler] = None
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    """Get the singleton LLM call scheduler."""
+    global _llm_scheduler
+    if _llm_scheduler is None:
+        _llm_scheduler = LLMScheduler()
+    return _llm_scheduler
@@ -0,0 +1,181 @@
+"""
+Pattern Analysis Cache for HeartSpeak.
+Content-addressed store of validated pattern analyses, so a pattern image
+(or a near-identical re-render of it) is only ever sent to Gemini once.
+"""
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
+import cv2
+import numpy as np
+from app.config import settings
+
+
+def content_hash(data: bytes) -> str:
+    """SHA-256 of the decoded image bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def perceptual_hash(data: bytes) -> Optional[int]:
+    """
+    64-bit difference hash (dHash) of an encoded image.
+    Re-encodes, rescales and small rendering differences keep the hash within
+    a few bits; returns None if the image can't be decoded.
+    """
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        return None
+
+    small = cv2.resize(image, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    # A small margin keeps flat regions (common in drawings) from flipping on encoder noise
+    bits = (small[:, 1:] - small[:, :-1] > 2).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+class PatternAnalysisCache:
+    """
+    Bounded LRU cache of pattern analyses keyed by content hash,
+    with optional perceptual-hash matching and per-entry JSON files on disk.
+    """
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        cache_dir: Optional[str] = None,
+        max_phash_distance: Optional[int] = None
+    ):
+        self.max_entries = max_entries or settings.pattern_cache_max_entries
+        self.cache_dir = cache_dir if cache_dir is not None else settings.pattern_cache_dir
+        self.max_phash_distance = (
+            max_phash_distance if max_phash_distance is not None
+            else settings.pattern_cache_phash_max_distance
+        )
+
+        # content hash -> (validated analysis, perceptual hash)
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], Optional[int]]]" = OrderedDict()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._load_from_disk()
+
+    @property
+    def perceptual_enabled(self) -> bool:
+        return self.max_phash_distance >= 0
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _load_from_disk(self) -> None:
+        """Load the most recently written entries, up to max_entries."""
+        files = [f for f in os.listdir(self.cache_dir) if f.endswith(".json")]
+        files.sort(key=lambda f: os.path.getmtime(os.path.join(self.cache_dir, f)))
+
+        for filename in files[-self.max_entries:]:
+            key = filename[:-len(".json")]
+            try:
+                with open(self._entry_path(key)) as f:
+                    stored = json.load(f)
+                self._entries[key] = (stored["result"], stored.get("phash"))
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Skipping unreadable pattern cache entry {filename}: {e}")
+
+    def _write_to_disk(self, key: str, result: Dict[str, Any], phash: Optional[int]) -> None:
+        """Persist one entry atomically."""
+        path = self._entry_path(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump({"result": result, "phash": phash}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Failed to persist pattern cache entry: {e}")
+
+    def _find_near_duplicate(self, phash: int) -> Optional[str]:
+        """Content hash of the closest cached image within max_phash_distance."""
+        best_key, best_distance = None, self.max_phash_distance + 1
+        for key, (_, other) in self._entries.items():
+            if other is None:
+                continue
+            distance = bin(phash ^ other).count("1")
+            if distance < best_distance:
+                best_key, best_distance = key, distance
+        return best_key
+
+    def get(self, data: bytes) -> Tuple[Optional[Dict[str, Any]], str, Optional[int]]:
+        """
+        Look up the analysis of an image.
+
+        Args:
+            data: Decoded image bytes
+
+        Returns:
+            Tuple of (cached analysis or None, content hash, perceptual hash).
+            The hashes are returned so a miss can be stored without rehashing.
+        """
+        key = content_hash(data)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry[0]), key, entry[1]
+
+        phash = perceptual_hash(data) if self.perceptual_enabled else None
+        if phash is not None:
+            near_key = self._find_near_duplicate(phash)
+            if near_key is not None:
+                self._entries.move_to_end(near_key)
+                self.near_hits += 1
+                return dict(self._entries[near_key][0]), key, phash
+
+        self.misses += 1
+        return None, key, phash
+
+    def put(self, key: str, result: Dict[str, Any], phash: Optional[int] = None) -> None:
+        """
+        Store a validated analysis.
+
+        Args:
+            key: Content hash from get()
+            result: Analysis matching PatternAnalysisOutput
+            phash: Perceptual hash from get()
+        """
+        self._entries[key] = (result, phash)
+        self._entries.move_to_end(key)
+        if self.cache_dir:
+            self._write_to_disk(key, result, phash)
+
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            if self.cache_dir:
+                try:
+                    os.remove(self._entry_path(evicted))
+                except OSError:
+                    pass
+
+    def metrics(self) -> Dict[str, Any]:
+        """Hit rate and size."""
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "nearHits": self.near_hits,
+            "misses": self.misses,
+            "hitRate": round((self.hits + self.near_hits) / lookups, 4) if lookups else 0.0
+        }
+
+
+# Singleton instance
+_pattern_cache: Optional[PatternAnalysisCache] = None
+
+
+def get_pattern_cache() -> PatternAnalysisCache:
+    """Get the singleton pattern analysis cache."""
+    global _pattern_cache
+    if _pattern_cache is None:
+        _pattern_cache = PatternAnalysisCache()
+    return _pattern_cache
@@ -0,0 +1,213 @@
+"""
+Local Pattern Feature Extractor for HeartSpeak.
+Computes the measurable PatternFeatures fields (density, symmetry, dominant
+colours, colour mood, line quality, complexity) from pixels with OpenCV,
+so Gemini only has to judge shape, movement and emotion.
+"""
+from typing import Optional, Dict, Any, List
+import cv2
+import numpy as np
+
+
+ANALYSIS_MAX_EDGE = 256
+KMEANS_COLORS = 4
+KMEANS_MAX_SAMPLES = 4000
+MIN_COLOR_SHARE = 0.05
+MERGE_COLOR_DISTANCE = 40
+
+LOCAL_FEATURE_KEYS = ("density", "symmetry", "dominantColors", "colorMood", "lineQuality", "complexity")
+
+
+def _load_image(data: bytes) -> Optional[np.ndarray]:
+    """Decode to 8-bit BGR at analysis resolution, compositing transparency onto white."""
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+    if image is None:
+        return None
+
+    # IMREAD_UNCHANGED keeps 16-bit and float depths (alpha included); the
+    # edge and colour measures expect 8 bits
+    if image.dtype != np.uint8:
+        max_value = np.iinfo(image.dtype).max if np.issubdtype(image.dtype, np.integer) else 1.0
+        image = np.clip(image.astype(np.float32) * (255 / max_value), 0, 255).astype(np.uint8)
+
+    if image.ndim == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    elif image.shape[2] == 4:
+        alpha = image[:, :, 3:4].astype(np.float32) / 255
+        image = (image[:, :, :3] * alpha + 255 * (1 - alpha)).astype(np.uint8)
+
+    scale = ANALYSIS_MAX_EDGE / max(image.shape[:2])
+    if scale < 1:
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return image
+
+
+def _background_distance(image: np.ndarray) -> np.ndarray:
+    """Per-pixel colour distance from the background (median of the border)."""
+    border = np.concatenate([image[0], image[-1], image[:, 0], image[:, -1]])
+    background = np.median(border, axis=0)
+    return np.linalg.norm(image.astype(np.float32) - background, axis=2)
+
+
+def _symmetry(mask: np.ndarray) -> float:
+    """Best mirror overlap (intersection over union) about the vertical or horizontal axis."""
+    if not mask.any():
+        return 0.0
+
+    scores = []
+    for flipped in (mask[:, ::-1], mask[::-1, :]):
+        union = np.logical_or(mask, flipped).sum()
+        scores.append(np.logical_and(mask, flipped).sum() / union if union else 0.0)
+    return float(max(scores))
+
+
+def _dominant_colors(pixels: np.ndarray) -> List[Dict[str, Any]]:
+    """K-means colour clusters of the drawn pixels, largest first."""
+    if len(pixels) == 0:
+        return []
+
+    if len(pixels) > KMEANS_MAX_SAMPLES:
+        step = len(pixels) // KMEANS_MAX_SAMPLES
+        pixels = pixels[::step]
+
+    k = min(KMEANS_COLORS, len(pixels))
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 1.0)
+    _, labels, centers = cv2.kmeans(
+        pixels.astype(np.float32), k, None, criteria, 2, cv2.KMEANS_PP_CENTERS
+    )
+
+    shares = np.bincount(labels.ravel(), minlength=k) / len(labels)
+    clusters: List[Dict[str, Any]] = []
+    for i in np.argsort(shares)[::-1]:
+        # Shades of one colour split into several clusters; fold them into the largest
+        similar = next(
+            (c for c in clusters if np.linalg.norm(c["bgr"] - centers[i]) < MERGE_COLOR_DISTANCE),
+            None
+        )
+        if similar is not None:
+            similar["share"] += float(shares[i])
+        else:
+            clusters.append({"bgr": centers[i], "share": float(shares[i])})
+
+    clusters = [c for c in clusters if c["share"] >= MIN_COLOR_SHARE]
+    for cluster in clusters:
+        b, g, r = np.clip(cluster["bgr"], 0, 255).astype(int)
+        cluster["hex"] = f"#{r:02X}{g:02X}{b:02X}"
+    return clusters
+
+
+def _color_mood(clusters: List[Dict[str, Any]]) -> str:
+    """Colour mood from the share-weighted saturation, brightness and hue of the clusters."""
+    if not clusters:
+        return "monochrome"
+
+    bgr = np.array([c["bgr"] for c in clusters], dtype=np.uint8).reshape(-1, 1, 3)
+    hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV).reshape(-1, 3).astype(np.float32)
+    weights = np.array([c["share"] for c in clusters], dtype=np.float32)
+    weights /= weights.sum()
+
+    hue = hsv[:, 0] * 2  # OpenCV hue is 0-180
+    saturation = hsv[:, 1] / 255
+    value = hsv[:, 2] / 255
+    mean_saturation = float(saturation @ weights)
+
+    if mean_saturation < 0.15:
+        return "monochrome"
+    if mean_saturation > 0.6 and float(value @ weights) > 0.6:
+        return "vibrant"
+    if mean_saturation < 0.35:
+        return "muted"
+
+    # Reds through yellows (and magentas) read as warm
+    colored = saturation >= 0.15
+    warm = ((hue < 70) | (hue >= 300)) & colored
+    warm_share = weights[warm].sum() / max(weights[colored].sum(), 1e-6)
+    return "warm" if warm_share >= 0.5 else "cool"
+
+
+def _contour_stats(mask: np.ndarray) -> Dict[str, float]:
+    """Stroke count, length and jaggedness from the outlines of the drawn regions."""
+    contours, _ = cv2.findContours(mask.astype(np.uint8), cv2.RETR_LIST, cv2.CHAIN_APPROX_NONE)
+    contours = [c for c in contours if len(c) >= 8]
+    if not contours:
+        return {"count": 0, "meanLength": 0.0, "jaggedness": 0.0}
+
+    lengths = np.array([cv2.arcLength(c, True) for c in contours], dtype=np.float32)
+
+    # Sharp turns (over 60 degrees) of each simplified outline; curves only turn gently
+    sharp_turns = 0
+    for contour, length in zip(contours, lengths):
+        polygon = cv2.approxPolyDP(contour, 0.01 * length, True).reshape(-1, 2).astype(np.float32)
+        if len(polygon) < 3:
+            continue
+        edges = np.roll(polygon, -1, axis=0) - polygon
+        following = np.roll(edges, -1, axis=0)
+        cos_turn = (edges * following).sum(axis=1) / (
+            np.linalg.norm(edges, axis=1) * np.linalg.norm(following, axis=1) + 1e-6
+        )
+        sharp_turns += int(np.count_nonzero(cos_turn < 0.5))
+
+    return {
+        "count": len(contours),
+        "meanLength": float(lengths.mean()),
+        "jaggedness": float(sharp_turns / lengths.sum() * 100),  # Sharp turns per 100px
+    }
+
+
+def _line_quality(stats: Dict[str, float], edge_density: float, diagonal: float) -> str:
+    """Classify strokes as broken, jagged, continuous or smooth."""
+    if stats["count"] == 0:
+        return "smooth"
+    if stats["count"] > 25 and stats["meanLength"] < diagonal * 0.15:
+        return "broken"
+    if stats["jaggedness"] > 0.8:
+        return "jagged"
+    if stats["count"] <= 5 and stats["meanLength"] > diagonal:
+        return "continuous"
+    return "smooth"
+
+
+def _complexity(stats: Dict[str, float], edge_density: float, color_count: int) -> str:
+    """Visual complexity from edge density, stroke count and palette size."""
+    score = edge_density * 10 + min(stats["count"], 60) / 20 + color_count / 4
+    if score < 1.5:
+        return "simple"
+    if score < 3.5:
+        return "moderate"
+    return "complex"
+
+
+def extract_pattern_features(data: bytes) -> Optional[Dict[str, Any]]:
+    """
+    Measure pattern features from an encoded image.
+
+    Args:
+        data: Encoded (PNG/JPEG) image bytes
+
+    Returns:
+        Dictionary with the LOCAL_FEATURE_KEYS fields, or None if the image can't be decoded
+    """
+    image = _load_image(data)
+    if image is None:
+        return None
+
+    distance = _background_distance(image)
+    mask = distance > 40
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    edges = cv2.Canny(gray, 50, 150)
+    edge_density = float(np.count_nonzero(edges)) / edges.size
+    diagonal = float(np.hypot(*mask.shape))
+
+    # Colours come from stroke cores; anti-aliased fringes are blends with the background
+    core = distance >= max(np.percentile(distance[mask], 50), 40) if mask.any() else mask
+    clusters = _dominant_colors(image[core])
+    stats = _contour_stats(mask)
+
+    return {
+        "density": round(float(mask.mean()), 3),
+        "symmetry": round(_symmetry(mask), 3),
+        "dominantColors": [c["hex"] for c in clusters],
+        "colorMood": _color_mood(clusters),
+        "lineQuality": _line_quality(stats, edge_density, diagonal),
+        "complexity": _complexity(stats, edge_density, len(clusters)),
+    }
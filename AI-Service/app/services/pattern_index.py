@@ -0,0 +1,290 @@
+"""
+Pattern Similarity Index for HeartSpeak.
+Per-user NumPy matrices of pattern embeddings, so matching a received
+pattern against a sender's library is one vectorized top-k query.
+"""
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
+import numpy as np
+from app.config import settings
+
+
+# Vocabularies from PATTERN_ANALYSIS_PROMPT
+SHAPE_TYPES = ("spiral", "angular", "flowing", "geometric", "chaotic", "organic")
+COLOR_MOODS = ("warm", "cool", "vibrant", "muted", "monochrome")
+LINE_QUALITIES = ("smooth", "jagged", "continuous", "broken")
+MOVEMENTS = ("static", "flowing", "dynamic", "chaotic")
+COMPLEXITIES = ("simple", "moderate", "complex")
+EMOTIONS = (
+    "joy", "calm", "love", "sadness", "anxiety", "excitement", "confusion", "gratitude",
+    "hope", "loneliness", "frustration", "peace", "curiosity", "fear", "contentment",
+)
+HUE_BINS = 12  # Plus one bin for greys
+
+# Share of the similarity each block contributes (sums to 1)
+BLOCK_WEIGHTS = {
+    "emotion": 0.35,
+    "colorMood": 0.15,
+    "shapeType": 0.12,
+    "lineQuality": 0.08,
+    "movement": 0.05,
+    "complexity": 0.05,
+    "numeric": 0.10,
+    "colors": 0.10,
+}
+
+EMBEDDING_DIM = (
+    len(EMOTIONS) + len(COLOR_MOODS) + len(SHAPE_TYPES) + len(LINE_QUALITIES)
+    + len(MOVEMENTS) + len(COMPLEXITIES) + 3 + HUE_BINS + 1
+)
+
+
+def _one_hot(value: Optional[str], vocabulary: Tuple[str, ...], weight: float) -> np.ndarray:
+    """Scaled one-hot block; unknown values give an all-zero block."""
+    block = np.zeros(len(vocabulary), dtype=np.float32)
+    if value:
+        value = value.lower()
+        if value in vocabulary:
+            block[vocabulary.index(value)] = np.sqrt(weight)
+    return block
+
+
+def _hue_histogram(colors: List[str]) -> np.ndarray:
+    """Histogram of hex colours over hue bins, with low-saturation colours counted as grey."""
+    histogram = np.zeros(HUE_BINS + 1, dtype=np.float32)
+    for color in colors or []:
+        hex_value = str(color).lstrip("#")
+        if len(hex_value) != 6:
+            continue
+        try:
+            r, g, b = (int(hex_value[i:i + 2], 16) / 255 for i in (0, 2, 4))
+        except ValueError:
+            continue
+
+        high, low = max(r, g, b), min(r, g, b)
+        if high == 0 or (high - low) / high < 0.15:
+            histogram[HUE_BINS] += 1
+            continue
+
+        delta = high - low
+        if high == r:
+            hue = ((g - b) / delta) % 6
+        elif high == g:
+            hue = (b - r) / delta + 2
+        else:
+            hue = (r - g) / delta + 4
+        histogram[int(hue / 6 * HUE_BINS) % HUE_BINS] += 1
+
+    norm = np.linalg.norm(histogram)
+    return histogram / norm if norm > 0 else histogram
+
+
+def pattern_embedding(
+    features: Dict[str, Any],
+    emotion: Optional[str] = None,
+    intensity: Optional[float] = None
+) -> np.ndarray:
+    """
+    Build the unit-length embedding of one pattern.
+
+    Each block is scaled by the square root of its weight, so the cosine
+    similarity of two embeddings is (up to normalization) the weighted sum of
+    per-block similarities.
+
+    Args:
+        features: Pattern features (shapeType, colorMood, density, dominantColors, ...)
+        emotion: Associated emotion
+        intensity: Emotional intensity (0-1)
+
+    Returns:
+        Float32 vector of length EMBEDDING_DIM
+    """
+    features = features or {}
+
+    # Centered so opposite ends of a scale pull apart instead of all agreeing
+    numeric = np.array([
+        features.get("density", 0.5),
+        features.get("symmetry", 0.5),
+        intensity if intensity is not None else 0.5,
+    ], dtype=np.float32)
+    numeric = (np.clip(numeric, 0, 1) - 0.5) * 2 * np.sqrt(BLOCK_WEIGHTS["numeric"] / 3)
+
+    vector = np.concatenate([
+        _one_hot(emotion, EMOTIONS, BLOCK_WEIGHTS["emotion"]),
+        _one_hot(features.get("colorMood"), COLOR_MOODS, BLOCK_WEIGHTS["colorMood"]),
+        _one_hot(features.get("shapeType"), SHAPE_TYPES, BLOCK_WEIGHTS["shapeType"]),
+        _one_hot(features.get("lineQuality"), LINE_QUALITIES, BLOCK_WEIGHTS["lineQuality"]),
+        _one_hot(features.get("movement"), MOVEMENTS, BLOCK_WEIGHTS["movement"]),
+        _one_hot(features.get("complexity"), COMPLEXITIES, BLOCK_WEIGHTS["complexity"]),
+        numeric,
+        _hue_histogram(features.get("dominantColors", [])) * np.sqrt(BLOCK_WEIGHTS["colors"]),
+    ])
+
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def library_pattern_embedding(pattern: Dict[str, Any]) -> np.ndarray:
+    """Embedding of a library pattern as stored by the Node server (intensity 0-1)."""
+    intensity = pattern.get("intensity")
+    # Older clients sent 0-100
+    if intensity is not None and intensity > 1:
+        intensity = intensity / 100
+    return pattern_embedding(
+        pattern.get("features", {}),
+        pattern.get("emotion"),
+        intensity
+    )
+
+
+def pattern_id(pattern: Dict[str, Any]) -> str:
+    """Stable ID of a library pattern."""
+    return str(pattern.get("_id") or pattern.get("id") or pattern.get("name", ""))
+
+
+class PatternIndex:
+    """
+    Similarity index over one user's pattern library.
+    Rows live in a preallocated matrix that grows by doubling; removal moves
+    the last row into the gap, so every operation stays O(1) per pattern.
+    """
+
+    def __init__(self, initial_capacity: int = 64):
+        self._vectors = np.zeros((initial_capacity, EMBEDDING_DIM), dtype=np.float32)
+        self._ids: List[str] = []
+        self._patterns: List[Dict[str, Any]] = []
+        self._rows: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def upsert(self, pattern: Dict[str, Any]) -> None:
+        """Add or replace a pattern (re-embedded only if it changed)."""
+        key = pattern_id(pattern)
+        row = self._rows.get(key)
+        if row is not None:
+            if self._patterns[row] == pattern:
+                return
+            self._vectors[row] = library_pattern_embedding(pattern)
+            self._patterns[row] = pattern
+            return
+
+        row = len(self._ids)
+        if row == self._vectors.shape[0]:
+            grown = np.zeros((row * 2, EMBEDDING_DIM), dtype=np.float32)
+            grown[:row] = self._vectors
+            self._vectors = grown
+
+        self._vectors[row] = library_pattern_embedding(pattern)
+        self._ids.append(key)
+        self._patterns.append(pattern)
+        self._rows[key] = row
+
+    def sync(self, patterns: List[Dict[str, Any]]) -> None:
+        """Make the index hold exactly these patterns (the sender's full library)."""
+        keep = {pattern_id(pattern) for pattern in patterns}
+        for key in [key for key in self._ids if key not in keep]:
+            self.remove(key)
+        for pattern in patterns:
+            self.upsert(pattern)
+    
+    def remove(self, key: str) -> bool:
+        """Remove a pattern by ID."""
+        row = self._rows.pop(key, None)
+        if row is None:
+            return False
+
+        last = len(self._ids) - 1
+        if row != last:
+            self._vectors[row] = self._vectors[last]
+            self._ids[row] = self._ids[last]
+            self._patterns[row] = self._patterns[last]
+            self._rows[self._ids[row]] = row
+        self._ids.pop()
+        self._patterns.pop()
+        return True
+
+    def query(self, vector: np.ndarray, k: int = 5) -> List[Tuple[float, Dict[str, Any]]]:
+        """
+        Find the most similar patterns.
+
+        Args:
+            vector: Query embedding from pattern_embedding()
+            k: Number of results
+
+        Returns:
+            List of (cosine similarity, pattern), best first
+        """
+        count = len(self._ids)
+        if count == 0 or k <= 0:
+            return []
+
+        scores = self._vectors[:count] @ vector
+        if k < count:
+            top = np.argpartition(scores, -k)[-k:]
+        else:
+            top = np.arange(count)
+        top = top[np.argsort(scores[top])[::-1]]
+
+        return [(float(scores[i]), self._patterns[i]) for i in top]
+
+
+class PatternIndexStore:
+    """
+    Pattern indexes of recently active users, created on first use.
+    Beyond max_users the least recently used index is dropped; /match
+    rebuilds it from the library the Node server sends along.
+    """
+
+    def __init__(self, max_users: Optional[int] = None):
+        self.max_users = max_users or settings.pattern_index_max_users
+        self._indexes: "OrderedDict[str, PatternIndex]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._indexes)
+
+    def get(self, user_id: str) -> PatternIndex:
+        """Get (or create) a user's index."""
+        index = self._indexes.get(user_id)
+        if index is None:
+            index = PatternIndex()
+            self._indexes[user_id] = index
+            while len(self._indexes) > self.max_users:
+                self._indexes.popitem(last=False)
+        else:
+            self._indexes.move_to_end(user_id)
+        return index
+
+    def sync_patterns(self, user_id: str, patterns: List[Dict[str, Any]]) -> int:
+        """Replace a user's library with exactly these patterns; returns the library size."""
+        index = self.get(user_id)
+        index.sync(patterns)
+        return len(index)
+
+    def upsert_patterns(self, user_id: str, patterns: List[Dict[str, Any]]) -> int:
+        """Add or update library patterns; returns the library size."""
+        index = self.get(user_id)
+        for pattern in patterns:
+            index.upsert(pattern)
+        return len(index)
+
+    def remove_pattern(self, user_id: str, key: str) -> bool:
+        """Remove one pattern from a user's index."""
+        index = self._indexes.get(user_id)
+        return index.remove(key) if index is not None else False
+
+    def clear_user(self, user_id: str) -> None:
+        """Drop a user's index."""
+        self._indexes.pop(user_id, None)
+
+
+# Singleton instance
+_pattern_index_store: Optional[PatternIndexStore] = None
+
+
+def get_pattern_index_store() -> PatternIndexStore:
+    """Get the singleton pattern index store."""
+    global _pattern_index_store
+    if _pattern_index_store is None:
+        _pattern_index_store = PatternIndexStore()
+    return _pattern_index_store
@@ -0,0 +1,150 @@
+"""
+Session Registry for HeartSpeak.
+Tracks when each (call, user) session was last active so per-session state
+is released for dropped calls and crashed clients, not only when the Node
+server ends the session explicitly.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple, Callable
+from app.config import settings
+
+
+SessionKey = Tuple[str, str]
+EvictionCallback = Callable[[str, str, bool], None]
+
+
+class SessionRegistry:
+    """
+    Last-access times of live sessions, least recently used first.
+    Sessions idle for longer than the TTL are evicted by the sweeper, and the
+    least recently used one is evicted whenever the global cap is exceeded.
+    Eviction callbacks receive (call_id, user_id, call_ended), where
+    call_ended is True when it was the call's last live session.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: Optional[float] = None,
+        max_sessions: Optional[int] = None,
+        sweep_interval_seconds: Optional[float] = None
+    ):
+        self.ttl_seconds = ttl_seconds or settings.session_ttl_seconds
+        self.max_sessions = max_sessions or settings.session_max_live
+        self.sweep_interval_seconds = sweep_interval_seconds or settings.session_sweep_interval_seconds
+
+        self._sessions: "OrderedDict[SessionKey, float]" = OrderedDict()
+        self._call_sessions: Dict[str, int] = {}
+        self._callbacks: List[EvictionCallback] = []
+        self._sweeper: Optional[asyncio.Task] = None
+        self.evicted_idle = 0
+        self.evicted_capacity = 0
+
+    def add_eviction_callback(self, callback: EvictionCallback) -> None:
+        """Register a function that releases a session's state."""
+        self._callbacks.append(callback)
+
+    def touch(self, call_id: str, user_id: str) -> None:
+        """Mark a session as active, evicting the least recently used one if over the cap."""
+        key = (call_id, user_id)
+        if key in self._sessions:
+            self._sessions.move_to_end(key)
+        else:
+            self._call_sessions[call_id] = self._call_sessions.get(call_id, 0) + 1
+        self._sessions[key] = time.monotonic()
+
+        while len(self._sessions) > self.max_sessions:
+            oldest = next(iter(self._sessions))
+            self._evict(oldest)
+            self.evicted_capacity += 1
+
+    def remove(self, call_id: str, user_id: str) -> bool:
+        """Forget a session that was cleared explicitly (no callbacks)."""
+        if self._sessions.pop((call_id, user_id), None) is None:
+            return False
+        self._release_call(call_id)
+        return True
+
+    def _release_call(self, call_id: str) -> bool:
+        """Decrement a call's live session count; True if none are left."""
+        remaining = self._call_sessions.get(call_id, 1) - 1
+        if remaining > 0:
+            self._call_sessions[call_id] = remaining
+            return False
+        self._call_sessions.pop(call_id, None)
+        return True
+
+    def _evict(self, key: SessionKey) -> None:
+        """Remove a session and run the eviction callbacks."""
+        del self._sessions[key]
+        call_id, user_id = key
+        call_ended = self._release_call(call_id)
+        for callback in self._callbacks:
+            try:
+                callback(call_id, user_id, call_ended)
+            except Exception as e:
+                print(f"Session eviction callback error: {e}")
+
+    def sweep(self) -> int:
+        """
+        Evict every session idle for longer than the TTL.
+
+        Returns:
+            Number of sessions evicted
+        """
+        cutoff = time.monotonic() - self.ttl_seconds
+        evicted = 0
+        # Ordered by last access, so only the expired prefix is visited
+        while self._sessions:
+            key, last_access = next(iter(self._sessions.items()))
+            if last_access > cutoff:
+                break
+            self._evict(key)
+            evicted += 1
+        self.evicted_idle += evicted
+        return evicted
+
+    async def _sweep_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval_seconds)
+            self.sweep()
+
+    def start(self) -> None:
+        """Start the background sweeper on the running event loop."""
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep_forever())
+
+    async def stop(self) -> None:
+        """Stop the background sweeper."""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+    def metrics(self) -> Dict[str, Any]:
+        """Live session gauges and eviction counters."""
+        oldest = next(iter(self._sessions.values()), None)
+        return {
+            "liveSessions": len(self._sessions),
+            "liveCalls": len(self._call_sessions),
+            "maxSessions": self.max_sessions,
+            "oldestIdleSeconds": round(time.monotonic() - oldest, 1) if oldest is not None else 0.0,
+            "evictedIdle": self.evicted_idle,
+            "evictedCapacity": self.evicted_capacity
+        }
+
+
+# Singleton instance
+_session_registry: Optional[SessionRegistry] = None
+
+
+def get_session_registry() -> SessionRegistry:
+    """Get the singleton session registry."""
+    global _session_registry
+    if _session_registry is None:
+        _session_registry = SessionRegistry()
+    return _session_registry
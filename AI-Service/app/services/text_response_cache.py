@@ -0,0 +1,133 @@
+"""
+Text Response Cache for HeartSpeak.
+Reuses generated emotion descriptions across sessions: the text prompt is a
+small discrete tuple (emotion, intensity label, nuances), so the same inputs
+recur constantly and a few stored phrasings per input cover most requests.
+"""
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple, Iterable
+from app.config import settings
+
+
+CacheKey = Tuple[Optional[str], ...]
+
+
+class _CacheEntry:
+    """Stored phrasings for one input tuple."""
+
+    __slots__ = ("phrasings", "cursor", "created")
+
+    def __init__(self, created: float):
+        self.phrasings: List[str] = []
+        self.cursor = 0
+        self.created = created
+
+
+class TextResponseCache:
+    """
+    LRU/TTL cache of several phrasings per normalized generation input.
+    A key is only served from the cache once it holds max_variants phrasings,
+    and never with a phrasing the session has seen recently.
+    """
+
+    def __init__(
+        self,
+        max_keys: Optional[int] = None,
+        max_variants: Optional[int] = None,
+        ttl_seconds: Optional[float] = None
+    ):
+        self.max_keys = max_keys or settings.text_cache_max_keys
+        self.max_variants = max_variants or settings.text_cache_variants
+        self.ttl_seconds = ttl_seconds or settings.text_cache_ttl_seconds
+
+        self._entries: "OrderedDict[CacheKey, _CacheEntry]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _get_entry(self, key: CacheKey) -> Optional[_CacheEntry]:
+        """Look up a live entry and mark it recently used."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.created > self.ttl_seconds:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, key: CacheKey, avoid: Iterable[str] = ()) -> Optional[str]:
+        """
+        Get the next phrasing for a key, rotating through the stored ones.
+
+        Args:
+            key: Normalized generation input
+            avoid: Texts that must not be returned (the session's recent messages)
+
+        Returns:
+            A cached phrasing, or None if the caller should generate a new one
+        """
+        entry = self._get_entry(key)
+        if entry is not None and len(entry.phrasings) >= self.max_variants:
+            avoid = set(avoid)
+            count = len(entry.phrasings)
+            for offset in range(count):
+                index = (entry.cursor + offset) % count
+                text = entry.phrasings[index]
+                if text not in avoid:
+                    entry.cursor = index + 1
+                    self.hits += 1
+                    return text
+
+        self.misses += 1
+        return None
+
+    def is_warm(self, key: CacheKey) -> bool:
+        """Whether get() would serve this key from the cache (ignoring avoided texts)."""
+        entry = self._get_entry(key)
+        return entry is not None and len(entry.phrasings) >= self.max_variants
+
+    def add(self, key: CacheKey, text: str) -> None:
+        """Store a newly generated phrasing, replacing the oldest when full."""
+        if not text:
+            return
+
+        entry = self._get_entry(key)
+        if entry is None:
+            entry = _CacheEntry(time.monotonic())
+            self._entries[key] = entry
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+
+        if text in entry.phrasings:
+            return
+        entry.phrasings.append(text)
+        if len(entry.phrasings) > self.max_variants:
+            entry.phrasings.pop(0)
+            entry.cursor = max(entry.cursor - 1, 0)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Hit rate and size."""
+        lookups = self.hits + self.misses
+        return {
+            "keys": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+    def clear(self) -> None:
+        """Drop every cached phrasing."""
+        self._entries.clear()
+
+
+# Singleton instance
+_text_response_cache: Optional[TextResponseCache] = None
+
+
+def get_text_response_cache() -> TextResponseCache:
+    """Get the singleton text response cache."""
+    global _text_response_cache
+    if _text_response_cache is None:
+        _text_response_cache = TextResponseCache()
+    return _text_response_cache
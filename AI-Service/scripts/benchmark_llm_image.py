@@ -0,0 +1,87 @@
+"""
+Benchmark the vision-model upload with and without face crop + downscaling.
+
+Usage (from the AI-Service directory):
+    python -m scripts.benchmark_llm_image path/to/frame.jpg [more.jpg ...]
+    python -m scripts.benchmark_llm_image frame.jpg --live --runs 5
+
+Without --live only the local encode cost and upload size are measured.
+With --live each variant is also sent to Gemini through EmotionAnalysisChain
+and the median round-trip latency is reported (uses GEMINI_API_KEY).
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List, Optional, Tuple
+import cv2
+import mediapipe as mp
+from app.services.frame_preprocessor import prepare_llm_image
+from app.services.image_frame import ImageFrame
+
+
+def _detect_face_box(image) -> Optional[Tuple[float, float, float, float]]:
+    """
+    Relative face box from MediaPipe face detection. This matches the "gated" and
+    "full" detection modes; in the default "mesh_only" mode the workers use the
+    landmark extent, which is usually a little tighter.
+    """
+    with mp.solutions.face_detection.FaceDetection(model_selection=1, min_detection_confidence=0.5) as detector:
+        results = detector.process(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+    if not results.detections:
+        return None
+    box = results.detections[0].location_data.relative_bounding_box
+    return box.xmin, box.ymin, box.width, box.height
+
+
+async def _median_latency(frame: ImageFrame, runs: int) -> float:
+    """Median Gemini round trip for one image, in milliseconds."""
+    from app.chains.emotion_chain import get_emotion_chain
+    
+    chain = get_emotion_chain()
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        await chain.analyze(frame)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+async def benchmark(paths: List[str], live: bool, runs: int) -> None:
+    for path in paths:
+        with open(path, "rb") as f:
+            original = f.read()
+        
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        if image is None:
+            print(f"{path}: not a readable image, skipped")
+            continue
+        
+        face_box = _detect_face_box(image)
+        
+        start = time.perf_counter()
+        reduced = prepare_llm_image(image, face_box)
+        encode_ms = (time.perf_counter() - start) * 1000
+        
+        print(f"{path} ({image.shape[1]}x{image.shape[0]}, face {'found' if face_box else 'not found'})")
+        print(f"  original upload:   {len(original) / 1024:8.1f} KB")
+        print(f"  downscaled upload: {len(reduced) / 1024:8.1f} KB  (crop+resize+encode {encode_ms:.1f} ms)")
+        
+        if live:
+            original_ms = await _median_latency(ImageFrame(original), runs)
+            reduced_ms = await _median_latency(ImageFrame(reduced), runs)
+            print(f"  Gemini median latency: original {original_ms:.0f} ms, downscaled {reduced_ms:.0f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", nargs="+", help="Camera frames to benchmark")
+    parser.add_argument("--live", action="store_true", help="Also measure Gemini round-trip latency")
+    parser.add_argument("--runs", type=int, default=3, help="Gemini calls per variant with --live")
+    args = parser.parse_args()
+    
+    asyncio.run(benchmark(args.images, args.live, args.runs))
+
+
+if __name__ == "__main__":
+    main()
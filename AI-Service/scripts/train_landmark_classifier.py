@@ -0,0 +1,174 @@
+"""
+Train the landmark emotion classifier on labelled frames and export its weights.
+
+Usage (from the AI-Service directory):
+    python -m scripts.train_landmark_classifier path/to/frames --output landmark_classifier.npz
+
+The frames directory holds one subdirectory per emotion label (happy/, sad/, ...)
+with face images. Each face goes through the MediaPipe face mesh and
+extract_landmark_features, the same features the classifier sees at runtime,
+and a multinomial logistic regression is fitted on them. A held-out share of
+the frames reports accuracy and how often the LOCAL_CLASSIFIER_MIN_CONFIDENCE
+fast path would answer, and how often it would be right. Set
+LOCAL_CLASSIFIER_WEIGHTS to the output file (and LOCAL_CLASSIFIER_ENABLED=true)
+once those numbers are good enough.
+"""
+import argparse
+import os
+from typing import Dict, List, Tuple
+import numpy as np
+from app.config import settings
+from app.services.landmark_classifier import LandmarkEmotionClassifier, extract_landmark_features
+
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def load_labelled_features(root: str) -> Tuple[np.ndarray, List[str]]:
+    """
+    Landmark features of every detectable face under root/<label>/.
+
+    Returns:
+        (features of shape (frames, len(FEATURE_NAMES)), label per frame)
+    """
+    import cv2
+    import mediapipe as mp
+
+    features: List[np.ndarray] = []
+    labels: List[str] = []
+    skipped = 0
+    with mp.solutions.face_mesh.FaceMesh(
+        static_image_mode=True,
+        max_num_faces=1,
+        refine_landmarks=True,
+        min_detection_confidence=0.5
+    ) as face_mesh:
+        for label in sorted(os.listdir(root)):
+            directory = os.path.join(root, label)
+            if not os.path.isdir(directory):
+                continue
+            for name in sorted(os.listdir(directory)):
+                if not name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                image = cv2.imread(os.path.join(directory, name), cv2.IMREAD_COLOR)
+                results = face_mesh.process(cv2.cvtColor(image, cv2.COLOR_BGR2RGB)) if image is not None else None
+                if results is None or not results.multi_face_landmarks:
+                    skipped += 1
+                    continue
+                landmarks = np.array(
+                    [(lm.x, lm.y, lm.z) for lm in results.multi_face_landmarks[0].landmark],
+                    dtype=np.float32
+                )
+                features.append(extract_landmark_features(landmarks))
+                labels.append(label)
+
+    if skipped:
+        print(f"Skipped {skipped} frames without a detectable face")
+    return np.array(features, dtype=np.float32), labels
+
+
+def fit(
+    features: np.ndarray,
+    labels: List[str],
+    l2: float = 1e-3,
+    epochs: int = 2000,
+    learning_rate: float = 0.5
+) -> Dict[str, np.ndarray]:
+    """
+    Fit a multinomial logistic regression by full-batch gradient descent.
+
+    Returns:
+        Arrays in the layout LandmarkEmotionClassifier.load_weights reads:
+        classes, mean, std, weights (classes x features) and bias
+    """
+    classes = sorted(set(labels))
+    targets = np.eye(len(classes), dtype=np.float32)[[classes.index(label) for label in labels]]
+
+    mean = features.mean(axis=0)
+    std = np.maximum(features.std(axis=0), 1e-6)
+    z = (features - mean) / std
+
+    weights = np.zeros((len(classes), features.shape[1]), dtype=np.float32)
+    bias = np.zeros(len(classes), dtype=np.float32)
+    for _ in range(epochs):
+        logits = z @ weights.T + bias
+        logits -= logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        probs /= probs.sum(axis=1, keepdims=True)
+
+        error = (probs - targets) / len(z)
+        weights -= learning_rate * (error.T @ z + l2 * weights)
+        bias -= learning_rate * error.sum(axis=0)
+
+    return {
+        "classes": np.array(classes),
+        "mean": mean.astype(np.float32),
+        "std": std.astype(np.float32),
+        "weights": weights,
+        "bias": bias,
+    }
+
+
+def save_weights(path: str, params: Dict[str, np.ndarray]) -> None:
+    """Write fitted arrays as the .npz LOCAL_CLASSIFIER_WEIGHTS points to."""
+    with open(path, "wb") as f:
+        np.savez(f, **params)
+
+
+def evaluate(
+    classifier: LandmarkEmotionClassifier,
+    features: np.ndarray,
+    labels: List[str],
+    min_confidence: float
+) -> Dict[str, float]:
+    """
+    Accuracy on labelled features, and the share of frames the fast path
+    would answer (confidence >= min_confidence) with its accuracy on those.
+    """
+    probs = classifier.predict_proba(features)
+    predicted = np.array([classifier.classes[i] for i in probs.argmax(axis=1)])
+    correct = predicted == np.array(labels)
+    confident = probs.max(axis=1) >= min_confidence
+    return {
+        "accuracy": float(correct.mean()) if len(correct) else 0.0,
+        "fastPathShare": float(confident.mean()) if len(confident) else 0.0,
+        "fastPathAccuracy": float(correct[confident].mean()) if confident.any() else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("frames", help="Directory with one subdirectory of face images per emotion label")
+    parser.add_argument("--output", default="landmark_classifier.npz", help="Where to write the weights")
+    parser.add_argument("--holdout", type=float, default=0.2, help="Share of frames kept for evaluation")
+    parser.add_argument("--l2", type=float, default=1e-3, help="L2 regularization strength")
+    parser.add_argument("--min-confidence", type=float, default=settings.local_classifier_min_confidence)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    features, labels = load_labelled_features(args.frames)
+    if len(set(labels)) < 2:
+        raise SystemExit("Need labelled faces of at least two emotions")
+
+    order = np.random.default_rng(args.seed).permutation(len(labels))
+    held_out = int(len(order) * args.holdout)
+    test_idx, train_idx = order[:held_out], order[held_out:]
+
+    params = fit(features[train_idx], [labels[i] for i in train_idx], l2=args.l2)
+    save_weights(args.output, params)
+
+    # Evaluate through the runtime loader, exactly as the service will use the file
+    classifier = LandmarkEmotionClassifier(weights_path=args.output)
+    print(f"{len(labels)} frames, classes: {', '.join(classifier.classes)}")
+    for name, idx in (("train", train_idx), ("held out", test_idx)):
+        if len(idx):
+            scores = evaluate(classifier, features[idx], [labels[i] for i in idx], args.min_confidence)
+            print(
+                f"{name}: accuracy {scores['accuracy']:.1%}, fast path answers "
+                f"{scores['fastPathShare']:.1%} of frames at {scores['fastPathAccuracy']:.1%} accuracy"
+            )
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,12 @@
+import pytest
+from app.memory.backends import LocalMemoryBackend, RedisMemoryBackend
+
+
+@pytest.fixture(params=["local", "redis"])
+def make_backend(request):
+    """Factory for a fresh memory backend; call it inside the test's event loop."""
+    if request.param == "local":
+        return LocalMemoryBackend
+
+    fakeredis = pytest.importorskip("fakeredis")
+    return lambda: RedisMemoryBackend(client=fakeredis.aioredis.FakeRedis(), key_prefix="test:", ttl_seconds=60)
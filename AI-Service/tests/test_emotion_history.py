@@ -0,0 +1,64 @@
+import asyncio
+from app.memory import EmotionMemory
+
+
+async def _memory(make_backend) -> EmotionMemory:
+    """Two users whose entries interleave in time."""
+    backend = make_backend()
+    for second in range(10):
+        user_id = "alice" if second % 2 == 0 else "bob"
+        await backend.add_emotion(
+            "call-1", user_id, {"dominant": f"e{second}"}, timestamp=1000.0 + second, max_entries=20
+        )
+    return EmotionMemory(backend=backend)
+
+
+def _dominants(entries):
+    return [entry["dominant"] for entry in entries]
+
+
+def test_timeline_returns_the_newest_entries_oldest_first(make_backend):
+    async def scenario():
+        memory = await _memory(make_backend)
+        assert _dominants(await memory.get_call_emotions("call-1", limit=3)) == ["e7", "e8", "e9"]
+        assert _dominants(await memory.get_call_emotions("call-1", user_id="alice", limit=2)) == ["e6", "e8"]
+
+    asyncio.run(scenario())
+
+
+def test_no_limit_returns_the_whole_history(make_backend):
+    async def scenario():
+        memory = await _memory(make_backend)
+        everything = await memory.get_call_emotions("call-1", limit=None)
+        assert _dominants(everything) == [f"e{i}" for i in range(10)]
+        assert await memory.get_call_emotions("call-1", limit=0) == []
+
+    asyncio.run(scenario())
+
+
+def test_paging_with_before_walks_back_without_gaps_or_repeats(make_backend):
+    async def scenario():
+        memory = await _memory(make_backend)
+        pages = []
+        before = None
+        while True:
+            page = await memory.get_call_emotions("call-1", limit=4, before=before)
+            if not page:
+                break
+            pages.append(_dominants(page))
+            if len(page) < 4:
+                break
+            # The route returns this as nextBefore
+            before = page[0]["ts"]
+        return pages
+
+    assert asyncio.run(scenario()) == [["e6", "e7", "e8", "e9"], ["e2", "e3", "e4", "e5"], ["e0", "e1"]]
+
+
+def test_since_and_before_are_exclusive(make_backend):
+    async def scenario():
+        memory = await _memory(make_backend)
+        entries = await memory.get_call_emotions("call-1", limit=None, since=1002.0, before=1006.0)
+        assert _dominants(entries) == ["e3", "e4", "e5"]
+
+    asyncio.run(scenario())
@@ -0,0 +1,90 @@
+import json
+import struct
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api.v1 import emotion_routes
+
+
+class FakeTranslator:
+    """Answers every frame at once; frames with context "fail" raise."""
+
+    def __init__(self):
+        self.calls = []
+
+    async def translate(self, image_base64, user_id, call_id=None, context=None,
+                        pipeline_mode=None, frame=None, deadline_ms=None):
+        self.calls.append((user_id, pipeline_mode, deadline_ms))
+        if context == "fail":
+            raise RuntimeError("upstream down")
+        return {
+            "success": True,
+            "emotions": ["happy"],
+            "dominantEmotion": "happy",
+            "confidence": 0.9,
+            "intensity": 0.5,
+            "generatedText": "They look happy."
+        }
+
+
+def _frame(header) -> bytes:
+    encoded = json.dumps(header).encode("utf-8")
+    return struct.pack(">I", len(encoded)) + encoded + b"jpeg"
+
+
+@pytest.fixture
+def stream(monkeypatch):
+    translator = FakeTranslator()
+    monkeypatch.setattr(emotion_routes, "get_emotion_translator", lambda: translator)
+    app = FastAPI()
+    app.include_router(emotion_routes.router)
+    with TestClient(app).websocket_connect("/stream") as websocket:
+        yield websocket, translator
+
+
+@pytest.mark.parametrize("header", [
+    [],
+    "x",
+    {"callId": "call-1"},
+    {"userId": ""},
+    {"userId": "alice", "deadlineMs": -5},
+    {"userId": "alice", "deadlineMs": "soon"},
+    {"userId": "alice", "pipelineMode": "three_call"},
+])
+def test_malformed_header_is_reported_and_the_socket_stays_open(stream, header):
+    websocket, translator = stream
+
+    websocket.send_bytes(_frame(header))
+    error = websocket.receive_json()
+    assert error["type"] == "error"
+    assert error["error"].startswith("Invalid frame")
+
+    websocket.send_bytes(_frame({"userId": "alice", "frameId": 2, "deadlineMs": 500}))
+    result = websocket.receive_json()
+    assert result["type"] == "result"
+    assert result["frameId"] == 2
+    assert translator.calls == [("alice", None, 500)]
+
+
+def test_truncated_frames_are_reported(stream):
+    websocket, _ = stream
+
+    websocket.send_bytes(b"\x00\x00")
+    assert websocket.receive_json()["type"] == "error"
+
+    websocket.send_bytes(struct.pack(">I", 100) + b"{}")
+    assert websocket.receive_json()["type"] == "error"
+
+
+def test_failed_frame_is_reported_and_the_session_keeps_draining(stream):
+    websocket, _ = stream
+
+    websocket.send_bytes(_frame({"userId": "alice", "frameId": 1, "context": "fail"}))
+    error = websocket.receive_json()
+    assert error["type"] == "error"
+    assert error["frameId"] == 1
+
+    websocket.send_bytes(_frame({"userId": "alice", "frameId": 2}))
+    result = websocket.receive_json()
+    assert result["type"] == "result"
+    assert result["frameId"] == 2
@@ -0,0 +1,104 @@
+import asyncio
+from app.agents import emotion_translator
+from app.chains.text_generation_chain import EmotionTextGenerationChain
+from app.config import settings
+from app.services.text_response_cache import TextResponseCache
+
+
+class FakePreprocessor:
+    max_pending = 4
+    pending = 0
+
+    async def preprocess(self, image_bytes, session_id=None):
+        return True, {"metrics": {}}
+
+    async def prepare_llm_image(self, image_bytes, face_box=None):
+        return image_bytes
+
+    def release_session(self, session_id):
+        pass
+
+
+class FakeEmotionChain:
+    """Every frame is happy; the combined call writes a new message each time."""
+
+    def __init__(self):
+        self.analyzed = 0
+        self.combined = 0
+
+    def _result(self):
+        return {
+            "success": True,
+            "emotions": ["happy"],
+            "dominantEmotion": "happy",
+            "confidence": 0.9,
+            "intensity": 0.6,
+            "nuances": {
+                "eyeContact": "direct",
+                "mouthExpression": "smiling",
+                "eyebrowPosition": "neutral",
+                "overallTension": "relaxed"
+            }
+        }
+
+    async def analyze(self, image_base64, context=None, session_id=None, previous_emotions=None):
+        self.analyzed += 1
+        return self._result()
+
+    async def analyze_and_describe(self, image_base64, context=None, session_id=None,
+                                   previous_emotions=None, recent_texts=None):
+        self.combined += 1
+        return {**self._result(), "generatedText": f"text {self.combined}"}
+
+    async def clear_session(self, session_id):
+        pass
+
+
+class FakeTextLLM:
+    def __init__(self):
+        self.calls = 0
+
+    async def ainvoke(self, input_data):
+        self.calls += 1
+        return "generated"
+
+
+def test_recurring_expression_is_served_from_the_text_cache_in_combined_mode(monkeypatch):
+    monkeypatch.setattr(settings, "local_classifier_enabled", False)
+    monkeypatch.setattr(settings, "text_cache_enabled", True)
+
+    emotion_chain = FakeEmotionChain()
+    text_chain = EmotionTextGenerationChain()
+    text_chain.response_cache = TextResponseCache(max_variants=2)
+    text_chain.chain = FakeTextLLM()
+    monkeypatch.setattr(emotion_translator, "get_frame_preprocessor", FakePreprocessor)
+    monkeypatch.setattr(emotion_translator, "get_emotion_chain", lambda: emotion_chain)
+    monkeypatch.setattr(emotion_translator, "get_text_generation_chain", lambda: text_chain)
+
+    async def run():
+        translator = emotion_translator.EmotionTranslatorAgent()
+
+        async def frame(user_id):
+            return await translator.translate(
+                "aGVsbG8=", user_id, call_id="text-cache-call", pipeline_mode="combined"
+            )
+
+        # Cold cache: both users' first frames go through the combined call
+        first = await frame("alice")
+        second = await frame("bob")
+        assert (first["generatedText"], second["generatedText"]) == ("text 1", "text 2")
+        assert emotion_chain.combined == 2
+
+        # Same expression again: only the analysis call, message from the cache
+        repeated = await frame("bob")
+        assert repeated["success"]
+        assert emotion_chain.combined == 2
+        assert emotion_chain.analyzed == 1
+        assert repeated["generatedText"] == "text 1"
+        assert text_chain.chain.calls == 0
+        assert text_chain.response_cache.hits == 1
+
+        await translator.clear_session("text-cache-call", "alice")
+        await translator.clear_session("text-cache-call", "bob")
+
+    asyncio.run(run())
@@ -0,0 +1,51 @@
+import asyncio
+import os
+import signal
+import pytest
+from app.services import frame_preprocessor
+from app.services.frame_preprocessor import FramePreprocessor
+
+
+def _init_test_worker() -> None:
+    """Stands in for the MediaPipe initializer."""
+
+
+def _report_worker(image_bytes, session_id):
+    return True, {"pid": os.getpid()}
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGKILL"), reason="needs SIGKILL")
+def test_killed_worker_is_restarted(monkeypatch):
+    monkeypatch.setattr(frame_preprocessor, "_init_worker", _init_test_worker)
+    monkeypatch.setattr(frame_preprocessor, "preprocess_image_bytes", _report_worker)
+    preprocessor = FramePreprocessor(max_workers=1, max_pending=4)
+
+    async def scenario():
+        detected, info = await preprocessor.preprocess(b"frame", "call-1:alice")
+        assert detected
+        first_pid = info["pid"]
+
+        os.kill(first_pid, signal.SIGKILL)
+        await asyncio.sleep(0.5)
+        # Must not raise on the dead worker
+        preprocessor.release_session("call-1:alice")
+
+        detected, info = await preprocessor.preprocess(b"frame", "call-1:alice")
+        assert detected
+        second_pid = info["pid"]
+        assert second_pid != first_pid
+        assert preprocessor.restarted_workers == 1
+
+        # A frame sent to a dead worker is retried on its replacement
+        os.kill(second_pid, signal.SIGKILL)
+        await asyncio.sleep(0.5)
+        detected, info = await preprocessor.preprocess(b"frame", "call-1:alice")
+        assert detected
+        assert info["pid"] not in (first_pid, second_pid)
+        assert preprocessor.restarted_workers == 2
+        assert preprocessor.pending == 0
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        preprocessor.shutdown()
@@ -0,0 +1,38 @@
+import numpy as np
+from app.services.landmark_classifier import FEATURE_NAMES, LandmarkEmotionClassifier
+from scripts.train_landmark_classifier import evaluate, fit, save_weights
+
+
+def _labelled_features(rng, per_class: int = 60):
+    """Three well separated clusters in landmark feature space."""
+    centers = {
+        "happy": np.array([0.05, 0.65, 0.06, 0.10, 0.22, 0.28, 0.01]),
+        "neutral": np.array([0.02, 0.55, 0.00, 0.10, 0.22, 0.28, 0.01]),
+        "surprised": np.array([0.20, 0.50, 0.00, 0.16, 0.30, 0.28, 0.03]),
+    }
+    features, labels = [], []
+    for label, center in centers.items():
+        features.append(center + rng.normal(0, 0.01, (per_class, len(FEATURE_NAMES))))
+        labels += [label] * per_class
+    return np.concatenate(features).astype(np.float32), labels
+
+
+def test_exported_weights_round_trip_through_the_loader(tmp_path):
+    rng = np.random.default_rng(0)
+    features, labels = _labelled_features(rng)
+    params = fit(features, labels)
+
+    path = tmp_path / "weights.npz"
+    save_weights(str(path), params)
+    classifier = LandmarkEmotionClassifier(weights_path=str(path))
+
+    assert classifier.classes == ["happy", "neutral", "surprised"]
+    for key in ("mean", "std", "weights", "bias"):
+        np.testing.assert_allclose(getattr(classifier, key), params[key])
+    assert classifier.weights.shape == (3, len(FEATURE_NAMES))
+
+    held_out, held_out_labels = _labelled_features(rng, per_class=20)
+    scores = evaluate(classifier, held_out, held_out_labels, min_confidence=0.75)
+    assert scores["accuracy"] > 0.95
+    assert scores["fastPathShare"] > 0.5
+    assert scores["fastPathAccuracy"] > 0.95
@@ -0,0 +1,80 @@
+import asyncio
+from app.services.llm_scheduler import LLMScheduler, LLMPriority
+
+
+def _scheduler(max_concurrency: int = 1) -> LLMScheduler:
+    # rate_per_minute=0 disables the token bucket, so only the concurrency cap applies
+    return LLMScheduler(max_concurrency=max_concurrency, rate_per_minute=0)
+
+
+def test_waiters_are_admitted_by_priority_then_arrival():
+    async def scenario():
+        scheduler = _scheduler()
+        await scheduler.acquire(LLMPriority.LIVE)
+        admitted = []
+
+        async def call(name, priority):
+            await scheduler.acquire(priority)
+            admitted.append(name)
+
+        tasks = []
+        for name, priority in (
+            ("background", LLMPriority.BACKGROUND),
+            ("live-1", LLMPriority.LIVE),
+            ("pattern", LLMPriority.PATTERN),
+            ("live-2", LLMPriority.LIVE),
+        ):
+            tasks.append(asyncio.ensure_future(call(name, priority)))
+            await asyncio.sleep(0)
+        assert admitted == []
+
+        for expected in range(1, len(tasks) + 1):
+            scheduler.release()
+            while len(admitted) < expected:
+                await asyncio.sleep(0)
+            assert scheduler.active == 1
+        await asyncio.gather(*tasks)
+        return admitted
+
+    assert asyncio.run(scenario()) == ["live-1", "live-2", "pattern", "background"]
+
+
+def test_cancel_after_admission_hands_the_slot_on():
+    async def scenario():
+        scheduler = _scheduler()
+        await scheduler.acquire(LLMPriority.LIVE)
+        first = asyncio.ensure_future(scheduler.acquire(LLMPriority.LIVE))
+        second = asyncio.ensure_future(scheduler.acquire(LLMPriority.LIVE))
+        await asyncio.sleep(0)
+
+        # Admit the first waiter, then cancel it before it gets to run
+        scheduler.release()
+        first.cancel()
+
+        await asyncio.wait_for(second, timeout=1)
+        assert first.cancelled()
+        assert scheduler.active == 1
+        scheduler.release()
+        assert scheduler.active == 0
+        assert scheduler.metrics()["classes"]["live"]["queued"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancel_while_waiting_does_not_take_a_slot():
+    async def scenario():
+        scheduler = _scheduler()
+        await scheduler.acquire(LLMPriority.LIVE)
+        abandoned = asyncio.ensure_future(scheduler.acquire(LLMPriority.LIVE))
+        waiting = asyncio.ensure_future(scheduler.acquire(LLMPriority.BACKGROUND))
+        await asyncio.sleep(0)
+
+        abandoned.cancel()
+        await asyncio.sleep(0)
+        assert scheduler.active == 1
+
+        scheduler.release()
+        await asyncio.wait_for(waiting, timeout=1)
+        assert scheduler.active == 1
+
+    asyncio.run(scenario())
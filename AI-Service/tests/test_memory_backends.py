@@ -0,0 +1,57 @@
+import asyncio
+import pytest
+from app.memory.backends import RedisMemoryBackend
+
+
+def test_history_is_capped_and_summarized(make_backend):
+    async def scenario():
+        backend = make_backend()
+        for i, dominant in enumerate(["happy", "happy", "sad", "sad", "calm"]):
+            await backend.add_emotion("call-1", "alice", {"dominant": dominant}, timestamp=1000.0 + i, max_entries=4)
+
+        emotions = await backend.get_emotions("call-1", "alice", 10)
+        assert [e["dominant"] for e in emotions] == ["happy", "sad", "sad", "calm"]
+        assert emotions[-1]["user_id"] == "alice"
+        assert await backend.get_dominants("call-1", "alice", 2) == ["sad", "calm"]
+        assert dict(await backend.get_dominant_counts("call-1", "alice")) == {"sad": 2, "happy": 1, "calm": 1}
+        assert [(t["from"], t["to"]) for t in await backend.get_transitions("call-1", "alice")] == [
+            ("happy", "sad"), ("sad", "calm")
+        ]
+        assert await backend.get_call_users("call-1") == ["alice"]
+
+        await backend.clear_call("call-1")
+        assert await backend.get_emotions("call-1", "alice", 10) == []
+        assert await backend.get_call_users("call-1") == []
+
+    asyncio.run(scenario())
+
+
+def test_session_values_are_capped_and_cleared(make_backend):
+    async def scenario():
+        backend = make_backend()
+        for i in range(7):
+            await backend.push_session_value("texts", "call-1:alice", f"text {i}", 5)
+        assert await backend.get_session_values("texts", "call-1:alice") == [f"text {i}" for i in range(2, 7)]
+        assert await backend.get_session_values("emotions", "call-1:alice") == []
+
+        await backend.clear_session_values("texts", "call-1:alice")
+        assert await backend.get_session_values("texts", "call-1:alice") == []
+
+    asyncio.run(scenario())
+
+
+def test_redis_keys_expire():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def scenario():
+        client = fakeredis.aioredis.FakeRedis()
+        backend = RedisMemoryBackend(client=client, key_prefix="test:", ttl_seconds=60)
+        await backend.add_emotion("call-1", "alice", {"dominant": "happy"}, timestamp=1000.0, max_entries=4)
+        await backend.push_session_value("texts", "call-1:alice", "hello", 5)
+
+        keys = await client.keys("test:*")
+        assert len(keys) == 3
+        for key in keys:
+            assert 0 < await client.ttl(key) <= 60
+
+    asyncio.run(scenario())
@@ -0,0 +1,41 @@
+import cv2
+import numpy as np
+from app.services.pattern_features import extract_pattern_features
+
+
+def _pattern(channels: int = 3) -> np.ndarray:
+    """A red circle and a blue stroke on white."""
+    image = np.full((200, 200, 3), 255, np.uint8)
+    cv2.circle(image, (100, 100), 50, (0, 0, 220), -1)
+    cv2.line(image, (20, 180), (180, 20), (200, 60, 0), 6)
+    if channels == 4:
+        alpha = np.full((200, 200, 1), 255, np.uint8)
+        alpha[:, :40] = 0  # Transparent strip composites to white
+        image = np.concatenate([image, alpha], axis=2)
+    return image
+
+
+def _png(image: np.ndarray) -> bytes:
+    ok, encoded = cv2.imencode(".png", image)
+    assert ok
+    return encoded.tobytes()
+
+
+def test_16_bit_png_matches_its_8_bit_version():
+    image = _pattern()
+    expected = extract_pattern_features(_png(image))
+    features = extract_pattern_features(_png(image.astype(np.uint16) * 257))
+    assert features is not None
+    assert features == expected
+
+
+def test_16_bit_alpha_is_scaled_by_its_depth():
+    image = _pattern(channels=4)
+    expected = extract_pattern_features(_png(image))
+    features = extract_pattern_features(_png(image.astype(np.uint16) * 257))
+    assert features is not None
+    assert features == expected
+
+
+def test_undecodable_bytes_give_no_features():
+    assert extract_pattern_features(b"not an image") is None
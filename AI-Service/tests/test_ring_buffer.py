@@ -0,0 +1,75 @@
+import random
+from collections import Counter
+from app.memory.ring_buffer import EmotionRingBuffer, LabelTable
+
+
+def _append(buffer: EmotionRingBuffer, dominants, start: float = 0.0) -> None:
+    for offset, dominant in enumerate(dominants):
+        buffer.append({"dominant": dominant, "emotions": [dominant]}, start + offset)
+
+
+def _transitions(buffer: EmotionRingBuffer):
+    return [(t["from"], t["to"]) for t in buffer.transitions()]
+
+
+def test_eviction_decrements_counts():
+    buffer = EmotionRingBuffer(3)
+    _append(buffer, ["happy", "happy", "sad"])
+    assert dict(buffer.ranked_counts()) == {"happy": 2, "sad": 1}
+
+    _append(buffer, ["calm"], start=3)
+    assert dict(buffer.ranked_counts()) == {"happy": 1, "sad": 1, "calm": 1}
+
+    _append(buffer, ["calm", "calm"], start=4)
+    assert buffer.ranked_counts() == [("calm", 3)]
+
+
+def test_eviction_drops_transitions_from_evicted_entries():
+    buffer = EmotionRingBuffer(3)
+    _append(buffer, ["happy", "sad", "calm"])
+    assert _transitions(buffer) == [("happy", "sad"), ("sad", "calm")]
+
+    # "happy" is evicted, so the change into "sad" no longer has a stored origin
+    _append(buffer, ["angry"], start=3)
+    assert _transitions(buffer) == [("sad", "calm"), ("calm", "angry")]
+
+    _append(buffer, ["angry"], start=4)
+    assert _transitions(buffer) == [("calm", "angry")]
+
+    _append(buffer, ["angry"], start=5)
+    assert _transitions(buffer) == []
+
+
+def test_running_aggregates_match_a_rescan():
+    rng = random.Random(7)
+    buffer = EmotionRingBuffer(5)
+    history = []
+    for i in range(200):
+        dominant = rng.choice(["happy", "sad", "calm"])
+        _append(buffer, [dominant], start=float(i))
+        history.append(dominant)
+
+        window = history[-5:]
+        assert dict(buffer.ranked_counts()) == dict(Counter(window))
+        assert _transitions(buffer) == [
+            (previous, current) for previous, current in zip(window, window[1:]) if previous != current
+        ]
+        assert [buffer.dominant(j) for j in range(len(buffer))] == window
+
+
+def test_full_label_table_maps_new_labels_to_unknown():
+    table = LabelTable(max_labels=3)
+    assert table.code("happy") == 1
+    assert table.code("sad") == 2
+    assert table.code("wistful") == table.code("elated") == LabelTable.UNKNOWN
+    assert table.label(LabelTable.UNKNOWN) == "unknown"
+    assert table.code("sad") == 2
+    assert len(table) == 3
+
+
+def test_labels_are_normalized_before_interning():
+    table = LabelTable()
+    assert table.code(" Happy ") == table.code("happy")
+    assert table.code("Quietly  Hopeful") == table.code("quietly hopeful")
+    assert table.code("") == table.code(None) == LabelTable.UNKNOWN
+    assert len(table.label(table.code("x" * 100))) == LabelTable.MAX_LABEL_LENGTH